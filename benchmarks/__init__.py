@@ -0,0 +1,16 @@
+"""Benchmarks for the store API.
+
+Run a benchmark as a module from the repository root, e.g.
+``python -m benchmarks.post_pagination``. Importing this package points the
+app at a throwaway SQLite database unless the environment says otherwise, so
+benchmarks never touch ``test.db`` or a real deployment.
+"""
+import os
+import tempfile
+
+BENCH_DIR = tempfile.mkdtemp(prefix="storeapi-bench-")
+
+os.environ.setdefault("ENV_STATE", "test")
+os.environ.setdefault("TEST_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("TEST_ALGORITHM", "HS256")
+os.environ.setdefault("TEST_DATABASE_URL", f"sqlite:///{BENCH_DIR}/bench.db")
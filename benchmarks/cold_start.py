@@ -0,0 +1,102 @@
+"""Cold start: import time of the app and time from launch to first response.
+
+Imports ``storeapi.main`` in fresh interpreters under ``-X importtime`` and
+reports the total along with the packages that cost the most, then launches
+uvicorn serving the app and times how long it takes until ``GET /post``
+answers. Both run in new processes every time, since a warm interpreter would
+have everything imported already.
+
+    python -m benchmarks.cold_start --runs 5 --top 10
+"""
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks import BENCH_DIR  # noqa: F401  (configures the environment)
+
+MODULE = "storeapi.main"
+APP = "storeapi.main:app"
+POLL_SECONDS = 0.01
+STARTUP_TIMEOUT_SECONDS = 60
+
+
+def import_times(module: str) -> dict[str, float]:
+    """Cumulative import time in ms of every package imported by importing module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    times = {}
+    # import time: self [us] | cumulative | imported package
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_response() -> float:
+    """Seconds from launching uvicorn until GET /post answers 200."""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", APP, "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while time.perf_counter() - start < STARTUP_TIMEOUT_SECONDS:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with {server.returncode}")
+                try:
+                    if client.get("/post").status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                time.sleep(POLL_SECONDS)
+        raise TimeoutError(f"No response within {STARTUP_TIMEOUT_SECONDS}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(runs: int, top: int) -> None:
+    packages = defaultdict(list)
+    for _ in range(runs):
+        for name, ms in import_times(MODULE).items():
+            packages[name].append(ms)
+    medians = {name: statistics.median(times) for name, times in packages.items()}
+    print(f"import {MODULE}: {medians[MODULE]:.1f}ms (median of {runs})")
+    # Top-level packages only, their submodules are part of their cumulative time
+    largest = sorted((name for name in medians if "." not in name), key=medians.get, reverse=True)
+    for name in largest[:top]:
+        print(f"  {name:<30} {medians[name]:>8.1f}ms")
+
+    # The first launch creates the benchmark database's schema
+    first_response()
+    timings = [first_response() * 1000 for _ in range(runs)]
+    print(
+        f"launch to first GET /post: {statistics.median(timings):.1f}ms "
+        f"(min {min(timings):.1f}ms, max {max(timings):.1f}ms)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    main(args.runs, args.top)
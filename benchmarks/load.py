@@ -0,0 +1,256 @@
+"""Load test: throughput and latency percentiles of a realistic request mix.
+
+Seeds the benchmark database with benchmarks.seed, then serves the app in
+this process with B2, Mailgun and DeepAI stubbed out, each answering after a
+fixed latency. C virtual users, each logged in as a seeded user, send a
+weighted mix of GET /post, GET /post/{id}, POST /comment, POST /like, POST
+/token and POST /upload for D seconds. Posts are picked with the same skew the
+likes were seeded with, so hot posts stay hot. The report is JSON, with
+throughput and p50/p95/p99 latencies overall and for each request, so runs
+can be saved and compared. Requests during the warmup are not counted.
+
+The app runs on the same event loop as the virtual users, so the numbers are
+those of a single worker including the client's overhead. The app settings
+come from the TEST_* environment as usual, e.g. TEST_DATABASE_URL to load
+Postgres, or TEST_SQLITE_PERFORMANCE_PROFILE=true.
+
+    python -m benchmarks.load --users 1000 --posts 10000 --concurrency 50 --duration 30 --output run.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager, redirect_stdout
+from typing import Iterator
+
+import httpx
+
+from benchmarks import BENCH_DIR  # noqa: F401  (configures the environment)
+
+# The test config would run every request inside one rolled back transaction
+os.environ.setdefault("TEST_DB_FORCE_ROLL_BACK", "false")
+
+from benchmarks.seed import PASSWORD, email, seed, zipf_weights  # noqa: E402
+from storeapi import http_client  # noqa: E402
+from storeapi.config import config  # noqa: E402
+from storeapi.libs.b2 import aio as b2  # noqa: E402
+from storeapi.main import app  # noqa: E402
+
+MIX = {
+    "GET /post": 35,
+    "GET /post/{id}": 25,
+    "POST /like": 15,
+    "POST /comment": 10,
+    "POST /token": 5,
+    "POST /upload": 10,
+}
+UPLOAD_SIZE = 64 * 1024
+
+
+@contextmanager
+def stub_b2(latency: float) -> Iterator[None]:
+    """Replace the blocking b2sdk calls, which run on the B2 thread pool, with sleeps."""
+
+    def upload_bytes(data: bytes, file_name: str, content_type: str) -> str:
+        time.sleep(latency)
+        return f"https://b2.example.net/file/bench/{file_name}"
+
+    def start_large_file(file_name: str, content_type: str) -> str:
+        time.sleep(latency)
+        return f"file-{file_name}"
+
+    def upload_part(file_id: str, part_number: int, data: bytes) -> str:
+        time.sleep(latency)
+        return "0" * 40
+
+    def finish_large_file(file_id: str, part_sha1s: list[str]) -> str:
+        time.sleep(latency)
+        return f"https://b2.example.net/file/bench/{file_id}"
+
+    stubs = {
+        "b2_upload_bytes": upload_bytes,
+        "b2_start_large_file": start_large_file,
+        "b2_upload_part": upload_part,
+        "b2_finish_large_file": finish_large_file,
+        "b2_cancel_large_file": lambda file_id: None,
+    }
+    originals = {name: getattr(b2, name) for name in stubs}
+    for name, stub in stubs.items():
+        setattr(b2, name, stub)
+    try:
+        yield
+    finally:
+        for name, original in originals.items():
+            setattr(b2, name, original)
+
+
+def stub_http_client(latency: float) -> httpx.AsyncClient:
+    """A client standing in for Mailgun and DeepAI, installed as the app's shared client."""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        return httpx.Response(200, json={"id": "<bench@example.net>", "output_url": "https://example.net/image.png"})
+
+    http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return http_client._client
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted latencies."""
+    return latencies[max(0, math.ceil(q / 100 * len(latencies)) - 1)]
+
+
+def summarize(latencies: list[float], errors: int, seconds: float) -> dict:
+    latencies = sorted(latencies)
+    summary = {"requests": len(latencies), "errors": errors, "throughput_rps": round(len(latencies) / seconds, 1)}
+    if latencies:
+        summary.update({
+            f"{name}_ms": round(value * 1000, 2)
+            for name, value in [
+                ("p50", percentile(latencies, 50)),
+                ("p95", percentile(latencies, 95)),
+                ("p99", percentile(latencies, 99)),
+                ("max", latencies[-1]),
+            ]
+        })
+    return summary
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, user_id: int, users: int, post_weights: list[float]) -> None:
+        self.client = client
+        self.rng = rng
+        self.user_id = user_id
+        self.users = users
+        self.post_weights = post_weights
+        self.headers: dict[str, str] = {}
+
+    def post_id(self) -> int:
+        return self.rng.choices(range(1, len(self.post_weights) + 1), weights=self.post_weights)[0]
+
+    async def login(self, user_id: int) -> httpx.Response:
+        response = await self.client.post("/token", data={"username": email(user_id), "password": PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def request(self, operation: str) -> httpx.Response:
+        if operation == "GET /post":
+            sorting = self.rng.choice(["new", "new", "most_likes", "old"])
+            return await self.client.get("/post", params={"sorting": sorting})
+        if operation == "GET /post/{id}":
+            return await self.client.get(f"/post/{self.post_id()}")
+        if operation == "POST /like":
+            return await self.client.post("/like", json={"post_id": self.post_id()}, headers=self.headers)
+        if operation == "POST /comment":
+            body = {"body": "Load test comment", "post_id": self.post_id()}
+            return await self.client.post("/comment", json=body, headers=self.headers)
+        if operation == "POST /token":
+            return await self.login(self.rng.randint(1, self.users))
+        if operation == "POST /upload":
+            files = {"file": ("bench.bin", self.rng.randbytes(UPLOAD_SIZE), "application/octet-stream")}
+            return await self.client.post("/upload", files=files)
+        raise ValueError(f"Unknown operation {operation}")
+
+    async def run(self, until: float, record_from: float, latencies: dict[str, list[float]], errors: dict[str, int]) -> None:
+        operations, weights = list(MIX), list(MIX.values())
+        while time.perf_counter() < until:
+            operation = self.rng.choices(operations, weights=weights)[0]
+            start = time.perf_counter()
+            try:
+                failed = (await self.request(operation)).status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if start < record_from:
+                continue
+            latencies[operation].append(time.perf_counter() - start)
+            errors[operation] += failed
+
+
+async def load(users: int, posts: int, concurrency: int, duration: float, warmup: float, rng_seed: int, post_weights: list[float], log_level: str) -> dict:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    async with app.router.lifespan_context(app):
+        # Set after startup, which configures logging. Logging every request to
+        # the console would otherwise be most of what is measured.
+        logging.getLogger("storeapi").setLevel(log_level)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            rng = random.Random(rng_seed)
+            virtual_users = [
+                VirtualUser(client, random.Random(rng.random()), rng.randint(1, users), users, post_weights)
+                for _ in range(concurrency)
+            ]
+            for user in virtual_users:
+                response = await user.login(user.user_id)
+                response.raise_for_status()
+            start = time.perf_counter()
+            record_from = start + warmup
+            until = record_from + duration
+            await asyncio.gather(*(user.run(until, record_from, latencies, errors) for user in virtual_users))
+            seconds = time.perf_counter() - record_from
+    every = [latency for operation in latencies.values() for latency in operation]
+    return {
+        "seconds": round(seconds, 2),
+        "overall": summarize(every, sum(errors.values()), seconds),
+        "operations": {operation: summarize(latencies[operation], errors[operation], seconds) for operation in MIX},
+    }
+
+
+def main(args: argparse.Namespace) -> dict:
+    start = time.perf_counter()
+    dataset = seed(config.DATABASE_URL, args.users, args.posts, args.likes, args.comments, args.skew, args.seed)
+    seed_seconds = time.perf_counter() - start
+    # The same weights the likes and comments were seeded with
+    rng = random.Random(args.seed)
+    zipf_weights(args.users, args.skew, rng)
+    post_weights = zipf_weights(args.posts, args.skew, rng)
+
+    with stub_b2(args.b2_latency):
+        stub_http_client(args.http_latency)
+        results = asyncio.run(load(
+            args.users, args.posts, args.concurrency, args.duration, args.warmup, args.seed, post_weights, args.log_level
+        ))
+    return {
+        "database": config.DATABASE_URL.split(":", 1)[0],
+        "sqlite_performance_profile": config.SQLITE_PERFORMANCE_PROFILE,
+        "dataset": vars(dataset),
+        "seed_seconds": round(seed_seconds, 2),
+        "concurrency": args.concurrency,
+        "warmup_seconds": args.warmup,
+        "mix": MIX,
+        "stub_latency_ms": {"b2": args.b2_latency * 1000, "http": args.http_latency * 1000},
+        **results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--likes", type=int, default=50_000)
+    parser.add_argument("--comments", type=int, default=20_000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--b2-latency", type=float, default=0.05, help="seconds each stubbed B2 call takes")
+    parser.add_argument("--http-latency", type=float, default=0.05, help="seconds each stubbed Mailgun or DeepAI call takes")
+    parser.add_argument("--log-level", default="WARNING", help="level of the app's logs while under load")
+    parser.add_argument("--output", help="write the report here instead of to stdout")
+    args = parser.parse_args()
+    # Whatever the app prints goes to stderr, keeping stdout for the report
+    with redirect_stdout(sys.stderr):
+        report = json.dumps(main(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        sys.stdout.write(report + "\n")
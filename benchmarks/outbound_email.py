@@ -0,0 +1,87 @@
+"""Email throughput with a client per call vs the shared, pooled client.
+
+Starts a minimal keep-alive HTTP stub standing in for Mailgun, points
+MAILGUN_API_URL at it and fires N emails with C in flight through
+storeapi.tasks.send_email, first opening a new httpx.AsyncClient per email
+(the old behaviour) and then through the shared client. Against a real
+Mailgun endpoint the gap is wider, since every new connection also pays for
+a TLS handshake.
+
+    python -m benchmarks.outbound_email --emails 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks import BENCH_DIR  # noqa: F401  (configures the environment)
+
+STUB_HOST = "127.0.0.1"
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}"
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer every request on the connection with 200 until the client hangs up."""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            writer.write(RESPONSE)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run(send, emails: int, concurrency: int) -> float:
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        async with in_flight:
+            await send(f"user{i}@example.net")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(emails)))
+    return emails / (time.perf_counter() - start)
+
+
+async def main(emails: int, concurrency: int) -> None:
+    server = await asyncio.start_server(handle, STUB_HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+    os.environ["TEST_MAILGUN_API_URL"] = f"http://{STUB_HOST}:{port}/v3"
+    os.environ.setdefault("TEST_MAILGUN_DOMAIN", "example.net")
+    os.environ.setdefault("TEST_MAILGUN_API_KEY", "benchmark-key")
+
+    from storeapi.http_client import close_http_client, get_http_client
+    from storeapi.tasks import send_email
+
+    async def client_per_call(to: str) -> None:
+        async with httpx.AsyncClient() as client:
+            await send_email(to, "Benchmark", "Hello", client=client)
+
+    async def shared_client(to: str) -> None:
+        await send_email(to, "Benchmark", "Hello")
+
+    async with server:
+        get_http_client()
+        try:
+            for name, send in (("client per call", client_per_call), ("shared client", shared_client)):
+                print(f"{name:>16}: {await run(send, emails, concurrency):>8.1f} emails/s")
+        finally:
+            await close_http_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.emails, args.concurrency))
@@ -0,0 +1,85 @@
+"""Event-loop lag under concurrent logins, with bcrypt inline vs on the hashing pool.
+
+A ticker coroutine sleeps for 1 ms in a loop and records how late it wakes up
+while N simulated logins verify a bcrypt hash. Verifying inline (the old
+behaviour) blocks the loop for every hash; the pool keeps the ticker on time.
+
+    python -m benchmarks.password_hashing --logins 50 --workers 4
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks import BENCH_DIR  # noqa: F401  (configures the environment)
+from storeapi.hashing import HashingPool
+from storeapi.security import get_password_hash, verify_password
+
+TICK = 0.001
+
+
+async def ticker(stop: asyncio.Event, lags: list[float]) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def login_inline(password: str, hashed_password: str) -> bool:
+    return verify_password(password, hashed_password)
+
+
+def make_pool_login(pool: HashingPool):
+    async def login_on_pool(password: str, hashed_password: str) -> bool:
+        return await pool.run(verify_password, password, hashed_password)
+    return login_on_pool
+
+
+async def run(login, logins: int, hashed_password: str) -> dict:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(stop, lags))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login("password", hashed_password) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+    assert all(results)
+    lags.sort()
+    return {
+        "logins_per_s": logins / elapsed,
+        "lag_p50_ms": statistics.median(lags),
+        "lag_p99_ms": lags[int(len(lags) * 0.99) - 1],
+        "lag_max_ms": lags[-1],
+    }
+
+
+async def main(logins: int, workers: int) -> None:
+    hashed_password = get_password_hash("password")
+    thread_pool = HashingPool(workers=workers, max_pending=logins)
+    process_pool = HashingPool(workers=workers, max_pending=logins, use_processes=True)
+    modes = {
+        "inline": login_inline,
+        f"threads x{workers}": make_pool_login(thread_pool),
+        f"processes x{workers}": make_pool_login(process_pool),
+    }
+    print(f"{'mode':>14} {'logins/s':>10} {'lag p50':>10} {'lag p99':>10} {'lag max':>10}")
+    try:
+        for name, login in modes.items():
+            r = await run(login, logins, hashed_password)
+            print(
+                f"{name:>14} {r['logins_per_s']:>10.1f} {r['lag_p50_ms']:>8.2f}ms "
+                f"{r['lag_p99_ms']:>8.2f}ms {r['lag_max_ms']:>8.2f}ms"
+            )
+    finally:
+        thread_pool.shutdown()
+        process_pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.workers))
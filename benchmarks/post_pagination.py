@@ -0,0 +1,100 @@
+"""Page latency of GET /post as the posts table grows.
+
+Seeds SQLite databases of increasing size and times the query behind one page
+of ``GET /post`` for every sorting mode, both for the first page and for a page
+deep into the listing, next to the old unpaginated query. Keyset pages should
+stay roughly flat while the full listing grows with the table.
+
+    python -m benchmarks.post_pagination --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+import databases
+import sqlalchemy
+
+from benchmarks import BENCH_DIR
+from storeapi.database import like_table, metadata, post_table, user_table
+from storeapi.routes.post import PostSorting, next_posts_cursor, select_post_and_likes, select_posts_page
+
+PAGE_SIZE = 20
+
+
+def seed(url: str, posts: int, users: int = 100, likes_per_post: int = 3) -> None:
+    engine = sqlalchemy.create_engine(url)
+    metadata.create_all(engine)
+    rng = random.Random(posts)
+    likers = {post_id: rng.sample(range(1, users + 1), rng.randint(0, likes_per_post)) for post_id in range(1, posts + 1)}
+    with engine.begin() as conn:
+        conn.execute(
+            user_table.insert(),
+            [{"id": i, "email": f"user{i}@example.net", "password": "x", "confirmed": True} for i in range(1, users + 1)],
+        )
+        conn.execute(
+            post_table.insert(),
+            [
+                {"id": post_id, "body": f"Post {post_id}", "user_id": rng.randint(1, users), "like_count": len(user_ids)}
+                for post_id, user_ids in likers.items()
+            ],
+        )
+        conn.execute(
+            like_table.insert(),
+            [{"user_id": user_id, "post_id": post_id} for post_id, user_ids in likers.items() for user_id in user_ids],
+        )
+    engine.dispose()
+
+
+async def timed(database: databases.Database, query, repeat: int) -> tuple[float, list]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = await database.fetch_all(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), rows
+
+
+async def deep_cursor(database: databases.Database, sorting: PostSorting, pages: int) -> str:
+    cursor = None
+    for _ in range(pages):
+        rows = await database.fetch_all(select_posts_page(sorting, PAGE_SIZE, cursor))
+        cursor = next_posts_cursor(sorting, rows[PAGE_SIZE - 1])
+    return cursor
+
+
+async def bench_size(size: int, repeat: int, deep_pages: int) -> list[dict]:
+    path = os.path.join(BENCH_DIR, f"posts-{size}.db")
+    seed(f"sqlite:///{path}", size)
+    results = []
+    async with databases.Database(f"sqlite+aiosqlite:///{path}") as database:
+        for sorting in PostSorting:
+            first_ms, _ = await timed(database, select_posts_page(sorting, PAGE_SIZE), repeat)
+            cursor = await deep_cursor(database, sorting, min(deep_pages, size // PAGE_SIZE - 1))
+            deep_ms, _ = await timed(database, select_posts_page(sorting, PAGE_SIZE, cursor), repeat)
+            results.append({"size": size, "sorting": sorting.value, "first_page_ms": first_ms, "deep_page_ms": deep_ms})
+        full_ms, _ = await timed(database, select_post_and_likes.order_by(post_table.c.id.desc()), max(1, repeat // 5))
+        for result in results:
+            result["full_listing_ms"] = full_ms
+    return results
+
+
+async def main(sizes: list[int], repeat: int, deep_pages: int) -> None:
+    print(f"{'posts':>9} {'sorting':>11} {'first page':>12} {'deep page':>12} {'full listing':>14}")
+    for size in sizes:
+        for r in await bench_size(size, repeat, deep_pages):
+            print(
+                f"{r['size']:>9} {r['sorting']:>11} {r['first_page_ms']:>10.2f}ms "
+                f"{r['deep_page_ms']:>10.2f}ms {r['full_listing_ms']:>12.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--deep-pages", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat, args.deep_pages))
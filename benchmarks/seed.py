@@ -0,0 +1,129 @@
+"""Seeded synthetic data: users, posts and skewed likes and comments.
+
+Bulk-loads a database the app supports, SQLite or Postgres, with N users and M
+posts. Likes and comments follow a Zipf distribution, like real traffic: a few
+posts get most of them, and a few users write most posts and comments. The same
+arguments and seed always produce the same rows, so runs on different
+branches compare like with like. The tables are dropped and created again
+first, so point this only at a throwaway database.
+
+Every user's password is PASSWORD, so load tests can log in as any of them.
+
+    python -m benchmarks.seed --url sqlite:///bench.db --users 1000 --posts 10000 --likes 50000 --comments 20000
+"""
+import argparse
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+
+import sqlalchemy
+
+from benchmarks import BENCH_DIR
+from storeapi.database import comment_table, create_schema, like_table, metadata, post_table, user_table
+from storeapi.security import get_password_hash
+
+PASSWORD = "benchmark-password"
+BATCH_SIZE = 5_000
+
+
+@dataclass
+class Dataset:
+    users: int
+    posts: int
+    likes: int
+    comments: int
+    skew: float
+    seed: int
+
+
+def email(user_id: int) -> str:
+    return f"user{user_id}@example.net"
+
+
+def zipf_weights(n: int, skew: float, rng: random.Random) -> list[float]:
+    """Weights of n items following a Zipf distribution, in random order."""
+    weights = [1 / rank**skew for rank in range(1, n + 1)]
+    # Otherwise the oldest posts would always be the most popular
+    rng.shuffle(weights)
+    return weights
+
+
+def insert(conn: sqlalchemy.Connection, table: sqlalchemy.Table, rows: list[dict]) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+def reset_sequences(conn: sqlalchemy.Connection) -> None:
+    """Move Postgres id sequences past the ids inserted here, for rows the app inserts later."""
+    if conn.dialect.name != "postgresql":
+        return
+    for table in (user_table, post_table, like_table, comment_table):
+        conn.execute(sqlalchemy.text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), COALESCE(MAX(id), 1)) FROM {table.name}"
+        ))
+
+
+def seed(url: str, users: int, posts: int, likes: int, comments: int, skew: float = 1.1, seed: int = 0) -> Dataset:
+    rng = random.Random(seed)
+    user_weights = zipf_weights(users, skew, rng)
+    post_weights = zipf_weights(posts, skew, rng)
+    user_ids = range(1, users + 1)
+    post_ids = range(1, posts + 1)
+
+    # Hashing is slow, so every user shares one hash
+    password = get_password_hash(PASSWORD)
+    user_rows = [{"id": i, "email": email(i), "password": password, "confirmed": True} for i in user_ids]
+    authors = rng.choices(user_ids, weights=user_weights, k=posts)
+    # A user likes a post at most once, so there can be fewer likes than asked for
+    like_keys = set(zip(rng.choices(user_ids, k=likes), rng.choices(post_ids, weights=post_weights, k=likes)))
+    like_rows = [{"user_id": user_id, "post_id": post_id} for user_id, post_id in sorted(like_keys)]
+    comment_rows = [
+        {"body": f"Comment {i}", "post_id": post_id, "user_id": user_id}
+        for i, (post_id, user_id) in enumerate(zip(
+            rng.choices(post_ids, weights=post_weights, k=comments),
+            rng.choices(user_ids, weights=user_weights, k=comments),
+        ), start=1)
+    ]
+    like_counts = Counter(row["post_id"] for row in like_rows)
+    comment_counts = Counter(row["post_id"] for row in comment_rows)
+    post_rows = [
+        {
+            "id": post_id,
+            "body": f"Post {post_id}",
+            "user_id": author,
+            "like_count": like_counts[post_id],
+            "comment_count": comment_counts[post_id],
+        }
+        for post_id, author in zip(post_ids, authors)
+    ]
+
+    engine = sqlalchemy.create_engine(url)
+    try:
+        metadata.drop_all(engine)
+        create_schema(engine)
+        with engine.begin() as conn:
+            insert(conn, user_table, user_rows)
+            insert(conn, post_table, post_rows)
+            insert(conn, like_table, like_rows)
+            insert(conn, comment_table, comment_rows)
+            reset_sequences(conn)
+    finally:
+        engine.dispose()
+    return Dataset(users, posts, len(like_rows), len(comment_rows), skew, seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=f"sqlite:///{BENCH_DIR}/seed.db")
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--likes", type=int, default=50_000)
+    parser.add_argument("--comments", type=int, default=20_000)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    dataset = seed(args.url, args.users, args.posts, args.likes, args.comments, args.skew, args.seed)
+    print(json.dumps({"url": args.url, **asdict(dataset), "seconds": round(time.perf_counter() - start, 2)}, indent=2))
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+SendBatch = Callable[[Hashable, dict[str, dict]], Awaitable[Any]]
+
+
+class RecipientBatcher:
+    """Collect messages sharing a key for a short window and send them as one batch.
+
+    ``send`` waits until the batch holding the message has been sent and
+    returns that batch's result, or raises its error, so every caller still
+    learns whether its own message went out. A batch is sent when its window
+    closes or when it reaches ``max_recipients``. A recipient appears at most
+    once per batch; a second message to the same recipient starts a new batch.
+
+    When a batch fails with an error ``split_on`` says was caused by one of its
+    messages, it is sent again in halves, and so on, so only the messages that
+    cause the error fail.
+    """
+
+    def __init__(self, send_batch: SendBatch, window: float, max_recipients: int, split_on: Optional[Callable[[Exception], bool]] = None) -> None:
+        self.send_batch = send_batch
+        self.split_on = split_on
+        self.window = window
+        self.max_recipients = max_recipients
+        self._batches: dict[Hashable, dict[str, tuple[dict, asyncio.Future]]] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self._deliveries: set[asyncio.Task] = set()
+
+    def pending(self) -> int:
+        return sum(len(batch) for batch in self._batches.values())
+
+    async def send(self, key: Hashable, recipient: str, variables: dict) -> Any:
+        if recipient in self._batches.get(key, {}):
+            self._flush(key)
+        batch = self._batches.setdefault(key, {})
+        future = asyncio.get_running_loop().create_future()
+        batch[recipient] = (variables, future)
+        if len(batch) >= self.max_recipients:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(key, None)
+        if batch:
+            delivery = asyncio.create_task(self._deliver(key, batch))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, key: Hashable, batch: dict[str, tuple[dict, asyncio.Future]]) -> None:
+        logger.debug(f"Sending batch of {len(batch)} messages")
+        try:
+            result = await self.send_batch(key, {recipient: variables for recipient, (variables, _) in batch.items()})
+        except Exception as e:
+            if len(batch) > 1 and self.split_on is not None and self.split_on(e):
+                logger.warning(f"Batch of {len(batch)} messages rejected, sending it in halves: {e}")
+                messages = list(batch.items())
+                half = len(messages) // 2
+                await asyncio.gather(self._deliver(key, dict(messages[:half])), self._deliver(key, dict(messages[half:])))
+                return
+            logger.error(f"Batch of {len(batch)} messages failed: {e}")
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_result(result)
+
+    async def flush(self) -> None:
+        """Send everything collected so far and wait for it to be delivered."""
+        for key in list(self._batches):
+            self._flush(key)
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
@@ -1,5 +1,6 @@
-from typing import Optional
+from typing import Literal, Optional
 from functools import lru_cache
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,15 +11,84 @@ class BaseConfig(BaseSettings):
 class GlobalConfig(BaseConfig):
     DATABASE_URL: Optional[str] = None
     DB_FORCE_ROLL_BACK: bool = False
+    # "check" only verifies the schema at startup, leaving changes to deploys
+    DATABASE_SCHEMA_MODE: Literal["create", "check"] = "create"
+    DATABASE_POOL_MIN_SIZE: int = 5
+    DATABASE_POOL_MAX_SIZE: int = 20
+    DATABASE_POOL_ACQUIRE_TIMEOUT_SECONDS: float = 10
+    DATABASE_STATEMENT_TIMEOUT_SECONDS: float = 30
+    DATABASE_REPLICA_URLS: list[str] = []
+    DATABASE_READ_YOUR_WRITES_SECONDS: float = 5
+    DATABASE_STICKY_CLIENTS: int = 10_000
+    DATABASE_REPLICA_HEALTH_CHECK_INTERVAL_SECONDS: float = 10
+    DATABASE_REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS: float = 2
+    SQLITE_PERFORMANCE_PROFILE: bool = False
+    SQLITE_READ_CONNECTIONS: int = 4
+    SQLITE_GROUP_COMMIT_MAX_SIZE: int = 100
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KIB: int = 64 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
     MAILGUN_DOMAIN: Optional[str] = None
     MAILGUN_API_KEY: Optional[str] = None
+    MAILGUN_API_URL: str = "https://api.mailgun.net/v3"
+    EMAIL_BATCHING: bool = True
+    EMAIL_BATCH_WINDOW_SECONDS: float = 0.5
+    EMAIL_BATCH_MAX_RECIPIENTS: int = 1000
     B2_KEY_ID: Optional[str] = None
     B2_APPLICATION_KEY: Optional[str] = None
     B2_BUCKET_NAME: Optional[str] = None
+    # B2 rejects parts other than the last one below 5 MB
+    B2_PART_SIZE: int = Field(16 * 1024 * 1024, ge=5 * 1024 * 1024)
+    B2_PARTS_IN_FLIGHT: int = 4
+    B2_WORKERS: int = 8
+    B2_TIMEOUT_SECONDS: float = 30
+    B2_UPLOAD_TIMEOUT_SECONDS: float = 300
+    UPLOAD_SESSION_DIR: Optional[str] = None
+    # Bounds the chunk lists built for a session, as well as the disk it takes
+    UPLOAD_SESSION_MAX_SIZE: int = 10 * 1024 * 1024 * 1024
+    UPLOAD_SESSION_TTL_SECONDS: int = 24 * 60 * 60
+    UPLOAD_SESSION_GC_INTERVAL_SECONDS: int = 10 * 60
+    JOB_WORKER_IN_APP: bool = True
+    JOB_POLL_INTERVAL_SECONDS: float = 1
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BACKOFF_SECONDS: float = 5
+    JOB_RETRY_BACKOFF_MAX_SECONDS: float = 5 * 60
+    # Email jobs mostly wait on a batch, so allow enough to fill one
+    JOB_EMAIL_CONCURRENCY: int = 1000
+    JOB_EMAIL_VISIBILITY_TIMEOUT_SECONDS: float = 60
+    JOB_IMAGE_CONCURRENCY: int = 4
+    JOB_IMAGE_VISIBILITY_TIMEOUT_SECONDS: float = 180
     DEEPAI_API_KEY: Optional[str] = None
     SENTRY_DSN: Optional[str] = None
+    SENTRY_ERROR_SAMPLE_RATE: float = 1.0
+    SENTRY_TRACES_SAMPLE_RATE: float = 0.1
+    SENTRY_TRACES_SAMPLE_RULES: dict[str, float] = {"GET /post": 0.01, "/upload": 1.0}
+    SENTRY_TRACES_PER_SECOND: Optional[float] = 10
+    SENTRY_PROFILE_SESSION_SAMPLE_RATE: float = 0.1
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30
+    HTTP_TIMEOUT_SECONDS: float = 10
+    HTTP2: bool = False
+    LOG_QUEUE_ENABLED: bool = False
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_QUEUE_OVERFLOW: Literal["drop_new", "drop_oldest", "block"] = "drop_new"
+    SQL_TRACE_SAMPLE_RATE: float = 0.0
+    # Shared by the workers of one server, so any of them can report them all
+    METRICS_DIR: Optional[str] = None
+    METRICS_WRITE_INTERVAL_SECONDS: float = 5
     SECRET_KEY : str
     ALGORITHM : str
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_USE_PROCESSES: bool = False
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    USER_CACHE_SIZE: int = 1024
+    USER_CACHE_TTL_SECONDS: float = 60
+    RESPONSE_CACHE_SIZE: int = 1024
+    RESPONSE_CACHE_TTL_SECONDS: float = 30
+    LIKE_WRITE_BEHIND: bool = False
+    LIKE_FLUSH_INTERVAL_SECONDS: float = 0.05
+    LIKE_FLUSH_MAX_SIZE: int = 500
         
         
         
@@ -26,11 +96,15 @@ class DevConfig(GlobalConfig):
     model_config = SettingsConfigDict(env_prefix="DEV_", extra="ignore")
         
 class ProdConfig(GlobalConfig):
+    LOG_QUEUE_ENABLED: bool = True
+    SQLITE_PERFORMANCE_PROFILE: bool = True
+    DATABASE_SCHEMA_MODE: Literal["create", "check"] = "check"
     model_config = SettingsConfigDict(env_prefix="PROD_", extra="ignore")
         
 class TestConfig(GlobalConfig):
     DATABASE_URL: str = "sqlite:///./test.db"
     DB_FORCE_ROLL_BACK: bool = True
+    EMAIL_BATCH_WINDOW_SECONDS: float = 0
     
     
     model_config = SettingsConfigDict(env_prefix="TEST_", extra="ignore")
@@ -1,6 +1,10 @@
-import databases
+from functools import lru_cache
 import sqlalchemy
+from sqlalchemy.dialects import postgresql, sqlite
 from storeapi.config import config
+from storeapi.db_pool import instrument_pool, pool_options
+from storeapi.replicas import RoutingDatabase
+from storeapi.sqlite_profile import SQLiteDatabase, apply_pragmas, use_performance_profile
 
 metadata =sqlalchemy.MetaData()
 
@@ -10,7 +14,13 @@ post_table = sqlalchemy.Table(
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
     sqlalchemy.Column("body", sqlalchemy.String, nullable=False),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
-    sqlalchemy.Column("image_url", sqlalchemy.String)
+    sqlalchemy.Column("image_url", sqlalchemy.String),
+    # Maintained by the /like and /comment write paths, see storeapi.counters
+    sqlalchemy.Column("like_count", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("comment_count", sqlalchemy.Integer, nullable=False, server_default="0"),
+    # Bumped by every write that changes the post or its comments, see storeapi.etag
+    sqlalchemy.Column("version", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Index("ix_posts_like_count_id", "like_count", "id"),
 )
 
 comment_table = sqlalchemy.Table(
@@ -19,9 +29,9 @@ comment_table = sqlalchemy.Table(
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
     sqlalchemy.Column("body", sqlalchemy.String, nullable=False),
     sqlalchemy.Column("post_id", sqlalchemy.Integer, sqlalchemy.ForeignKey("posts.id"), nullable=False),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False)
-
-    
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    # Serves both finding a post's comments and paging through them by id
+    sqlalchemy.Index("ix_comments_post_id_id", "post_id", "id"),
 )
 
 
@@ -41,15 +51,139 @@ like_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
-    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id"), nullable=False),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id"), nullable=False, index=True),
     sqlalchemy.UniqueConstraint("user_id", "post_id", name="unique_user_post_like")
 )
 
-connect_args = {"check_same_thread":False} if "sqlite" in config.DATABASE_URL else {}
-engine = sqlalchemy.create_engine(
+upload_session_table = sqlalchemy.Table(
+    "upload_sessions",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("users.id"), nullable=False),
+    sqlalchemy.Column("file_name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("content_type", sqlalchemy.String),
+    sqlalchemy.Column("size", sqlalchemy.BigInteger, nullable=False),
+    sqlalchemy.Column("chunk_size", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime(timezone=True), nullable=False, index=True),
+)
+
+job_table = sqlalchemy.Table(
+    "jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("type", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.JSON, nullable=False),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False, server_default="pending"),
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("run_at", sqlalchemy.DateTime(timezone=True), nullable=False),
+    sqlalchemy.Column("locked_until", sqlalchemy.DateTime(timezone=True)),
+    sqlalchemy.Column("last_error", sqlalchemy.String),
+    sqlalchemy.Index("ix_jobs_type_status_run_at", "type", "status", "run_at"),
+)
+
+
+class SchemaError(RuntimeError):
+    pass
+
+
+@lru_cache()
+def get_engine() -> sqlalchemy.Engine:
+    """Sync engine for schema changes, created when first needed rather than on import."""
+    connect_args = {"check_same_thread":False} if "sqlite" in config.DATABASE_URL else {}
+    engine = sqlalchemy.create_engine(
+        config.DATABASE_URL,
+        connect_args=connect_args
+    )
+    if use_performance_profile(config.DATABASE_URL):
+        sqlalchemy.event.listen(engine, "connect", apply_pragmas)
+    return engine
+
+
+def insert_ignoring_conflicts(table: sqlalchemy.Table):
+    """Build an INSERT ... ON CONFLICT DO NOTHING for the configured database."""
+    insert = postgresql.insert if database.url.dialect in ("postgresql", "postgres") else sqlite.insert
+    return insert(table).on_conflict_do_nothing()
+
+
+def missing_schema(engine: sqlalchemy.Engine) -> tuple[list[sqlalchemy.Table], list[sqlalchemy.Column], list[sqlalchemy.Index]]:
+    """Tables, columns and indexes defined in metadata that the database lacks."""
+    inspector = sqlalchemy.inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    tables, columns, indexes = [], [], []
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            tables.append(table)
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        columns.extend(column for column in table.columns if column.name not in existing_columns)
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        indexes.extend(index for index in table.indexes if index.name not in existing_indexes)
+    return tables, columns, indexes
+
+
+def upgrade_schema(engine: sqlalchemy.Engine) -> None:
+    """Add columns and indexes defined after a table was first created.
+
+    create_all only creates missing tables, so databases created by an older
+    version of the app would otherwise never see new columns.
+    """
+    _, columns, indexes = missing_schema(engine)
+    with engine.begin() as conn:
+        for column in columns:
+            column_ddl = sqlalchemy.schema.CreateColumn(column).compile(dialect=engine.dialect)
+            conn.execute(sqlalchemy.text(f"ALTER TABLE {column.table.name} ADD COLUMN {column_ddl}"))
+        for index in indexes:
+            index.create(conn)
+
+
+def check_schema(engine: sqlalchemy.Engine) -> None:
+    """Raise SchemaError unless the database has every table, column and index."""
+    tables, columns, indexes = missing_schema(engine)
+    missing = [table.name for table in tables]
+    missing += [f"{column.table.name}.{column.name}" for column in columns]
+    missing += [index.name for index in indexes]
+    if missing:
+        raise SchemaError(
+            f"Database schema is out of date, missing {', '.join(missing)}. "
+            "Run python -m storeapi.database to bring it up to date."
+        )
+
+
+def create_schema(engine: sqlalchemy.Engine) -> None:
+    metadata.create_all(engine)
+    upgrade_schema(engine)
+
+
+def prepare_schema() -> None:
+    """Create or only check the schema, as DATABASE_SCHEMA_MODE says.
+
+    Runs once at startup, so importing this module never touches the database.
+    """
+    engine = get_engine()
+    try:
+        if config.DATABASE_SCHEMA_MODE == "check":
+            check_schema(engine)
+        else:
+            create_schema(engine)
+    finally:
+        engine.dispose()
+
+
+database_class = SQLiteDatabase if use_performance_profile(config.DATABASE_URL) else RoutingDatabase
+database = database_class(
     config.DATABASE_URL,
-    connect_args=connect_args
+    replica_urls=config.DATABASE_REPLICA_URLS,
+    force_rollback=config.DB_FORCE_ROLL_BACK,
+    **pool_options(config.DATABASE_URL),
 )
+pool_metrics = {
+    "primary": instrument_pool(database, config.DATABASE_POOL_ACQUIRE_TIMEOUT_SECONDS),
+    **{
+        f"replica{i}": instrument_pool(replica, config.DATABASE_POOL_ACQUIRE_TIMEOUT_SECONDS)
+        for i, replica in enumerate(database.replicas)
+    },
+}
+
 
-metadata.create_all(engine)
-database = databases.Database(config.DATABASE_URL, force_rollback=config.DB_FORCE_ROLL_BACK)
\ No newline at end of file
+if __name__ == "__main__":
+    create_schema(get_engine())
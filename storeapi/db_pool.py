@@ -0,0 +1,156 @@
+import asyncio
+import bisect
+import logging
+import time
+from databases import Database
+from storeapi.config import config
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing and timeouts for the databases backends, and live statistics
+# on how connections are handed out.
+#
+# asyncpg takes the pool size and statement timeout as options; SQLite opens
+# a connection per acquire and takes none of them. Neither backend bounds how
+# long an acquire may wait, so instrument_pool wraps every backend connection
+# to time its acquire, give up after DATABASE_POOL_ACQUIRE_TIMEOUT_SECONDS and
+# count connections in use and requests waiting for one.
+
+ACQUIRE_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class PoolTimeoutError(TimeoutError):
+    pass
+
+
+class Histogram:
+    """Cumulative histogram over fixed upper bounds, plus an overflow bucket."""
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> dict[str, int]:
+        total = 0
+        result = {}
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            result[str(bound)] = total
+        return result
+
+
+class PoolMetrics:
+    def __init__(self, database: Database) -> None:
+        self.database = database
+        self.in_use = 0
+        self.waiters = 0
+        self.timeouts = 0
+        self.acquire_seconds = Histogram(ACQUIRE_SECONDS_BUCKETS)
+
+    def stats(self) -> dict:
+        pool = getattr(self.database._backend, "_pool", None)
+        # Only asyncpg keeps idle connections around
+        idle = pool.get_idle_size() if hasattr(pool, "get_idle_size") else 0
+        return {
+            "in_use": self.in_use,
+            "idle": idle,
+            "waiters": self.waiters,
+            "timeouts": self.timeouts,
+            "acquire_seconds": {
+                "buckets": self.acquire_seconds.cumulative(),
+                "sum": self.acquire_seconds.sum,
+                "count": self.acquire_seconds.count,
+            },
+        }
+
+
+def pool_options(url: str) -> dict:
+    """Options for databases.Database that the backend for url understands."""
+    if not url.startswith(("postgresql", "postgres")):
+        return {}
+    return {
+        "min_size": config.DATABASE_POOL_MIN_SIZE,
+        "max_size": config.DATABASE_POOL_MAX_SIZE,
+        "command_timeout": config.DATABASE_STATEMENT_TIMEOUT_SECONDS,
+    }
+
+
+def instrument_pool(database: Database, acquire_timeout: float) -> PoolMetrics:
+    """Time and count the connections database hands out, before it connects."""
+    metrics = PoolMetrics(database)
+    backend = database._backend
+    make_connection = backend.connection
+
+    def connection():
+        conn = make_connection()
+        acquire, release = conn.acquire, conn.release
+
+        async def timed_acquire() -> None:
+            metrics.waiters += 1
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(acquire(), acquire_timeout)
+            except asyncio.TimeoutError as e:
+                metrics.timeouts += 1
+                logger.warning(f"Timed out acquiring a database connection after {acquire_timeout}s", extra=metrics.stats())
+                raise PoolTimeoutError("Timed out acquiring a database connection") from e
+            finally:
+                metrics.waiters -= 1
+            metrics.acquire_seconds.observe(time.perf_counter() - start)
+            metrics.in_use += 1
+
+        async def counted_release() -> None:
+            try:
+                await release()
+            finally:
+                metrics.in_use -= 1
+
+        conn.acquire = timed_acquire
+        conn.release = counted_release
+        return conn
+
+    backend.connection = connection
+    return metrics
+
+
+async def prewarm_pool(database: Database, size: int) -> None:
+    """Open size connections at once so the pool holds them before traffic arrives."""
+    if size <= 0:
+        return
+    acquired = 0
+    all_acquired = asyncio.Event()
+
+    async def warm() -> None:
+        nonlocal acquired
+        try:
+            # Each task gets its own connection from the pool
+            async with database.connection() as connection:
+                await connection.fetch_val("SELECT 1")
+                acquired += 1
+                if acquired == size:
+                    all_acquired.set()
+                await all_acquired.wait()
+        except Exception:
+            all_acquired.set()
+            raise
+
+    results = await asyncio.gather(*(asyncio.create_task(warm()) for _ in range(size)), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        logger.warning(f"Could only prewarm {size - len(errors)} of {size} database connections: {errors[0]}")
+    else:
+        logger.debug(f"Prewarmed {size} database connections")
+
+
+async def prewarm_pools(database: Database) -> None:
+    """Prewarm the pools of database and its replicas that keep connections open."""
+    for pooled in (database, *getattr(database, "replicas", ())):
+        if pooled.is_connected and pool_options(str(pooled.url)):
+            await prewarm_pool(pooled, config.DATABASE_POOL_MIN_SIZE)
@@ -0,0 +1,27 @@
+from typing import Optional
+from fastapi import Request, Response, status
+
+# Strong ETags for post resources, built from posts.version. The version is
+# bumped in the same statement as every write that changes what a post
+# resource shows, so checking a conditional GET costs one primary key lookup.
+
+
+def post_etag(resource: str, post_id: int, version: int, buffered: int = 0) -> str:
+    """Build the ETag of a post resource, counting likes still in the like buffer."""
+    if buffered:
+        return f'"{resource}-{post_id}-{version}+{buffered}"'
+    return f'"{resource}-{post_id}-{version}"'
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    header: Optional[str] = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Optional, TypeVar
+from storeapi.config import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class HashingPoolBusyError(Exception):
+    pass
+
+
+class HashingPool:
+    """Run CPU-bound password hashing off the event loop on a bounded executor.
+
+    At most ``max_pending`` calls may be running or queued at once; beyond that
+    ``run`` fails fast with HashingPoolBusyError instead of growing the queue.
+    """
+
+    def __init__(self, workers: int, max_pending: int, use_processes: bool = False) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.use_processes = use_processes
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            logger.debug(f"Starting password hashing pool with {self.workers} workers")
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        if self.pending >= self.max_pending:
+            raise HashingPoolBusyError(f"{self.pending} password hashing calls already pending")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+@lru_cache()
+def hashing_pool() -> HashingPool:
+    return HashingPool(
+        workers=config.PASSWORD_HASH_WORKERS,
+        max_pending=config.PASSWORD_HASH_MAX_PENDING,
+        use_processes=config.PASSWORD_HASH_USE_PROCESSES,
+    )
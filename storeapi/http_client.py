@@ -0,0 +1,51 @@
+import logging
+from typing import Optional
+import httpx
+from storeapi.config import config
+
+logger = logging.getLogger(__name__)
+
+# One pooled client for all outbound calls (Mailgun, DeepAI), so connections
+# and TLS sessions are reused instead of being set up again for every email or
+# image request. It is opened and closed in the app lifespan.
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client() -> httpx.AsyncClient:
+    http2 = config.HTTP2
+    if http2 and not http2_available():
+        logger.warning("HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=config.HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it on first use outside the app lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
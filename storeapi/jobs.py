@@ -0,0 +1,234 @@
+import asyncio
+import datetime
+import logging
+import signal
+from functools import partial
+from typing import Any, Awaitable, Callable, Optional
+import sqlalchemy
+from databases import Database
+from storeapi import tasks
+from storeapi.config import config
+from storeapi.database import database, job_table, prepare_schema
+from storeapi.metrics import jobs_running
+
+logger = logging.getLogger(__name__)
+
+# Durable background jobs, stored in the jobs table so they survive restarts
+# and run outside the request handlers.
+#
+# A worker claims due jobs of each type, up to that type's concurrency limit,
+# by marking them running until now + visibility timeout. A job whose worker
+# dies is claimed again once that time passes. Failed jobs are retried with
+# exponential backoff until they run out of attempts and are marked failed.
+# Jobs run at least once, so handlers may occasionally run twice.
+#
+# Workers run inside the app when JOB_WORKER_IN_APP is set, or separately:
+#
+#   python -m storeapi.jobs
+
+PENDING = "pending"
+RUNNING = "running"
+FAILED = "failed"
+
+SEND_REGISTRATION_EMAIL = "send_registration_email"
+GENERATE_IMAGE = "generate_image"
+
+
+class JobType:
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[dict], Awaitable[Any]],
+        concurrency: int,
+        visibility_timeout: float,
+        max_attempts: Optional[int] = None,
+    ) -> None:
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts or config.JOB_MAX_ATTEMPTS
+
+
+async def send_registration_email(payload: dict) -> None:
+    await tasks.send_user_registration_email(payload["email"], confirmation_link=payload["confirmation_link"])
+
+
+async def generate_image(payload: dict) -> None:
+    await tasks.generate_and_add_to_post(
+        payload["email"], payload["post_id"], payload["post_url"], database, payload["prompt"]
+    )
+
+
+JOB_TYPES = {
+    job_type.name: job_type
+    for job_type in (
+        JobType(SEND_REGISTRATION_EMAIL, send_registration_email, config.JOB_EMAIL_CONCURRENCY, config.JOB_EMAIL_VISIBILITY_TIMEOUT_SECONDS),
+        JobType(GENERATE_IMAGE, generate_image, config.JOB_IMAGE_CONCURRENCY, config.JOB_IMAGE_VISIBILITY_TIMEOUT_SECONDS),
+    )
+}
+
+
+def now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def retry_delay(attempts: int) -> datetime.timedelta:
+    seconds = config.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(seconds, config.JOB_RETRY_BACKOFF_MAX_SECONDS))
+
+
+async def enqueue(database: Database, job_type: str, payload: dict, run_at: Optional[datetime.datetime] = None) -> int:
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type {job_type}")
+    query = job_table.insert().values(type=job_type, payload=payload, status=PENDING, attempts=0, run_at=run_at or now())
+    return await database.execute(query)
+
+
+def claimable(job_type: JobType, at: datetime.datetime):
+    return sqlalchemy.and_(
+        job_table.c.type == job_type.name,
+        sqlalchemy.or_(
+            sqlalchemy.and_(job_table.c.status == PENDING, job_table.c.run_at <= at),
+            sqlalchemy.and_(
+                job_table.c.status == RUNNING,
+                job_table.c.locked_until <= at,
+                job_table.c.attempts < job_type.max_attempts,
+            ),
+        ),
+    )
+
+
+async def claim(database: Database, job_type: JobType, limit: int) -> list:
+    at = now()
+    # Jobs that timed out on their last attempt will never be claimed again
+    await database.execute(
+        job_table.update()
+        .where(
+            job_table.c.type == job_type.name,
+            job_table.c.status == RUNNING,
+            job_table.c.locked_until <= at,
+            job_table.c.attempts >= job_type.max_attempts,
+        )
+        .values(status=FAILED, last_error="Visibility timeout exceeded")
+    )
+    due = (
+        sqlalchemy.select(job_table.c.id)
+        .where(claimable(job_type, at))
+        .order_by(job_table.c.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    query = (
+        job_table.update()
+        .where(job_table.c.id.in_(due), claimable(job_type, at))
+        .values(
+            status=RUNNING,
+            attempts=job_table.c.attempts + 1,
+            locked_until=at + datetime.timedelta(seconds=job_type.visibility_timeout),
+        )
+        .returning(job_table)
+    )
+    return await database.fetch_all(query)
+
+
+async def pending_counts(database: Database) -> dict[str, int]:
+    """Jobs of each type waiting to run, due or not."""
+    query = (
+        sqlalchemy.select(job_table.c.type, sqlalchemy.func.count().label("jobs"))
+        .where(job_table.c.status == PENDING)
+        .group_by(job_table.c.type)
+    )
+    return {row.type: row.jobs for row in await database.fetch_all(query)}
+
+
+async def run_job(database: Database, job_type: JobType, job) -> None:
+    try:
+        await job_type.handler(job.payload)
+    except Exception as e:
+        logger.exception(f"Job {job.id} ({job.type}) failed on attempt {job.attempts}")
+        if job.attempts >= job_type.max_attempts:
+            values = {"status": FAILED}
+        else:
+            values = {"status": PENDING, "run_at": now() + retry_delay(job.attempts)}
+        await database.execute(
+            job_table.update().where(job_table.c.id == job.id).values(locked_until=None, last_error=repr(e), **values)
+        )
+        return
+    await database.execute(job_table.delete().where(job_table.c.id == job.id))
+
+
+class JobWorker:
+    """Poll the jobs table and run due jobs, at most concurrency at once per job type."""
+
+    def __init__(self, database: Database, job_types: Optional[dict[str, JobType]] = None) -> None:
+        self.database = database
+        self.job_types = job_types or JOB_TYPES
+        self.running: dict[str, set[asyncio.Task]] = {name: set() for name in self.job_types}
+        self._poller: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> list[asyncio.Task]:
+        """Claim and start every due job there is capacity for."""
+        started = []
+        for name, job_type in self.job_types.items():
+            free = job_type.concurrency - len(self.running[name])
+            if free <= 0:
+                continue
+            for job in await claim(self.database, job_type, free):
+                task = asyncio.create_task(run_job(self.database, job_type, job))
+                self.running[name].add(task)
+                jobs_running.inc(type=name)
+                task.add_done_callback(partial(self._finished, name))
+                started.append(task)
+        return started
+
+    def _finished(self, name: str, task: asyncio.Task) -> None:
+        self.running[name].discard(task)
+        jobs_running.dec(type=name)
+
+    async def drain(self) -> None:
+        """Run jobs until none are due, waiting for each batch to finish."""
+        while started := await self.run_once():
+            await asyncio.gather(*started)
+
+    async def poll(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Failed to claim jobs")
+            await asyncio.sleep(config.JOB_POLL_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        logger.info(f"Starting job worker for {', '.join(self.job_types)}")
+        self._poller = asyncio.create_task(self.poll())
+
+    async def stop(self) -> None:
+        """Stop claiming jobs and wait for the ones already running."""
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        running = [task for job_tasks in self.running.values() for task in job_tasks]
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def main() -> None:
+    from storeapi.logging_conf import configure_logging
+
+    configure_logging()
+    prepare_schema()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    async with database:
+        worker = JobWorker(database)
+        worker.start()
+        await stopping.wait()
+        await worker.stop()
+        await tasks.email_batcher().flush()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,5 @@
+import hashlib
+import io
 import logging
 from functools import lru_cache
 
@@ -33,4 +35,47 @@ def b2_upload_file(local_file:str, file_name:str):
     download_url = api.get_download_url_for_fileid(uploaded_file.id_)
     logger.debug(f"Uploaded {local_file} to B2 successfully and got download URL {download_url}")
 
-    return download_url
\ No newline at end of file
+    return download_url
+
+
+def b2_upload_bytes(data: bytes, file_name: str, content_type: str = "b2/x-auto") -> str:
+    api = b2_api()
+    logger.debug(f"Uploading {len(data)} bytes to B2 as {file_name}")
+    
+    uploaded_file = b2_get_bucket(api).upload_bytes(data, file_name=file_name, content_type=content_type)
+    
+    return api.get_download_url_for_fileid(uploaded_file.id_)
+
+# Large files are uploaded in parts through B2's large-file API so the whole
+# file never has to exist on the server at once. Every part but the last must
+# be at least account_info.get_absolute_minimum_part_size() (5 MB).
+
+def b2_start_large_file(file_name: str, content_type: str = "b2/x-auto") -> str:
+    api = b2_api()
+    logger.debug(f"Starting large file upload to B2 as {file_name}")
+    
+    response = api.session.start_large_file(b2_get_bucket(api).id_, file_name, content_type, {})
+    return response["fileId"]
+
+
+def b2_upload_part(file_id: str, part_number: int, data: bytes) -> str:
+    """Upload one part of a large file and return its SHA1, needed to finish the file."""
+    api = b2_api()
+    logger.debug(f"Uploading part {part_number} ({len(data)} bytes) of large file {file_id}")
+    
+    sha1 = hashlib.sha1(data).hexdigest()
+    api.session.upload_part(file_id, part_number, len(data), sha1, io.BytesIO(data))
+    return sha1
+
+
+def b2_finish_large_file(file_id: str, part_sha1s: list[str]) -> str:
+    api = b2_api()
+    logger.debug(f"Finishing large file {file_id} with {len(part_sha1s)} parts")
+    
+    api.session.finish_large_file(file_id, part_sha1s)
+    return api.get_download_url_for_fileid(file_id)
+
+
+def b2_cancel_large_file(file_id: str) -> None:
+    logger.debug(f"Cancelling large file {file_id}")
+    b2_api().session.cancel_large_file(file_id)
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, TypeVar
+from storeapi.config import config
+from storeapi.metrics import outbound_call
+from storeapi.libs.b2 import (
+    b2_upload_file,
+    b2_upload_bytes,
+    b2_start_large_file,
+    b2_upload_part,
+    b2_finish_large_file,
+    b2_cancel_large_file,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# b2sdk is blocking, including the authorize_account and get_bucket_by_name
+# calls hidden behind b2_api() and b2_get_bucket(). These wrappers run every
+# B2 call on a dedicated, bounded thread pool so uploads never block the event
+# loop or starve the default executor, and give up waiting after a timeout.
+# A timed out call keeps its worker thread until b2sdk itself returns.
+
+
+class B2Metrics:
+    def __init__(self) -> None:
+        self.in_flight: Counter[str] = Counter()
+        self.calls: Counter[str] = Counter()
+        self.failures: Counter[str] = Counter()
+        self.timeouts: Counter[str] = Counter()
+        self.seconds: Counter[str] = Counter()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {
+            operation: {
+                "in_flight": self.in_flight[operation],
+                "calls": self.calls[operation],
+                "failures": self.failures[operation],
+                "timeouts": self.timeouts[operation],
+                "seconds": self.seconds[operation],
+            }
+            for operation in self.calls
+        }
+
+
+b2_metrics = B2Metrics()
+
+
+@lru_cache()
+def b2_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=config.B2_WORKERS, thread_name_prefix="b2")
+
+
+def shutdown_b2_executor() -> None:
+    if b2_executor.cache_info().currsize:
+        b2_executor().shutdown(wait=False, cancel_futures=True)
+        b2_executor.cache_clear()
+
+
+async def run_b2(operation: str, timeout: float, fn: Callable[..., T], *args) -> T:
+    b2_metrics.in_flight[operation] += 1
+    b2_metrics.calls[operation] += 1
+    start = time.perf_counter()
+    try:
+        with outbound_call("b2", operation):
+            future = asyncio.get_running_loop().run_in_executor(b2_executor(), fn, *args)
+            return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        b2_metrics.timeouts[operation] += 1
+        logger.warning(f"B2 {operation} timed out after {timeout}s")
+        raise
+    except Exception:
+        b2_metrics.failures[operation] += 1
+        raise
+    finally:
+        b2_metrics.in_flight[operation] -= 1
+        b2_metrics.seconds[operation] += time.perf_counter() - start
+
+
+async def upload_file(local_file: str, file_name: str) -> str:
+    return await run_b2("upload_file", config.B2_UPLOAD_TIMEOUT_SECONDS, b2_upload_file, local_file, file_name)
+
+
+async def upload_bytes(data: bytes, file_name: str, content_type: str = "b2/x-auto") -> str:
+    return await run_b2("upload_bytes", config.B2_UPLOAD_TIMEOUT_SECONDS, b2_upload_bytes, data, file_name, content_type)
+
+
+async def start_large_file(file_name: str, content_type: str = "b2/x-auto") -> str:
+    return await run_b2("start_large_file", config.B2_TIMEOUT_SECONDS, b2_start_large_file, file_name, content_type)
+
+
+async def upload_part(file_id: str, part_number: int, data: bytes) -> str:
+    return await run_b2("upload_part", config.B2_UPLOAD_TIMEOUT_SECONDS, b2_upload_part, file_id, part_number, data)
+
+
+async def finish_large_file(file_id: str, part_sha1s: list[str]) -> str:
+    return await run_b2("finish_large_file", config.B2_TIMEOUT_SECONDS, b2_finish_large_file, file_id, part_sha1s)
+
+
+async def cancel_large_file(file_id: str) -> None:
+    return await run_b2("cancel_large_file", config.B2_TIMEOUT_SECONDS, b2_cancel_large_file, file_id)
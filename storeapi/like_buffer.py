@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from collections import Counter
+from functools import lru_cache
+from typing import Optional
+import sqlalchemy
+from databases import Database
+from storeapi import response_cache as cache
+from storeapi.config import config
+from storeapi.counters import increment_per_post
+from storeapi.database import database, insert_ignoring_conflicts, like_table, post_table
+
+logger = logging.getLogger(__name__)
+
+# With LIKE_WRITE_BEHIND, /like hands likes to a LikeBuffer instead of
+# writing them itself. The buffer collects them for LIKE_FLUSH_INTERVAL_SECONDS
+# or until LIKE_FLUSH_MAX_SIZE are waiting and writes them in one transaction,
+# so a like storm costs a few bulk writes instead of one write per like.
+# Until then, read paths add the buffered likes to the counts they return.
+
+
+class PostNotFoundError(Exception):
+    pass
+
+
+class LikeBuffer:
+    """Collect likes, deduplicated on (user_id, post_id), and write them in bulk.
+
+    ``like`` waits until the like has been written and returns the stored row
+    and whether this call created it, or the existing row if the user had
+    already liked the post. Likes already in the database are not buffered, so
+    they are never counted twice.
+    """
+
+    def __init__(self, database: Database, interval: float, max_size: int) -> None:
+        self.database = database
+        self.interval = interval
+        self.max_size = max_size
+        self.buffered: Counter[int] = Counter()
+        self._pending: dict[tuple[int, int], asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    def buffered_likes(self, post_id: int) -> int:
+        return self.buffered[post_id]
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def like(self, user_id: int, post_id: int) -> tuple[dict, bool]:
+        key = (user_id, post_id)
+        if key not in self._pending:
+            existing = await find_like(self.database, user_id, post_id)
+            if existing is not None:
+                return existing, False
+        future = self._pending.get(key)
+        if future is not None:
+            # Another request buffered the same like, so this one only waits for it
+            like, _ = await asyncio.shield(future)
+            return like, False
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        self.buffered[post_id] += 1
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            flush = asyncio.create_task(self._write(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+
+    async def _write(self, batch: dict[tuple[int, int], asyncio.Future]) -> None:
+        async with self._lock:
+            logger.debug(f"Writing {len(batch)} buffered likes")
+            try:
+                likes, counts = await write_likes(self.database, list(batch))
+            except Exception as e:
+                logger.error(f"Writing {len(batch)} buffered likes failed: {e}")
+                self._unbuffer(batch)
+                for future in batch.values():
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            self._unbuffer(batch)
+            added = Counter(post_id for (_, post_id), like in likes.items() if like.get("created"))
+            for post_id, like_count in counts.items():
+                await cache.post_liked(post_id, like_count, added[post_id])
+            for key, future in batch.items():
+                if future.done():
+                    continue
+                like = likes.get(key)
+                if like is None:
+                    future.set_exception(PostNotFoundError(f"Post {key[1]} not found"))
+                else:
+                    future.set_result(({"id": like["id"], "user_id": key[0], "post_id": key[1]}, like.get("created", False)))
+
+    def _unbuffer(self, batch: dict[tuple[int, int], asyncio.Future]) -> None:
+        self.buffered.subtract(post_id for _, post_id in batch)
+        self.buffered = +self.buffered
+
+    async def flush(self) -> None:
+        """Write everything buffered so far and wait for it."""
+        self._flush()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+async def find_like(database: Database, user_id: int, post_id: int) -> Optional[dict]:
+    like_id = await database.fetch_val(
+        sqlalchemy.select(like_table.c.id).where(like_table.c.user_id == user_id, like_table.c.post_id == post_id)
+    )
+    return None if like_id is None else {"id": like_id, "user_id": user_id, "post_id": post_id}
+
+
+async def write_likes(database: Database, keys: list[tuple[int, int]]) -> tuple[dict, dict[int, int]]:
+    """Insert the (user_id, post_id) likes that do not exist yet in one transaction.
+
+    Returns the like for every key whose post exists, marked "created" if it
+    was inserted now, and the new like count of every post that got likes.
+    """
+    post_ids = {post_id for _, post_id in keys}
+    async with database.transaction():
+        existing_posts = {
+            row.id
+            for row in await database.fetch_all(sqlalchemy.select(post_table.c.id).where(post_table.c.id.in_(post_ids)))
+        }
+        rows = [{"user_id": user_id, "post_id": post_id} for user_id, post_id in keys if post_id in existing_posts]
+        if not rows:
+            return {}, {}
+        # Skips likes already in the database, even ones another worker or
+        # /like/batch inserted after they were checked for in like()
+        inserted = await database.fetch_all(
+            insert_ignoring_conflicts(like_table)
+            .values(rows)
+            .returning(like_table.c.id, like_table.c.user_id, like_table.c.post_id)
+        )
+        likes = {(row.user_id, row.post_id): {"id": row.id, "created": True} for row in inserted}
+        existing = [(row["user_id"], row["post_id"]) for row in rows if (row["user_id"], row["post_id"]) not in likes]
+        if existing:
+            for row in await database.fetch_all(
+                sqlalchemy.select(like_table.c.id, like_table.c.user_id, like_table.c.post_id).where(
+                    sqlalchemy.tuple_(like_table.c.user_id, like_table.c.post_id).in_(existing)
+                )
+            ):
+                likes[(row.user_id, row.post_id)] = {"id": row.id}
+        if not inserted:
+            return likes, {}
+        increments = Counter(row.post_id for row in inserted)
+        updated = await database.fetch_all(
+            post_table.update()
+            .where(post_table.c.id.in_(increments))
+            .values(
+                like_count=increment_per_post(post_table.c.like_count, increments),
+                version=post_table.c.version + 1,
+            )
+            .returning(post_table.c.id, post_table.c.like_count)
+        )
+    return likes, {row.id: row.like_count for row in updated}
+
+
+@lru_cache()
+def like_buffer() -> LikeBuffer:
+    return LikeBuffer(database, interval=config.LIKE_FLUSH_INTERVAL_SECONDS, max_size=config.LIKE_FLUSH_MAX_SIZE)
+
+
+def buffered_likes(post_id: int) -> int:
+    """Likes on the post that are buffered but not written yet."""
+    if not config.LIKE_WRITE_BEHIND:
+        return 0
+    return like_buffer().buffered_likes(post_id)
+
+
+def with_buffered_likes(post: dict) -> dict:
+    pending = buffered_likes(post["id"])
+    return {**post, "likes": post["likes"] + pending} if pending else post
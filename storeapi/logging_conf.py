@@ -1,6 +1,9 @@
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
 from storeapi.config import DevConfig, config
+import atexit
 import logging
+import queue
 
 def obfuscated(email: str, obfuscated_length: int = 2) -> str:
     """Obfuscate an email address by replacing the local part with asterisks."""
@@ -23,11 +26,99 @@ class EmailObfuscationFilter(logging.Filter):
             record.email = obfuscated(record.email, self.obfuscated_length)
         return True
 
+class BoundedQueueHandler(QueueHandler):
+    """Hand records to a listener thread instead of formatting and writing them here.
+
+    When the queue is full, ``overflow`` decides what happens: "drop_new"
+    discards the record being logged, "drop_oldest" discards the oldest queued
+    record to make room and "block" waits for space. Dropped records are counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "drop_new") -> None:
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == "drop_oldest":
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+                try:
+                    self.queue.put_nowait(record)
+                    return
+                except queue.Full:
+                    pass
+            self.dropped += 1
+
+
+listeners: list[QueueListener] = []
+queue_handlers: list[BoundedQueueHandler] = []
+
+
+def start_queue_logging(logger_names: list[str]) -> None:
+    """Move the handlers of the given loggers behind queues served by listener threads.
+
+    Filters run on the logging thread, where correlation ids are available,
+    so they move from the handlers to the queue handler. Loggers sharing the
+    same handlers share one queue and listener.
+    """
+    handlers_queue: dict[tuple, BoundedQueueHandler] = {}
+    for name in logger_names:
+        target = logging.getLogger(name)
+        handlers = tuple(target.handlers)
+        if not handlers:
+            continue
+        if handlers not in handlers_queue:
+            queue_handler = BoundedQueueHandler(queue.Queue(config.LOG_QUEUE_SIZE), config.LOG_QUEUE_OVERFLOW)
+            queue_handler.setLevel(min(handler.level for handler in handlers))
+            for handler in handlers:
+                for handler_filter in handler.filters:
+                    if handler_filter not in queue_handler.filters:
+                        queue_handler.addFilter(handler_filter)
+            listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+            listener.start()
+            listeners.append(listener)
+            queue_handlers.append(queue_handler)
+            handlers_queue[handlers] = queue_handler
+        for handler in handlers:
+            target.removeHandler(handler)
+        target.addHandler(handlers_queue[handlers])
+    for handlers in handlers_queue:
+        for handler in handlers:
+            handler.filters.clear()
+
+
+def dropped_log_records() -> int:
+    return sum(queue_handler.dropped for queue_handler in queue_handlers)
+
+
+def stop_queue_logging() -> None:
+    """Flush queued records and stop the listener threads."""
+    dropped = dropped_log_records()
+    if dropped:
+        logging.getLogger(__name__).warning(f"Dropped {dropped} log records because the log queue was full")
+    while listeners:
+        listeners.pop().stop()
+    queue_handlers.clear()
+
+atexit.register(stop_queue_logging)
+
+
 handlers = ["default", "rotating_file"]
 if isinstance(config, DevConfig):
     handlers = ["default", "rotating_file"]
 
 def configure_logging() -> None:
+    stop_queue_logging()
     dictConfig(
         {
             "version": 1,
@@ -93,4 +184,6 @@ def configure_logging() -> None:
                 }
             }
         }
-    )
\ No newline at end of file
+    )
+    if config.LOG_QUEUE_ENABLED:
+        start_queue_logging(["uvicorn", "storeapi", "databases", "aiosqlite"])
@@ -1,55 +1,93 @@
+import asyncio
 import logging
-from fastapi import  FastAPI,HTTPException
+from fastapi import  FastAPI,HTTPException, status
+from fastapi.responses import JSONResponse
 from storeapi.routes.post import router as post_router
 from storeapi.routes.user import router as user_router
 from storeapi.routes.upload import router as upload_router
+from storeapi.routes.metrics import router as metrics_router
 from contextlib import asynccontextmanager
-from storeapi.database import database
-from storeapi.logging_conf import configure_logging
+from storeapi.database import database, pool_metrics, prepare_schema
+from storeapi.db_pool import PoolTimeoutError, prewarm_pools
+from storeapi.logging_conf import configure_logging, stop_queue_logging
+from storeapi.metrics import MetricsMiddleware, write_snapshots_forever
+from storeapi.query_log import QuerySamplingMiddleware
+from storeapi.replicas import ReadRoutingMiddleware
 from fastapi.exception_handlers import http_exception_handler
 from asgi_correlation_id import CorrelationIdMiddleware
 from storeapi.config import config
-import sentry_sdk
-
-
-sentry_sdk.init(
-    dsn=config.SENTRY_DSN,
-    # Add data like request headers and IP for users,
-    # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
-    send_default_pii=True,
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for tracing.
-    traces_sample_rate=1.0,
-    # Set profile_session_sample_rate to 1.0 to profile 100%
-    # of profile sessions.
-    profile_session_sample_rate=1.0,
-    # Set profile_lifecycle to "trace" to automatically
-    # run the profiler on when there is an active transaction
-    profile_lifecycle="trace",
-)
+from storeapi.hashing import hashing_pool
+from storeapi.http_client import get_http_client, close_http_client
+from storeapi.libs.b2.aio import shutdown_b2_executor
+from storeapi.security import user_cache
+from storeapi.upload_sessions import collect_abandoned_sessions_forever
+from storeapi.jobs import JobWorker
+from storeapi.tasks import email_batcher
+from storeapi.like_buffer import like_buffer
+from storeapi.tracing import init_sentry
+
 
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app:FastAPI):
+    # Kept out of module imports, so importing the app stays cheap
+    init_sentry()
     configure_logging()
+    prepare_schema()
     logger.info("Hello wolrd")
     await database.connect()
+    await prewarm_pools(database)
+    get_http_client()
+    upload_session_gc = asyncio.create_task(collect_abandoned_sessions_forever(database))
+    replica_health_checks = asyncio.create_task(database.check_replicas_forever())
+    metrics_snapshots = asyncio.create_task(write_snapshots_forever())
+    job_worker = JobWorker(database)
+    if config.JOB_WORKER_IN_APP:
+        job_worker.start()
     yield
+    await job_worker.stop()
+    await email_batcher().flush()
+    await like_buffer().flush()
+    upload_session_gc.cancel()
+    replica_health_checks.cancel()
+    metrics_snapshots.cancel()
+    # Writes the final snapshot as it stops
+    await asyncio.gather(metrics_snapshots, return_exceptions=True)
     await database.disconnect()
+    await close_http_client()
+    hashing_pool().shutdown()
+    shutdown_b2_executor()
+    logger.info("User cache stats", extra=user_cache.stats())
+    logger.info("Database pool stats", extra={name: metrics.stats() for name, metrics in pool_metrics.items()})
+    stop_queue_logging()
 
 
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(QuerySamplingMiddleware)
+app.add_middleware(ReadRoutingMiddleware, database=database)
 app.add_middleware(CorrelationIdMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(post_router, tags=["Post"])
 app.include_router(user_router, tags=["User"])
 app.include_router(upload_router, tags=["File Upload"])
+app.include_router(metrics_router, tags=["Metrics"])
 
 
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler_logging(request, exc):
     logger.error(f"HTTPException:{exc.status_code} {exc.detail}")
-    return await http_exception_handler(request=request, exc=exc) 
\ No newline at end of file
+    return await http_exception_handler(request=request, exc=exc)
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request, exc):
+    logger.error(str(exc))
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
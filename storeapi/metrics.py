@@ -0,0 +1,334 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional, Union
+from storeapi.config import config
+from storeapi.db_pool import Histogram as Buckets
+
+logger = logging.getLogger(__name__)
+
+# In-process metrics, served in the Prometheus text format at GET /metrics.
+#
+# Every worker process counts its own requests, queries and outbound calls.
+# With METRICS_DIR set, each worker writes a snapshot of its metrics there
+# every METRICS_WRITE_INTERVAL_SECONDS and when it stops, and /metrics adds up
+# the snapshots of all workers, so whichever worker answers a scrape reports
+# the whole server. Counters and histograms of workers that have exited stay
+# in the sums, so totals never go down; gauges only add up running workers.
+# As with prometheus_client's multiprocess mode, empty METRICS_DIR before
+# starting the server.
+#
+# Metrics can keep their own values, or read them from a collect callable
+# when scraped, for stats that are already kept elsewhere.
+
+REQUEST_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+OUTBOUND_SECONDS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED = "unmatched"
+BACKGROUND = "background"
+
+# Scope of the request being served, which routing fills in with its route
+request_scope: ContextVar[Optional[dict]] = ContextVar("metrics_request_scope", default=None)
+
+Labels = tuple[str, ...]
+Collect = Callable[[], dict[Labels, Any]]
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), collect: Optional[Collect] = None) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.collect = collect
+        self.values: dict[Labels, Any] = {}
+
+    def key(self, labels: dict[str, Any]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def sample(self, value: Any) -> Any:
+        return value
+
+    def snapshot(self) -> dict:
+        values = self.collect() if self.collect is not None else self.values
+        return {
+            "type": self.type,
+            "help": self.help,
+            "labelnames": list(self.labelnames),
+            "samples": [[list(labels), self.sample(value)] for labels, value in values.items()],
+        }
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self.key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = REQUEST_SECONDS_BUCKETS, collect: Optional[Collect] = None) -> None:
+        super().__init__(name, help, labelnames, collect)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        buckets = self.values.get(key)
+        if buckets is None:
+            buckets = self.values[key] = Buckets(self.buckets)
+        buckets.observe(value)
+
+    def sample(self, value: Buckets) -> dict:
+        return {"counts": list(value.counts), "sum": value.sum, "count": value.count}
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = (), collect: Optional[Collect] = None) -> Counter:
+        return self.register(Counter(name, help, labelnames, collect))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = (), collect: Optional[Collect] = None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, collect))
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = REQUEST_SECONDS_BUCKETS, collect: Optional[Collect] = None) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets, collect))
+
+    def snapshot(self) -> dict:
+        metrics = {}
+        for name, metric in self.metrics.items():
+            try:
+                metrics[name] = metric.snapshot()
+            except Exception as e:
+                logger.warning(f"Could not collect metric {name}: {e}")
+        return {"pid": os.getpid(), "metrics": metrics}
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "storeapi_http_requests_total", "HTTP requests served.", ("method", "route", "status")
+)
+http_request_seconds = registry.histogram(
+    "storeapi_http_request_duration_seconds", "Time to serve HTTP requests.", ("method", "route")
+)
+db_query_seconds = registry.histogram(
+    "storeapi_db_query_duration_seconds", "Time to run database queries, by the route that ran them.",
+    ("method", "route"), QUERY_SECONDS_BUCKETS,
+)
+db_query_errors = registry.counter(
+    "storeapi_db_query_errors_total", "Database queries that raised.", ("method", "route")
+)
+outbound_seconds = registry.histogram(
+    "storeapi_outbound_request_duration_seconds", "Time taken by calls to Mailgun, DeepAI and B2.",
+    ("service", "operation"), OUTBOUND_SECONDS_BUCKETS,
+)
+outbound_errors = registry.counter(
+    "storeapi_outbound_request_errors_total", "Calls to Mailgun, DeepAI and B2 that failed.", ("service", "operation")
+)
+jobs_running = registry.gauge("storeapi_jobs_running", "Background jobs running.", ("type",))
+
+
+def route_of(scope: dict) -> str:
+    return getattr(scope.get("route"), "path", UNMATCHED)
+
+
+def current_route() -> str:
+    """Path template of the route being served, for labelling what it does."""
+    scope = request_scope.get()
+    return BACKGROUND if scope is None else route_of(scope)
+
+
+@contextmanager
+def outbound_call(service: str, operation: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        outbound_errors.inc(service=service, operation=operation)
+        raise
+    finally:
+        outbound_seconds.observe(time.perf_counter() - start, service=service, operation=operation)
+
+
+class MetricsMiddleware:
+    """Count HTTP requests and time them, by route."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_scope.reset(token)
+            route = route_of(scope)
+            http_requests.inc(method=scope["method"], route=route, status=status)
+            http_request_seconds.observe(time.perf_counter() - start, method=scope["method"], route=route)
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge(snapshots: list[dict]) -> dict[str, dict]:
+    """Add up the metrics of several processes, skipping gauges of exited ones."""
+    merged: dict[str, dict] = {}
+    for snapshot in snapshots:
+        alive = snapshot["pid"] == os.getpid() or process_alive(snapshot["pid"])
+        for name, metric in snapshot["metrics"].items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            into = merged.setdefault(name, {**metric, "samples": {}})
+            for labels, value in metric["samples"]:
+                labels = tuple(labels)
+                into["samples"][labels] = add(into["samples"].get(labels), value)
+    return merged
+
+
+def add(total: Optional[Union[float, dict]], value: Union[float, dict]) -> Union[float, dict]:
+    if total is None:
+        return value
+    if isinstance(value, dict):
+        return {
+            "counts": [a + b for a, b in zip(total["counts"], value["counts"])],
+            "sum": total["sum"] + value["sum"],
+            "count": total["count"] + value["count"],
+        }
+    return total + value
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labelnames: list[str], labels: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render(metrics: dict[str, dict]) -> str:
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{format_labels(labelnames, labels)} {float(value)}")
+                continue
+            total = 0
+            for bound, count in zip([*metric["buckets"], "+Inf"], value["counts"]):
+                total += count
+                le = "+Inf" if bound == "+Inf" else float(bound)
+                bucket_labels = format_labels(labelnames, labels, f'le="{le}"')
+                lines.append(f"{name}_bucket{bucket_labels} {total}")
+            lines.append(f"{name}_sum{format_labels(labelnames, labels)} {float(value['sum'])}")
+            lines.append(f"{name}_count{format_labels(labelnames, labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot_path(pid: int) -> str:
+    return os.path.join(config.METRICS_DIR, f"metrics-{pid}.json")
+
+
+def write_snapshot() -> None:
+    path = snapshot_path(os.getpid())
+    # Written aside and moved into place, so readers never see half a file
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_snapshots() -> list[dict]:
+    """Snapshots other workers wrote to METRICS_DIR."""
+    snapshots = []
+    own = os.path.basename(snapshot_path(os.getpid()))
+    for name in os.listdir(config.METRICS_DIR):
+        if not name.endswith(".json") or name == own:
+            continue
+        try:
+            with open(os.path.join(config.METRICS_DIR, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read metrics snapshot {name}: {e}")
+    return snapshots
+
+
+async def write_snapshots_forever() -> None:
+    if not config.METRICS_DIR:
+        return
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    try:
+        while True:
+            await asyncio.to_thread(write_snapshot)
+            await asyncio.sleep(config.METRICS_WRITE_INTERVAL_SECONDS)
+    finally:
+        write_snapshot()
+
+
+def exposition(*extra: Metric) -> str:
+    """Metrics of every worker in the Prometheus text format.
+
+    extra metrics describe the whole server rather than this worker, so are
+    reported as they are instead of being added up across workers.
+    """
+    snapshots = [registry.snapshot()]
+    if config.METRICS_DIR:
+        snapshots += read_snapshots()
+    merged = merge(snapshots)
+    for metric in extra:
+        merged[metric.name] = merge([{"pid": os.getpid(), "metrics": {metric.name: metric.snapshot()}}])[metric.name]
+    return render(merged)
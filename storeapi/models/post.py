@@ -31,6 +31,9 @@ class UserPostWithComments(BaseModel):
     post: UserPostWithLikes
     comments: list[Comment]
     
+class UserPostWithCommentsPage(UserPostWithComments):
+    next_cursor: Optional[str] = None
+    
 class PostLikeIn(BaseModel):
     post_id: int
     
@@ -38,4 +41,14 @@ class PostLike(PostLikeIn):
     model_config = ConfigDict(from_attributes=True)
     
     id: int
-    user_id: int
\ No newline at end of file
+    user_id: int
+    
+class CommentBatchResult(BaseModel):
+    status: int
+    comment: Optional[Comment] = None
+    detail: Optional[str] = None
+    
+class PostLikeBatchResult(BaseModel):
+    status: int
+    like: Optional[PostLike] = None
+    detail: Optional[str] = None
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional
+from storeapi.config import config
+
+
+class UploadSessionIn(BaseModel):
+    file_name: str
+    size: int = Field(gt=0, le=config.UPLOAD_SESSION_MAX_SIZE)
+    content_type: Optional[str] = None
+    
+class UploadSession(UploadSessionIn):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: str
+    chunk_size: int
+    chunk_count: int
+    
+class UploadSessionStatus(UploadSession):
+    missing_chunks: list[int]
@@ -0,0 +1,113 @@
+import logging
+from typing import Optional
+from fastapi import HTTPException, Request, status
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Starlette parses a multipart body into UploadFiles before the route runs,
+# waiting for the whole body and spooling each file to a temporary file that
+# moves to disk past 1 MB. StreamedFile parses the body as it arrives instead,
+# handing out the data of one file field as soon as it is received. Only what
+# has been parsed but not read yet is held in memory, which is at most one
+# read() plus one network chunk, and nothing is written to disk.
+
+
+def bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+class StreamedFile:
+    """The file field of a multipart/form-data request, read while the body arrives."""
+
+    def __init__(self, request: Request, field_name: str = "file") -> None:
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise bad_request("Expected a multipart/form-data body")
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._stream = request.stream()
+        self._parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._buffer = bytearray()
+        self._in_file = False
+        self._file_done = False
+        self._body_done = False
+
+    async def open(self) -> "StreamedFile":
+        """Read the body up to the file's data, so its filename and content type are known."""
+        while self.filename is None:
+            if self._body_done:
+                raise bad_request(f"Missing file field {self.field_name}")
+            await self._feed()
+        return self
+
+    async def read(self, size: int = -1) -> bytes:
+        while not self._file_done and (size < 0 or len(self._buffer) < size):
+            if self._body_done:
+                raise bad_request("The request body ended in the middle of the file")
+            await self._feed()
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def _feed(self) -> None:
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            chunk = None
+        try:
+            if chunk is None:
+                self._body_done = True
+                self._parser.finalize()
+            elif chunk:
+                self._parser.write(chunk)
+        except MultipartParseError as e:
+            raise bad_request(f"Invalid multipart body: {e}")
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        # Only the first file of the field, like a single UploadFile parameter
+        if name == self.field_name and b"filename" in options and self.filename is None:
+            self._in_file = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            content_type = self._headers.get(b"content-type")
+            self.content_type = content_type.decode("latin-1") if content_type else None
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._buffer += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._in_file:
+            self._in_file = False
+            self._file_done = True
@@ -0,0 +1,34 @@
+import base64
+import binascii
+import json
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def invalid_cursor_exception() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def encode_cursor(scope: str, **position: int) -> str:
+    """Encode the sort key of the last row on a page into an opaque cursor."""
+    raw = json.dumps({"s": scope, **position}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, scope: str, *keys: str) -> dict[str, int]:
+    """Decode a cursor made by encode_cursor, checking it belongs to the same listing."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError) as e:
+        raise invalid_cursor_exception() from e
+    if not isinstance(payload, dict) or payload.get("s") != scope:
+        raise invalid_cursor_exception()
+    position = {key: payload.get(key) for key in keys}
+    if not all(type(value) is int for value in position.values()):
+        raise invalid_cursor_exception()
+    return position
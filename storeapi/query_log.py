@@ -0,0 +1,104 @@
+import logging
+import random
+import time
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Awaitable, Callable, Optional
+import databases
+from storeapi.config import config
+from storeapi.metrics import current_route, db_query_errors, db_query_seconds
+
+logger = logging.getLogger("storeapi.sql")
+
+# Every query the app runs goes through QueryLoggingDatabase, which times it
+# for the storeapi_db_query_* metrics. Unless the storeapi.sql logger is at
+# DEBUG or the current request was picked for tracing, that is all it costs on
+# top of running the query: the SQL is not compiled and no message is built.
+#
+# QuerySamplingMiddleware traces a SQL_TRACE_SAMPLE_RATE share of requests.
+# Their queries are logged at INFO, so they show up in production logs.
+
+sampled: ContextVar[bool] = ContextVar("sql_trace_sampled", default=False)
+
+REDACTED = "***"
+REDACTED_PARAMS = ("password",)
+
+
+def tracing() -> bool:
+    return sampled.get() or logger.isEnabledFor(logging.DEBUG)
+
+
+def compile_query(query: Any, dialect: Any) -> tuple[str, dict]:
+    if isinstance(query, str):
+        return query, {}
+    compiled = query.compile(dialect=dialect)
+    return str(compiled), dict(compiled.params)
+
+
+def redacted(params: Optional[dict]) -> dict:
+    return {
+        name: REDACTED if any(secret in name for secret in REDACTED_PARAMS) else value
+        for name, value in (params or {}).items()
+    }
+
+
+class QueryLoggingDatabase(databases.Database):
+    """Database that times every query, and logs compiled SQL, bind parameters and timing when tracing."""
+
+    async def _timed(self, method: str, run: Callable[..., Awaitable[Any]], query: Any, values: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await run(query, values)
+        except Exception:
+            db_query_errors.inc(method=method, route=current_route())
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            db_query_seconds.observe(duration, method=method, route=current_route())
+            if tracing():
+                self._log(query, values, duration * 1000)
+
+    def _log(self, query: Any, values: Any, duration_ms: float) -> None:
+        level = logging.INFO if sampled.get() else logging.DEBUG
+        sql, params = compile_query(query, getattr(self._backend, "_dialect", None))
+        if isinstance(values, dict):
+            params.update(values)
+        logger.log(
+            level,
+            "Query took %.2f ms: %s",
+            duration_ms,
+            sql,
+            extra={"params": redacted(params), "duration_ms": duration_ms},
+        )
+
+    async def fetch_all(self, query, values=None):
+        return await self._timed("fetch_all", super().fetch_all, query, values)
+
+    async def fetch_one(self, query, values=None):
+        return await self._timed("fetch_one", super().fetch_one, query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        return await self._timed("fetch_val", partial(super().fetch_val, column=column), query, values)
+
+    async def execute(self, query, values=None):
+        return await self._timed("execute", super().execute, query, values)
+
+    async def execute_many(self, query, values):
+        return await self._timed("execute_many", super().execute_many, query, values)
+
+
+class QuerySamplingMiddleware:
+    """Trace the queries of a SQL_TRACE_SAMPLE_RATE share of requests."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        rate = config.SQL_TRACE_SAMPLE_RATE
+        if scope["type"] != "http" or not rate or random.random() >= rate:
+            return await self.app(scope, receive, send)
+        token = sampled.set(True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampled.reset(token)
@@ -0,0 +1,132 @@
+import asyncio
+import itertools
+import logging
+from contextvars import ContextVar
+from typing import Optional
+from storeapi.cache import TTLCache
+from storeapi.config import config
+from storeapi.query_log import QueryLoggingDatabase
+
+logger = logging.getLogger(__name__)
+
+# With DATABASE_REPLICA_URLS set, reads made while serving GET and HEAD
+# requests go to a healthy replica and everything else goes to the primary.
+#
+# ReadRoutingMiddleware decides per request. A client that sent a write
+# request reads from the primary for DATABASE_READ_YOUR_WRITES_SECONDS after
+# it, so it sees its own writes despite replication lag. Clients are told apart
+# by their Authorization header, which every write route requires.
+#
+# Replicas are checked every DATABASE_REPLICA_HEALTH_CHECK_INTERVAL_SECONDS.
+# A replica that fails a check or a query is skipped until it passes a check
+# again; with no healthy replica left, reads go to the primary.
+
+use_replica: ContextVar[bool] = ContextVar("use_replica", default=False)
+# Set for reads kept on the primary because the client wrote recently
+reading_own_writes: ContextVar[bool] = ContextVar("reading_own_writes", default=False)
+
+READ_METHODS = ("GET", "HEAD")
+HEALTH_CHECK_QUERY = "SELECT 1"
+
+
+class RoutingDatabase(QueryLoggingDatabase):
+    """Primary database that hands reads to replicas when the request allows it."""
+
+    def __init__(self, url: str, replica_urls: Optional[list[str]] = None, **options) -> None:
+        super().__init__(url, **options)
+        replica_options = {name: value for name, value in options.items() if name != "force_rollback"}
+        self.replicas = [QueryLoggingDatabase(replica_url, **replica_options) for replica_url in replica_urls or []]
+        self.healthy = {replica: False for replica in self.replicas}
+        self.sticky = TTLCache(maxsize=config.DATABASE_STICKY_CLIENTS, ttl=config.DATABASE_READ_YOUR_WRITES_SECONDS)
+        self._next_replica = itertools.cycle(self.replicas)
+
+    async def connect(self) -> None:
+        await super().connect()
+        for replica in self.replicas:
+            try:
+                await replica.connect()
+            except Exception as e:
+                logger.warning(f"Could not connect to replica {replica.url!r}: {e}")
+                continue
+            self.healthy[replica] = True
+
+    async def disconnect(self) -> None:
+        for replica in self.replicas:
+            if replica.is_connected:
+                await replica.disconnect()
+        await super().disconnect()
+
+    def replica(self) -> Optional[QueryLoggingDatabase]:
+        """Pick the next healthy replica, if the current request may read from one."""
+        if not self.replicas or not use_replica.get():
+            return None
+        for _ in range(len(self.replicas)):
+            replica = next(self._next_replica)
+            if self.healthy[replica]:
+                return replica
+        return None
+
+    async def _read(self, method: str, query, values, *args):
+        replica = self.replica()
+        if replica is not None:
+            try:
+                return await getattr(replica, method)(query, values, *args)
+            except Exception as e:
+                logger.warning(f"Read from replica {replica.url!r} failed, using the primary: {e}")
+                self.healthy[replica] = False
+        return await getattr(super(), method)(query, values, *args)
+
+    async def fetch_all(self, query, values=None):
+        return await self._read("fetch_all", query, values)
+
+    async def fetch_one(self, query, values=None):
+        return await self._read("fetch_one", query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        return await self._read("fetch_val", query, values, column)
+
+    async def check_replicas(self) -> None:
+        for replica in self.replicas:
+            try:
+                if not replica.is_connected:
+                    await replica.connect()
+                await asyncio.wait_for(replica.fetch_val(HEALTH_CHECK_QUERY), config.DATABASE_REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS)
+            except Exception as e:
+                if self.healthy[replica]:
+                    logger.warning(f"Replica {replica.url!r} failed its health check: {e}")
+                self.healthy[replica] = False
+            else:
+                if not self.healthy[replica]:
+                    logger.info(f"Replica {replica.url!r} is healthy")
+                self.healthy[replica] = True
+
+    async def check_replicas_forever(self) -> None:
+        if not self.replicas:
+            return
+        while True:
+            await asyncio.sleep(config.DATABASE_REPLICA_HEALTH_CHECK_INTERVAL_SECONDS)
+            await self.check_replicas()
+
+
+class ReadRoutingMiddleware:
+    """Let reads of GET and HEAD requests use replicas, unless the client wrote recently."""
+
+    def __init__(self, app, database: RoutingDatabase) -> None:
+        self.app = app
+        self.database = database
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not self.database.replicas:
+            return await self.app(scope, receive, send)
+        client = dict(scope["headers"]).get(b"authorization")
+        if scope["method"] not in READ_METHODS:
+            # Marked before the write happens, so no later read can beat it
+            if client:
+                self.database.sticky.set(client, True)
+            return await self.app(scope, receive, send)
+        routing = reading_own_writes if client and client in self.database.sticky else use_replica
+        token = routing.set(True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            routing.reset(token)
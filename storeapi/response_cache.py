@@ -0,0 +1,194 @@
+import logging
+import math
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Iterable, Optional, Protocol
+from storeapi.cache import TTLCache
+from storeapi.config import config
+from storeapi.replicas import reading_own_writes, use_replica
+
+logger = logging.getLogger(__name__)
+
+# Read-through cache for GET /post and GET /post/{post_id}.
+#
+# Entries are keyed by route, sorting and page and tagged with what a write
+# could change about them, so each write drops only the entries it affects:
+#
+#   post:{id}                     every entry showing that post
+#   comments:{id}                 post details showing that post's comments
+#   posts:new:head                the first page of newest posts
+#   posts:old:tail                the last page of oldest posts
+#   posts:most_likes:likes:{n}    most_likes pages showing a post with n likes
+#   posts:most_likes:tail         the last most_likes page
+#
+# Pages are keyset paginated, so a post added or moved only changes the page
+# holding the row after its new position: a new post lands on the head of
+# "new", the tail of "old" and next to the other posts without likes in
+# "most_likes", and a post going from n - k to n likes lands next to posts
+# with between n - k and n likes.
+#
+# The in-process backend only sees invalidations made in this process; the
+# TTL bounds how stale other workers, and a job worker running on its own,
+# can get. A shared backend implementing CacheBackend removes that limit.
+#
+# With read replicas, a replica may not have the write behind an invalidation
+# yet, and whatever is loaded then would be served until the TTL runs out. So
+# for DATABASE_READ_YOUR_WRITES_SECONDS after an invalidation, entries are
+# loaded from the primary.
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[Any]: ...
+
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None: ...
+
+    async def delete(self, key: str) -> None: ...
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> None: ...
+
+    async def clear(self) -> None: ...
+
+
+class MemoryCacheBackend:
+    """CacheBackend keeping entries in a TTLCache with an index from tags to keys."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.entries = TTLCache(maxsize, ttl)
+        self.tags: defaultdict[str, set[str]] = defaultdict(set)
+        self._tagged = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: Any, tags: Iterable[str]) -> None:
+        self.entries.set(key, value)
+        for tag in tags:
+            self.tags[tag].add(key)
+            self._tagged += 1
+        # Evicted and expired keys stay in the index until it grows too big
+        if self._tagged > 4 * max(self.entries.maxsize, 1):
+            self._prune()
+
+    def _prune(self) -> None:
+        for tag in list(self.tags):
+            keys = {key for key in self.tags[tag] if key in self.entries}
+            if keys:
+                self.tags[tag] = keys
+            else:
+                del self.tags[tag]
+        self._tagged = sum(len(keys) for keys in self.tags.values())
+
+    async def delete(self, key: str) -> None:
+        self.entries.delete(key)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            for key in self.tags.pop(tag, ()):
+                self.entries.delete(key)
+
+    async def clear(self) -> None:
+        self.entries.clear()
+        self.tags.clear()
+        self._tagged = 0
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend) -> None:
+        self.backend = backend
+        self.generation = 0
+        self.invalidated_at = -math.inf
+
+    async def load(self, key: str, loader: Callable[[], Awaitable[tuple[Any, Iterable[str]]]]) -> Any:
+        """Return the cached value for key, or load, cache and return it.
+
+        loader returns the value and its tags. The value is not cached when
+        anything was invalidated while it loaded, since it may already be stale.
+        Clients reading their own writes skip cached values, which may have
+        been loaded from a lagging replica.
+        """
+        value = None if reading_own_writes.get() else await self.backend.get(key)
+        if value is not None:
+            return value
+        generation = self.generation
+        recent = time.monotonic() - self.invalidated_at < config.DATABASE_READ_YOUR_WRITES_SECONDS
+        token = use_replica.set(False) if recent else None
+        try:
+            value, tags = await loader()
+        finally:
+            if token is not None:
+                use_replica.reset(token)
+        if generation == self.generation:
+            await self.backend.set(key, value, tags)
+        return value
+
+    def _invalidated(self) -> None:
+        self.generation += 1
+        self.invalidated_at = time.monotonic()
+
+    async def delete(self, key: str) -> None:
+        self._invalidated()
+        await self.backend.delete(key)
+
+    async def invalidate_tags(self, *tags: str) -> None:
+        self._invalidated()
+        await self.backend.invalidate_tags(tags)
+
+    async def clear(self) -> None:
+        self._invalidated()
+        await self.backend.clear()
+
+
+response_cache = ResponseCache(
+    MemoryCacheBackend(maxsize=config.RESPONSE_CACHE_SIZE, ttl=config.RESPONSE_CACHE_TTL_SECONDS)
+)
+
+
+def posts_page_key(sorting: str, limit: int, cursor: Optional[str]) -> str:
+    return f"GET /post?sorting={sorting}&limit={limit}&cursor={cursor or ''}"
+
+
+def post_key(post_id: int, comment_limit: int) -> str:
+    return f"GET /post/{post_id}?comment_limit={comment_limit}"
+
+
+def post_tag(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+def comments_tag(post_id: int) -> str:
+    return f"comments:{post_id}"
+
+
+def likes_tag(likes: int) -> str:
+    return f"posts:most_likes:likes:{likes}"
+
+
+def posts_page_tags(sorting: str, posts: list[dict], cursor: Optional[str], next_cursor: Optional[str]) -> set[str]:
+    tags = {post_tag(post["id"]) for post in posts}
+    if sorting == "new" and cursor is None:
+        tags.add("posts:new:head")
+    elif sorting == "old" and next_cursor is None:
+        tags.add("posts:old:tail")
+    elif sorting == "most_likes":
+        tags.update(likes_tag(post["likes"]) for post in posts)
+        if next_cursor is None:
+            tags.add("posts:most_likes:tail")
+    return tags
+
+
+async def post_created() -> None:
+    await response_cache.invalidate_tags("posts:new:head", "posts:old:tail", "posts:most_likes:tail", likes_tag(0))
+
+
+async def post_changed(post_id: int) -> None:
+    await response_cache.invalidate_tags(post_tag(post_id))
+
+
+async def post_commented(post_id: int) -> None:
+    await response_cache.invalidate_tags(comments_tag(post_id))
+
+
+async def post_liked(post_id: int, likes: int, added: int = 1) -> None:
+    await response_cache.invalidate_tags(
+        post_tag(post_id), *(likes_tag(count) for count in range(likes - added, likes + 1))
+    )
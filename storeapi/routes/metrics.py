@@ -0,0 +1,89 @@
+import logging
+from fastapi import APIRouter, Response
+from storeapi import jobs, metrics
+from storeapi.database import database, pool_metrics
+from storeapi.db_pool import ACQUIRE_SECONDS_BUCKETS
+from storeapi.libs.b2.aio import b2_metrics
+from storeapi.like_buffer import like_buffer
+from storeapi.metrics import registry
+from storeapi.response_cache import MemoryCacheBackend, response_cache
+from storeapi.security import user_cache
+from storeapi.tasks import email_batcher
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def cache_stats() -> dict[str, dict[str, int]]:
+    """Stats of the in-process caches, by cache."""
+    stats = {"user": user_cache.stats()}
+    # A shared backend keeps its own stats
+    if isinstance(response_cache.backend, MemoryCacheBackend):
+        stats["response"] = response_cache.backend.entries.stats()
+    return stats
+
+
+# Stats kept elsewhere, read when they are scraped. See storeapi.metrics.
+
+registry.gauge(
+    "storeapi_db_pool_connections", "Database connections in use or idle.", ("pool", "state"),
+    collect=lambda: {
+        (pool, state): stats[state]
+        for pool, stats in ((pool, tracked.stats()) for pool, tracked in pool_metrics.items())
+        for state in ("in_use", "idle")
+    },
+)
+registry.gauge(
+    "storeapi_db_pool_waiters", "Requests waiting for a database connection.", ("pool",),
+    collect=lambda: {(pool,): tracked.waiters for pool, tracked in pool_metrics.items()},
+)
+registry.counter(
+    "storeapi_db_pool_timeouts_total", "Requests that gave up waiting for a database connection.", ("pool",),
+    collect=lambda: {(pool,): tracked.timeouts for pool, tracked in pool_metrics.items()},
+)
+registry.histogram(
+    "storeapi_db_pool_acquire_duration_seconds", "Time to get a database connection.", ("pool",),
+    ACQUIRE_SECONDS_BUCKETS,
+    collect=lambda: {(pool,): tracked.acquire_seconds for pool, tracked in pool_metrics.items()},
+)
+registry.gauge(
+    "storeapi_b2_in_flight", "B2 calls running.", ("operation",),
+    collect=lambda: {(operation,): count for operation, count in b2_metrics.in_flight.items()},
+)
+registry.counter(
+    "storeapi_b2_timeouts_total", "B2 calls that timed out.", ("operation",),
+    collect=lambda: {(operation,): count for operation, count in b2_metrics.timeouts.items()},
+)
+registry.counter(
+    "storeapi_cache_hits_total", "Lookups answered from an in-process cache.", ("cache",),
+    collect=lambda: {(cache,): stats["hits"] for cache, stats in cache_stats().items()},
+)
+registry.counter(
+    "storeapi_cache_misses_total", "Lookups an in-process cache could not answer.", ("cache",),
+    collect=lambda: {(cache,): stats["misses"] for cache, stats in cache_stats().items()},
+)
+registry.gauge(
+    "storeapi_cache_entries", "Entries held by an in-process cache, expired or not.", ("cache",),
+    collect=lambda: {(cache,): stats["size"] for cache, stats in cache_stats().items()},
+)
+registry.gauge(
+    "storeapi_like_buffer_pending", "Likes waiting to be written by the write-behind buffer.",
+    collect=lambda: {(): like_buffer().pending()},
+)
+registry.gauge(
+    "storeapi_email_batch_pending", "Emails waiting for their batch to be sent.",
+    collect=lambda: {(): email_batcher().pending()},
+)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    # Counted in the database, so the same for every worker
+    jobs_pending = metrics.Gauge("storeapi_jobs_pending", "Background jobs waiting to run.", ("type",))
+    try:
+        for job_type, count in (await jobs.pending_counts(database)).items():
+            jobs_pending.set(count, type=job_type)
+    except Exception as e:
+        logger.warning(f"Could not count pending jobs: {e}")
+    return Response(metrics.exposition(jobs_pending), media_type=metrics.CONTENT_TYPE)
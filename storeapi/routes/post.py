@@ -1,45 +1,58 @@
-from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks, Request
-from storeapi.models.post import UserPost, UserPostIn, Comment, CommentIn, UserPostWithComments, PostLike, PostLikeIn, UserPostWithLikes
-from storeapi.database import database, post_table, comment_table, like_table
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Response, Query, Body
+from storeapi.models.post import UserPost, UserPostIn, Comment, CommentIn, UserPostWithComments, UserPostWithCommentsPage, PostLike, PostLikeIn, UserPostWithLikes, CommentBatchResult, PostLikeBatchResult
+from storeapi.database import database, post_table, comment_table, like_table, insert_ignoring_conflicts
 import logging
 from storeapi.models.user import User
 from storeapi.security import get_current_user, oauth2_scheme
-from typing import Annotated
+from typing import Annotated, Optional
 import sqlalchemy
 from enum import Enum
-from storeapi.tasks import generate_and_add_to_post
+from storeapi import jobs
+from storeapi.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+from storeapi import response_cache as cache
+from storeapi.response_cache import response_cache
+from storeapi.etag import if_none_match, not_modified, post_etag
+from storeapi.config import config
+from storeapi.counters import increment_per_post
+from storeapi.like_buffer import PostNotFoundError, buffered_likes, like_buffer, with_buffered_likes
 
 router = APIRouter()
 
 
 logger = logging.getLogger(__name__)
 
-select_post_and_likes = sqlalchemy.select(
-    post_table, sqlalchemy.func.count(like_table.c.id).label("likes")
-).select_from(post_table.outerjoin(like_table)).group_by(post_table.c.id)
+select_post_and_likes = sqlalchemy.select(post_table, post_table.c.like_count.label("likes"))
 
+MAX_BATCH_SIZE = 100
 
-async def find_post(post_id: int):
-    logger.info(f"Finding post with ID: {post_id}")
-    query = post_table.select().where(post_table.c.id == post_id)
-    logger.debug(query)
-    return await database.fetch_one(query)
+
+async def find_post_version(post_id: int) -> Optional[int]:
+    query = sqlalchemy.select(post_table.c.version).where(post_table.c.id == post_id)
+    return await database.fetch_val(query)
+
+
+def post_not_found_exception() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
 
 @router.post("/post", response_model=UserPost, status_code=status.HTTP_201_CREATED)
-async def create_post(post: UserPostIn, current_user: Annotated[User, Depends(get_current_user)], background_tasks:BackgroundTasks, request: Request,prompt: str = None):
+async def create_post(post: UserPostIn, current_user: Annotated[User, Depends(get_current_user)], request: Request,prompt: str = None):
     data = {**post.model_dump(), "user_id": current_user.id}
     query = post_table.insert().values(data)
-    last_record_id = await database.execute(query)
-    
-    if prompt:
-        background_tasks.add_task(
-            generate_and_add_to_post,
-            current_user.email,
-            last_record_id,
-            request.url_for("get_post_with_comment", post_id=last_record_id),
-            database,
-            prompt
-        )
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        
+        if prompt:
+            await jobs.enqueue(
+                database,
+                jobs.GENERATE_IMAGE,
+                {
+                    "email": current_user.email,
+                    "post_id": last_record_id,
+                    "post_url": str(request.url_for("get_post_with_comment", post_id=last_record_id)),
+                    "prompt": prompt,
+                },
+            )
+    await cache.post_created()
     
     return {**data, "id": last_record_id}
 
@@ -49,63 +62,382 @@ class PostSorting(str, Enum):
     most_likes = "most_likes"
     
 
-@router.get("/post", response_model=list[UserPostWithLikes])
-async def get_posts(sorting: PostSorting = PostSorting.new):
-    logger.info("Getting all posts")
+def select_posts_page(sorting: PostSorting, limit: int, cursor: Optional[str] = None):
+    """Build a keyset-paginated posts query, fetching one extra row to detect the next page."""
+    query = select_post_and_likes
     
     if sorting == PostSorting.new:
-        query = select_post_and_likes.order_by(post_table.c.id.desc())
+        if cursor:
+            position = decode_cursor(cursor, sorting.value, "id")
+            query = query.where(post_table.c.id < position["id"])
+        query = query.order_by(post_table.c.id.desc())
     elif sorting == PostSorting.old:
-        query = select_post_and_likes.order_by(post_table.c.id.asc())
+        if cursor:
+            position = decode_cursor(cursor, sorting.value, "id")
+            query = query.where(post_table.c.id > position["id"])
+        query = query.order_by(post_table.c.id.asc())
     elif sorting == PostSorting.most_likes:
-        query = select_post_and_likes.order_by(sqlalchemy.desc("likes"))
+        if cursor:
+            position = decode_cursor(cursor, sorting.value, "likes", "id")
+            query = query.where(
+                sqlalchemy.or_(
+                    post_table.c.like_count < position["likes"],
+                    sqlalchemy.and_(post_table.c.like_count == position["likes"], post_table.c.id < position["id"]),
+                )
+            )
+        # Ties on likes are broken by id so every post has a unique position
+        query = query.order_by(post_table.c.like_count.desc(), post_table.c.id.desc())
         
-    logger.debug(query)
+    return query.limit(limit + 1)
+
+
+def next_posts_cursor(sorting: PostSorting, last_post) -> str:
+    if sorting == PostSorting.most_likes:
+        return encode_cursor(sorting.value, likes=last_post.likes, id=last_post.id)
+    return encode_cursor(sorting.value, id=last_post.id)
+    
+
+@router.get("/post", response_model=list[UserPostWithLikes])
+async def get_posts(
+    response: Response,
+    sorting: PostSorting = PostSorting.new,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    logger.info("Getting all posts")
+    
+    async def load_page():
+        query = select_posts_page(sorting, limit, cursor)
+        posts = await database.fetch_all(query)
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            next_cursor = next_posts_cursor(sorting, posts[-1])
+        page = {"posts": [dict(post._mapping) for post in posts], "next_cursor": next_cursor}
+        return page, cache.posts_page_tags(sorting.value, page["posts"], cursor, next_cursor)
     
-    return await database.fetch_all(query)
+    page = await response_cache.load(cache.posts_page_key(sorting.value, limit, cursor), load_page)
+    if page["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+    
+    return [with_buffered_likes(post) for post in page["posts"]]
 
 
 @router.post("/comment", response_model=Comment, status_code=status.HTTP_201_CREATED)
 async def create_comment(comment:CommentIn,current_user: Annotated[User, Depends(get_current_user)]):
-
-    post = await find_post(comment.post_id)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    
     data = {**comment.model_dump(), "user_id": current_user.id}
-    query = comment_table.insert().values(data)
-    last_record_id = await database.execute(query)
+    # Inserts nothing when the post does not exist, so no separate lookup is needed
+    query = (
+        comment_table.insert()
+        .from_select(
+            ["body", "post_id", "user_id"],
+            sqlalchemy.select(
+                sqlalchemy.literal(comment.body), post_table.c.id, sqlalchemy.literal(current_user.id)
+            ).where(post_table.c.id == comment.post_id),
+        )
+        .returning(comment_table.c.id)
+    )
+    async with database.transaction():
+        last_record_id = await database.fetch_val(query)
+        if last_record_id is None:
+            raise post_not_found_exception()
+        await database.execute(
+            post_table.update()
+            .where(post_table.c.id == comment.post_id)
+            .values(comment_count=post_table.c.comment_count + 1, version=post_table.c.version + 1)
+        )
+    await cache.post_commented(comment.post_id)
     return {**data, "id": last_record_id}
 
-@router.get("/post/{post_id}/comment", response_model=list[Comment])
-async def get_comments_on_post(post_id: int):
+async def find_existing_post_ids(post_ids) -> set[int]:
+    query = sqlalchemy.select(post_table.c.id).where(post_table.c.id.in_(set(post_ids)))
+    return {row.id for row in await database.fetch_all(query)}
+
+
+@router.get("/post/batch", response_model=list[UserPostWithCommentsPage])
+async def get_posts_batch(
+    ids: Annotated[list[int], Query(min_length=1, max_length=MAX_BATCH_SIZE)],
+    comment_limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+):
+    """Fetch posts with their likes and first page of comments in two queries. Missing posts are left out.
+
+    Each post's next_cursor pages through the rest of its comments with /post/{post_id}/comment.
+    """
+    ids = list(dict.fromkeys(ids))
+    posts = await database.fetch_all(select_post_and_likes.where(post_table.c.id.in_(ids)))
+    # Numbers each post's comments, so one query fetches a page of each
+    position = sqlalchemy.func.row_number().over(partition_by=comment_table.c.post_id, order_by=comment_table.c.id)
+    numbered = (
+        sqlalchemy.select(comment_table, position.label("position"))
+        .where(comment_table.c.post_id.in_(ids))
+        .subquery()
+    )
+    comments = await database.fetch_all(
+        sqlalchemy.select(*(numbered.c[column.name] for column in comment_table.columns))
+        .where(numbered.c.position <= comment_limit + 1)
+        .order_by(numbered.c.id)
+    )
+    comments_by_post: dict[int, list] = {post_id: [] for post_id in ids}
+    for comment in comments:
+        comments_by_post[comment.post_id].append(dict(comment._mapping))
+    posts_by_id = {post.id: post for post in posts}
+    results = []
+    for post_id in ids:
+        if post_id not in posts_by_id:
+            continue
+        page, next_cursor = comments_page(comments_by_post[post_id], comment_limit)
+        results.append({
+            "post": with_buffered_likes(dict(posts_by_id[post_id]._mapping)),
+            "comments": page,
+            "next_cursor": next_cursor,
+        })
+    return results
+
+
+def select_comments_page(post_id: int, limit: int, cursor: Optional[str] = None):
+    """Build a keyset-paginated query for a post's comments, oldest first, fetching one extra row."""
     query = comment_table.select().where(comment_table.c.post_id == post_id)
-    logger.debug(query)
-    return await database.fetch_all(query)
+    if cursor:
+        position = decode_cursor(cursor, "comments", "id")
+        query = query.where(comment_table.c.id > position["id"])
+    return query.order_by(comment_table.c.id).limit(limit + 1)
+
+
+def select_post_with_comments_page(post_id: int, limit: int):
+    """Build one query for a post, its like count and its first page of comments.
+
+    Every row carries the post; a post without comments comes back as a single
+    row with no comment.
+    """
+    comments = select_comments_page(post_id, limit).subquery()
+    return (
+        sqlalchemy.select(
+            post_table,
+            post_table.c.like_count.label("likes"),
+            comments.c.id.label("comment_id"),
+            comments.c.body.label("comment_body"),
+            comments.c.user_id.label("comment_user_id"),
+        )
+        .select_from(post_table.outerjoin(comments, comments.c.post_id == post_table.c.id))
+        .where(post_table.c.id == post_id)
+        .order_by(comments.c.id)
+    )
+
+
+def comments_page(comments: list, limit: int) -> tuple[list, Optional[str]]:
+    if len(comments) > limit:
+        comments = comments[:limit]
+        return comments, encode_cursor("comments", id=comments[-1]["id"])
+    return comments, None
+
+
+@router.get("/post/{post_id}/comment", response_model=list[Comment])
+async def get_comments_on_post(
+    post_id: int,
+    request: Request,
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    version = await find_post_version(post_id)
+    if version is None:
+        return []
+    etag = post_etag("comments", post_id, version)
+    if if_none_match(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    
+    comments = await database.fetch_all(select_comments_page(post_id, limit, cursor))
+    comments, next_cursor = comments_page([dict(comment._mapping) for comment in comments], limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return comments
 
 
 @router.get("/post/{post_id}", response_model=UserPostWithComments)
-async def get_post_with_comment(post_id: int):
+async def get_post_with_comment(
+    post_id: int,
+    request: Request,
+    response: Response,
+    comment_limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+):
+    """Return a post with its first page of comments; the rest are paged through /post/{post_id}/comment."""
     logger.info("Getting post with ID")
-    query = select_post_and_likes.where(post_table.c.id == post_id)
-    logger.debug(query)
-    post = await database.fetch_one(query)
-    if not post:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
-    return {
-        "post": post,
-        "comments": await get_comments_on_post(post_id)
-    }
+    
+    async def load_post():
+        rows = await database.fetch_all(select_post_with_comments_page(post_id, comment_limit))
+        if not rows:
+            raise post_not_found_exception()
+        post = {column.name: rows[0][column.name] for column in post_table.columns}
+        post["likes"] = rows[0].likes
+        comments = [
+            {"id": row.comment_id, "body": row.comment_body, "post_id": post_id, "user_id": row.comment_user_id}
+            for row in rows
+            if row.comment_id is not None
+        ]
+        comments, next_cursor = comments_page(comments, comment_limit)
+        detail = {"post": post, "comments": comments}
+        return {"detail": detail, "next_cursor": next_cursor}, [cache.post_tag(post_id), cache.comments_tag(post_id)]
+    
+    # The version comes with the post, cached or loaded in the one query, so
+    # checking the ETag costs no query of its own
+    cached = await response_cache.load(cache.post_key(post_id, comment_limit), load_post)
+    detail = cached["detail"]
+    etag = post_etag("post", post_id, detail["post"]["version"], buffered_likes(post_id))
+    if if_none_match(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    if cached["next_cursor"]:
+        response.headers[NEXT_CURSOR_HEADER] = cached["next_cursor"]
+    return {**detail, "post": with_buffered_likes(detail["post"])}
     
 @router.post("/like", status_code=status.HTTP_201_CREATED, response_model=PostLike)
-async def get_likes_on_post(like:PostLikeIn, current_user: Annotated[User, Depends(get_current_user)]):
+async def get_likes_on_post(like:PostLikeIn, current_user: Annotated[User, Depends(get_current_user)], response: Response):
+    """Like a post. Liking it again returns the existing like with a 200."""
     logger.info("Liking post")
-    post = await find_post(like.post_id)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
+    if config.LIKE_WRITE_BEHIND:
+        try:
+            stored, created = await like_buffer().like(current_user.id, like.post_id)
+        except PostNotFoundError as e:
+            raise post_not_found_exception() from e
+        if not created:
+            response.status_code = status.HTTP_200_OK
+        return stored
     data = {**like.model_dump(), "user_id": current_user.id}
-    query = like_table.insert().values(data)
-    logger.debug(query)
+    # Inserts nothing when the post does not exist or the user already liked it
+    query = (
+        insert_ignoring_conflicts(like_table)
+        .from_select(
+            ["user_id", "post_id"],
+            sqlalchemy.select(sqlalchemy.literal(current_user.id), post_table.c.id).where(post_table.c.id == like.post_id),
+        )
+        .returning(like_table.c.id)
+    )
+    
+    async with database.transaction():
+        last_record_id = await database.fetch_val(query)
+        if last_record_id is None:
+            existing = await database.fetch_val(
+                sqlalchemy.select(like_table.c.id).where(
+                    like_table.c.user_id == current_user.id, like_table.c.post_id == like.post_id
+                )
+            )
+            if existing is None:
+                raise post_not_found_exception()
+            response.status_code = status.HTTP_200_OK
+            return {**data, "id": existing}
+        likes = await database.fetch_val(
+            post_table.update()
+            .where(post_table.c.id == like.post_id)
+            .values(like_count=post_table.c.like_count + 1, version=post_table.c.version + 1)
+            .returning(post_table.c.like_count)
+        )
+    await cache.post_liked(like.post_id, likes)
+    return {**data, "id": last_record_id}
+
+
+@router.post("/comment/batch", response_model=list[CommentBatchResult])
+async def create_comments_batch(
+    comments: Annotated[list[CommentIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    """Create many comments at once, returning a result per comment in request order."""
+    # The comments as rows to select from, so one INSERT skips those on missing posts
+    requested = sqlalchemy.union_all(*(
+        sqlalchemy.select(
+            sqlalchemy.literal(i).label("position"),
+            sqlalchemy.literal(comment.body).label("body"),
+            sqlalchemy.literal(comment.post_id).label("post_id"),
+        )
+        for i, comment in enumerate(comments)
+    )).subquery()
+    query = (
+        comment_table.insert()
+        .from_select(
+            ["body", "post_id", "user_id"],
+            sqlalchemy.select(requested.c.body, post_table.c.id, sqlalchemy.literal(current_user.id))
+            .join_from(requested, post_table, post_table.c.id == requested.c.post_id)
+            .order_by(requested.c.position),
+        )
+        .returning(comment_table.c.id, comment_table.c.post_id)
+    )
+    async with database.transaction():
+        inserted = await database.fetch_all(query)
+        increments: dict[int, int] = {}
+        for row in inserted:
+            increments[row.post_id] = increments.get(row.post_id, 0) + 1
+        if increments:
+            await database.execute(
+                post_table.update()
+                .where(post_table.c.id.in_(increments))
+                .values(
+                    comment_count=increment_per_post(post_table.c.comment_count, increments),
+                    version=post_table.c.version + 1,
+                )
+            )
+    for post_id in increments:
+        await cache.post_commented(post_id)
+    
+    results: list[dict] = [{"status": status.HTTP_404_NOT_FOUND, "detail": "Post not found"} for _ in comments]
+    # Rows of a single INSERT get ascending ids in the order they were selected
+    accepted = [i for i, comment in enumerate(comments) if comment.post_id in increments]
+    for i, comment_id in zip(accepted, sorted(row.id for row in inserted)):
+        results[i] = {
+            "status": status.HTTP_201_CREATED,
+            "comment": {**comments[i].model_dump(), "user_id": current_user.id, "id": comment_id},
+        }
+    return results
+
+
+@router.post("/like/batch", response_model=list[PostLikeBatchResult])
+async def like_posts_batch(
+    likes: Annotated[list[PostLikeIn], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    """Like many posts at once, returning a result per like in request order.
+
+    A post that is missing gets a 404 and one the user already liked, earlier
+    or in the same batch, gets a 409.
+    """
+    post_ids = list(dict.fromkeys(like.post_id for like in likes))
+    # Inserts nothing for missing posts or ones the user already liked, even
+    # when a concurrent request liked them after this one started
+    query = (
+        insert_ignoring_conflicts(like_table)
+        .from_select(
+            ["user_id", "post_id"],
+            sqlalchemy.select(sqlalchemy.literal(current_user.id), post_table.c.id).where(post_table.c.id.in_(post_ids)),
+        )
+        .returning(like_table.c.id, like_table.c.post_id)
+    )
+    async with database.transaction():
+        inserted = {row.post_id: row.id for row in await database.fetch_all(query)}
+        updated = []
+        if inserted:
+            increments = {post_id: 1 for post_id in inserted}
+            updated = await database.fetch_all(
+                post_table.update()
+                .where(post_table.c.id.in_(increments))
+                .values(
+                    like_count=increment_per_post(post_table.c.like_count, increments),
+                    version=post_table.c.version + 1,
+                )
+                .returning(post_table.c.id, post_table.c.like_count)
+            )
+    for post in updated:
+        await cache.post_liked(post.id, post.like_count)
     
-    last_record_id = await database.execute(query)
-    return {**data, "id": last_record_id}
\ No newline at end of file
+    existing = set(inserted)
+    if len(inserted) < len(post_ids):
+        # Tell posts that are missing from ones that were already liked
+        existing |= await find_existing_post_ids(set(post_ids) - existing)
+    results: list[dict] = []
+    for like in likes:
+        if like.post_id not in existing:
+            results.append({"status": status.HTTP_404_NOT_FOUND, "detail": "Post not found"})
+        elif like.post_id in inserted:
+            like_id = inserted.pop(like.post_id)
+            results.append({"status": status.HTTP_201_CREATED, "like": {"post_id": like.post_id, "user_id": current_user.id, "id": like_id}})
+        else:
+            results.append({"status": status.HTTP_409_CONFLICT, "detail": "Post already liked"})
+    return results
@@ -1,38 +1,233 @@
+import asyncio
 import logging
-import tempfile
-import aiofiles
-from fastapi import APIRouter,HTTPException, UploadFile, status
-from storeapi.libs.b2 import b2_upload_file
+from typing import Annotated, Union
+from fastapi import APIRouter,HTTPException, status, Depends, Request
+from storeapi.config import config
+from storeapi.database import database, upload_session_table
+from storeapi.libs.b2 import aio as b2
+from storeapi.multipart_stream import StreamedFile
+from storeapi.models.upload import UploadSession, UploadSessionIn, UploadSessionStatus
+from storeapi.models.user import User
+from storeapi.security import get_current_user
+from storeapi import upload_sessions
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 # File flow
-# client -> server(tempfile) -> B2 -> delete tempfile
-
-# client split up file into chunks of 1MB
-# client sends up chunks 1 at a time (async)
-# client sends the last chunk, all  chunks are put together in the temp file and upload to b2 and tempfile is deleted.
+# client -> server(memory, one part at a time) -> B2
+#
+# The multipart body is parsed as it arrives (see multipart_stream) rather
+# than spooled to a temporary file first. Files smaller than B2_PART_SIZE are
+# read into memory and uploaded in one call. Larger files are streamed into a
+# B2 large file: each part is read from the request and uploaded while the
+# next ones are read, with at most B2_PARTS_IN_FLIGHT parts buffered at once,
+# so nothing touches local disk.
+#
+# Resumable flow, for large files over unreliable connections
+# client creates an upload session -> POST /upload/session
+# client splits the file into chunk_size chunks and PUTs them in any order,
+#   in parallel, retrying as needed -> PUT /upload/session/{id}/chunk/{index}
+# client asks which chunks are still missing -> GET /upload/session/{id}
+# client finalizes, and the chunks are streamed to B2 as above and deleted
+#   -> POST /upload/session/{id}/finalize
 
 
 CHUNK_SIZE = 1024 * 1024
 
-@router.post("/upload", status_code=status.HTTP_201_CREATED)
-async def upload_file(file:UploadFile):
+# Anything read like a file: the request being uploaded, or a session's chunks
+Upload = Union[StreamedFile, upload_sessions.ChunkReader]
+
+
+async def read_part(file: Upload, size: int) -> bytes:
+    """Read up to size bytes, only returning less at the end of the file."""
+    part = bytearray()
+    while len(part) < size and (chunk := await file.read(min(CHUNK_SIZE, size - len(part)))):
+        part.extend(chunk)
+    return bytes(part)
+
+
+async def stream_large_file(file: Upload, file_name: str, content_type: str, first_parts: list[bytes]) -> str:
+    file_id = await b2.start_large_file(file_name, content_type)
+    in_flight = asyncio.Semaphore(config.B2_PARTS_IN_FLIGHT)
+    uploads: list[asyncio.Task] = []
+
+    async def upload_part(part_number: int, data: bytes) -> str:
+        try:
+            return await b2.upload_part(file_id, part_number, data)
+        finally:
+            in_flight.release()
+
     try:
-        with tempfile.NamedTemporaryFile() as temp_file:
-            filename = temp_file.name
-            logger.info("Saving uploaded file temporarily to {filename} ")
-            async with aiofiles.open(filename, "wb") as f:
-                while chunk := await file.read(CHUNK_SIZE):
-                    await f.write(chunk)
-            file_url = b2_upload_file(local_file=filename, file_name=file.filename)
-            # user.profile_picture_url = file_url
+        part_number = 0
+        while True:
+            await in_flight.acquire()
+            # Stop reading the body as soon as a part failed, rather than at the end
+            for upload in uploads:
+                if upload.done() and upload.exception() is not None:
+                    raise upload.exception()
+            data = first_parts.pop(0) if first_parts else await read_part(file, config.B2_PART_SIZE)
+            if not data:
+                in_flight.release()
+                break
+            part_number += 1
+            uploads.append(asyncio.create_task(upload_part(part_number, data)))
+        part_sha1s = await asyncio.gather(*uploads)
+        return await b2.finish_large_file(file_id, part_sha1s)
+    except BaseException:
+        for upload in uploads:
+            upload.cancel()
+        await asyncio.gather(*uploads, return_exceptions=True)
+        await b2.cancel_large_file(file_id)
+        raise
+
+
+async def stream_to_b2(file: Upload, file_name: str) -> str:
+    content_type = file.content_type or "b2/x-auto"
+    first_part = await read_part(file, config.B2_PART_SIZE)
+    # B2 large files need at least two parts, so only go multipart once we know there is a second
+    second_part = await read_part(file, config.B2_PART_SIZE) if len(first_part) == config.B2_PART_SIZE else b""
+    if not second_part:
+        return await b2.upload_bytes(first_part, file_name, content_type)
+    return await stream_large_file(file, file_name, content_type, [first_part, second_part])
+
+
+async def upload_to_b2(file, file_name: str) -> str:
+    try:
+        logger.info(f"Streaming uploaded file {file_name} to B2")
+        return await stream_to_b2(file, file_name)
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Timed out uploading the file"
+        )
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="There was an error uploading the file"
         )
-        
-    return {"detail": f"Successfully uploaded {file.filename}", "file_url":file_url}
\ No newline at end of file
+
+
+# The body is read by StreamedFile rather than declared, so describe it here
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                },
+            },
+        },
+    },
+}
+
+
+@router.post("/upload", status_code=status.HTTP_201_CREATED, openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_file(request: Request):
+    file = await StreamedFile(request).open()
+    file_url = await upload_to_b2(file, file.filename)
+    # user.profile_picture_url = file_url
+
+    return {"detail": f"Successfully uploaded {file.filename}", "file_url":file_url}
+
+
+async def find_upload_session(session_id: str, current_user: User):
+    query = upload_session_table.select().where(
+        upload_session_table.c.id == session_id, upload_session_table.c.user_id == current_user.id
+    )
+    session = await database.fetch_one(query)
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    return session
+
+
+def session_response(session) -> dict:
+    return {**session._mapping, "chunk_count": upload_sessions.chunk_count(session.size, session.chunk_size)}
+
+
+@router.post("/upload/session", response_model=UploadSession, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(session: UploadSessionIn, current_user: Annotated[User, Depends(get_current_user)]):
+    data = {
+        **session.model_dump(),
+        "id": upload_sessions.new_session_id(),
+        "user_id": current_user.id,
+        "chunk_size": CHUNK_SIZE,
+        "updated_at": upload_sessions.now(),
+    }
+    await upload_sessions.create_session_dir(data["id"])
+    query = upload_session_table.insert().values(data)
+    await database.execute(query)
+    return {**data, "chunk_count": upload_sessions.chunk_count(data["size"], data["chunk_size"])}
+
+
+@router.get("/upload/session/{session_id}", response_model=UploadSessionStatus)
+async def get_upload_session(session_id: str, current_user: Annotated[User, Depends(get_current_user)]):
+    session = await find_upload_session(session_id, current_user)
+    return {**session_response(session), "missing_chunks": await upload_sessions.missing_chunks(session)}
+
+
+@router.put("/upload/session/{session_id}/chunk/{index}", status_code=status.HTTP_204_NO_CONTENT)
+async def upload_chunk(session_id: str, index: int, request: Request, current_user: Annotated[User, Depends(get_current_user)]):
+    session = await find_upload_session(session_id, current_user)
+    if not 0 <= index < upload_sessions.chunk_count(session.size, session.chunk_size):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Chunk index out of range")
+    
+    # Keeps the garbage collector away while the chunk is written
+    if not await upload_sessions.touch_session(database, session.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    
+    expected = upload_sessions.expected_chunk_size(session, index)
+    try:
+        written, temp_path = await upload_sessions.write_chunk(session.id, index, request.stream(), expected)
+        if written != expected:
+            await upload_sessions.remove_chunk(temp_path)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Chunk {index} must be {expected} bytes, got {written}"
+            )
+        await upload_sessions.commit_chunk(temp_path, session.id, index)
+    except upload_sessions.ChunkTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except FileNotFoundError:
+        # Finalized or deleted while the chunk was being written
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+
+
+@router.post("/upload/session/{session_id}/finalize", status_code=status.HTTP_201_CREATED)
+async def finalize_upload_session(session_id: str, current_user: Annotated[User, Depends(get_current_user)]):
+    session = await find_upload_session(session_id, current_user)
+    missing = await upload_sessions.missing_chunks(session)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Upload is missing chunks", "missing_chunks": missing}
+        )
+    
+    if not await upload_sessions.touch_session(database, session.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    if not await upload_sessions.claim_finalize(session.id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is already being finalized")
+    
+    reader = upload_sessions.ChunkReader(session)
+    try:
+        file_url = await upload_to_b2(reader, session.file_name)
+    except BaseException:
+        await upload_sessions.release_finalize(session.id)
+        raise
+    finally:
+        await reader.close()
+    await upload_sessions.delete_session(database, session.id)
+    
+    return {"detail": f"Successfully uploaded {session.file_name}", "file_url": file_url}
+
+
+@router.delete("/upload/session/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload_session(session_id: str, current_user: Annotated[User, Depends(get_current_user)]):
+    session = await find_upload_session(session_id, current_user)
+    await upload_sessions.delete_session(database, session.id)
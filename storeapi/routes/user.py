@@ -1,11 +1,11 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Request, BackgroundTasks
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from typing import Annotated
 from storeapi.models.user import  UserIn
-from storeapi.security import get_user, get_password_hash,authenticate_user, create_access_token,get_subject_from_token, create_confirmation_token
+from storeapi.security import get_user, get_password_hash_async,authenticate_user, create_access_token,get_subject_from_token, create_confirmation_token, invalidate_user
 from storeapi.database import database, user_table
 import logging
 from fastapi.security import OAuth2PasswordRequestForm
-from storeapi import tasks
+from storeapi import jobs
 
 router = APIRouter()
 
@@ -13,20 +13,23 @@ logger = logging.getLogger(__name__)
 
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register(user: UserIn, background_tasks: BackgroundTasks, request: Request):
+async def register(user: UserIn, request: Request):
     if await get_user(user.email):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists with this email")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     query = user_table.insert().values(email=user.email, password=hashed_password, confirmed=False)
-    logger.debug(query)
-    await database.execute(query)
-    background_tasks.add_task(
-        tasks.send_user_registration_email,
-        user.email,
-        confirmation_link= request.url_for(
-                "confirm_email", token=create_confirmation_token(user.email)
-            ),
-    )
+    async with database.transaction():
+        await database.execute(query)
+        await jobs.enqueue(
+            database,
+            jobs.SEND_REGISTRATION_EMAIL,
+            {
+                "email": user.email,
+                "confirmation_link": str(request.url_for(
+                    "confirm_email", token=create_confirmation_token(user.email)
+                )),
+            },
+        )
     return {"message": "User registered successfully. Please confirm your email"}
             
 
@@ -43,7 +46,7 @@ async def confirm_email(token: str):
         user_table.update().where(user_table.c.email == email).values(confirmed=True)
     )
     
-    logger.debug(query)
     await database.execute(query)
+    invalidate_user(email)
     return {"detail":"User confirmed"}
     
\ No newline at end of file
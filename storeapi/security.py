@@ -7,6 +7,8 @@ from jose import jwt, ExpiredSignatureError, JWTError
 from fastapi import HTTPException, status, Depends
 from typing import Annotated,Literal
 from storeapi.config import config
+from storeapi.hashing import HashingPoolBusyError, hashing_pool
+from storeapi.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 # when you work on a backend api you look at 3 main things a.data to be stored b. data the api is going to recieve and c.return and implement the endpoint to the user.
@@ -16,6 +18,10 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Users by email, so authenticated requests don't need a SELECT on users every
+# time. Only found users are cached; call invalidate_user after updating a row.
+user_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL_SECONDS)
+
 
 def create_credentials_exception(detail:str) -> HTTPException:
     return HTTPException(
@@ -71,12 +77,43 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+
+def create_hashing_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+# bcrypt takes tens of milliseconds per call, so request handlers use these
+# instead of the sync versions above to keep the event loop free.
+async def get_password_hash_async(password: str) -> str:
+    try:
+        return await hashing_pool().run(get_password_hash, password)
+    except HashingPoolBusyError as e:
+        logger.warning(str(e))
+        raise create_hashing_busy_exception() from e
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await hashing_pool().run(verify_password, plain_password, hashed_password)
+    except HashingPoolBusyError as e:
+        logger.warning(str(e))
+        raise create_hashing_busy_exception() from e
+
 async def get_user(email:str):
+    user = user_cache.get(email)
+    if user is not None:
+        return user
     logger.debug("Fetching user from db", extra={"email": email})
     query = user_table.select().where(user_table.c.email == email)
     result = await database.fetch_one(query)
     if result:
+        user_cache.set(email, result)
         return result
+
+def invalidate_user(email:str) -> None:
+    user_cache.delete(email)
     
     
 async def authenticate_user(email:str,password:str):
@@ -84,7 +121,7 @@ async def authenticate_user(email:str,password:str):
     user = await get_user(email)
     if not user:
         raise create_credentials_exception("Invalid email or password")
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         raise create_credentials_exception("Invalid email or password")
     if not user.confirmed:
         raise create_credentials_exception("User is not confirmed")
@@ -0,0 +1,325 @@
+import asyncio
+import contextvars
+import logging
+from collections import deque
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, Awaitable, Callable, Optional
+import aiosqlite
+import sqlalchemy
+from databases.backends.sqlite import SQLiteBackend, SQLitePool
+from databases.core import Connection, DatabaseURL, Transaction
+from storeapi.config import config
+from storeapi.replicas import RoutingDatabase
+
+logger = logging.getLogger(__name__)
+
+# With SQLITE_PERFORMANCE_PROFILE, a SQLite database is set up for many
+# concurrent requests rather than with the defaults SQLite keeps for
+# compatibility:
+#
+# - Every connection, the sync engine's included, runs in WAL mode with
+#   synchronous=NORMAL, so readers never block the writer and a commit appends
+#   to the log without waiting for an fsync. mmap_size, cache_size and
+#   busy_timeout come from the SQLITE_* settings.
+# - Reads share a pool of SQLITE_READ_CONNECTIONS connections kept open,
+#   instead of opening a connection for every request.
+# - All writes go through one writer connection. SQLite only allows one writer
+#   at a time anyway; queueing writes here rather than in busy_timeout keeps
+#   them from failing with "database is locked". Writes made outside a
+#   transaction are group committed: those queued while the previous commit
+#   ran are written in one transaction, each in its own savepoint, so a burst
+#   of likes costs one commit rather than one per like. A transaction holds
+#   the writer connection from start to end.
+
+# The task holding the writer, whose queries all use the writer connection.
+# Tasks it starts inherit the variable but not the writer.
+writing: ContextVar[Optional[asyncio.Task]] = ContextVar("sqlite_writing", default=None)
+
+READ_STATEMENTS = ("SELECT", "EXPLAIN")
+
+
+def is_writing() -> bool:
+    return writing.get() is asyncio.current_task()
+
+
+def use_performance_profile(url: str) -> bool:
+    return config.SQLITE_PERFORMANCE_PROFILE and url.startswith("sqlite")
+
+
+def pragmas() -> list[str]:
+    return [
+        # Set first, so switching to WAL waits for other connections
+        f"PRAGMA busy_timeout = {config.SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        f"PRAGMA mmap_size = {config.SQLITE_MMAP_SIZE}",
+        # Negative sizes are in KiB rather than pages
+        f"PRAGMA cache_size = -{config.SQLITE_CACHE_SIZE_KIB}",
+    ]
+
+
+def apply_pragmas(dbapi_connection, connection_record=None) -> None:
+    """Run the pragmas on a new sqlite3 connection of the sync engine."""
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas():
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def is_write(query: Any) -> bool:
+    """Whether query may change the database and has to run on the writer."""
+    if isinstance(query, (str, sqlalchemy.TextClause)):
+        words = str(query).split(None, 1)
+        return not words or words[0].upper() not in READ_STATEMENTS
+    return not query.is_select
+
+
+class SQLiteConnectionPool(SQLitePool):
+    """SQLitePool that keeps up to size connections open, with the pragmas run on each."""
+
+    def __init__(self, url: DatabaseURL, size: int, **options) -> None:
+        super().__init__(url, **options)
+        self.size = size
+        self.idle: list[aiosqlite.Connection] = []
+        # Idle connections are only kept while the database is connected,
+        # since each one runs a thread that would keep the process alive
+        self.keep_idle = False
+        self._slots = asyncio.Semaphore(size)
+
+    def get_idle_size(self) -> int:
+        return len(self.idle)
+
+    async def acquire(self) -> aiosqlite.Connection:
+        await self._slots.acquire()
+        try:
+            if self.idle:
+                return self.idle.pop()
+            connection = await super().acquire()
+            try:
+                for pragma in pragmas():
+                    await (await connection.execute(pragma)).close()
+            except BaseException:
+                await super().release(connection)
+                raise
+            return connection
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, connection: aiosqlite.Connection) -> None:
+        try:
+            # A connection left inside a transaction would hold its locks
+            if connection.in_transaction or not self.keep_idle:
+                await super().release(connection)
+            else:
+                self.idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def open(self) -> None:
+        self.keep_idle = True
+
+    async def close(self) -> None:
+        self.keep_idle = False
+        idle, self.idle = self.idle, []
+        for connection in idle:
+            await super().release(connection)
+
+
+class SQLiteWriter:
+    """Run writes one at a time on the writer connection, committing them in groups."""
+
+    def __init__(self, connection: Callable[[], Connection], max_size: int) -> None:
+        self.connection = connection
+        self.max_size = max_size
+        # Held by a group commit or a transaction while it uses the writer
+        self.lock = asyncio.Lock()
+        self.commits = 0
+        self.writes = 0
+        self._queue: deque[tuple[Callable[[], Awaitable[Any]], contextvars.Context, asyncio.Future]] = deque()
+        self._committer: Optional[asyncio.Task] = None
+
+    async def write(self, run: Callable[[], Awaitable[Any]]) -> Any:
+        """Queue run for the next group commit and return its result once committed."""
+        # run keeps the caller's context, tracing included
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((run, context, future))
+        # A committer left on a closed loop would never finish
+        if self._committer is None or self._committer.done() or self._committer.get_loop() is not loop:
+            self._committer = asyncio.create_task(self._commit_queued())
+            self._committer.add_done_callback(self._cancel_queued)
+        return await future
+
+    async def _commit_queued(self) -> None:
+        while self._queue:
+            async with self.lock:
+                batch = [self._queue.popleft() for _ in range(min(self.max_size, len(self._queue)))]
+                await self._commit(batch)
+
+    def _cancel_queued(self, committer: asyncio.Task) -> None:
+        # Nothing would commit the writes a cancelled committer left queued
+        if committer.cancelled() and committer is self._committer:
+            while self._queue:
+                self._queue.popleft()[2].cancel()
+
+    async def _commit(self, batch: list[tuple[Callable[[], Awaitable[Any]], contextvars.Context, asyncio.Future]]) -> None:
+        connection = self.connection()
+        written = []
+        try:
+            async with connection.transaction():
+                for run, context, future in batch:
+                    # Cancelled while queued
+                    if future.done():
+                        continue
+                    try:
+                        async with connection.transaction():
+                            # A task copies the context it is created in
+                            result = await context.run(asyncio.create_task, self._run(run))
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        written.append((future, result))
+        except BaseException as e:
+            # Nothing else resolves the futures of the batch, so their callers would wait forever
+            for _, _, future in batch:
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            logger.error(f"Committing {len(written)} writes failed: {e}")
+            return
+        self.commits += 1
+        self.writes += len(written)
+        for future, result in written:
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    async def _run(run: Callable[[], Awaitable[Any]]) -> Any:
+        writing.set(asyncio.current_task())
+        return await run()
+
+    async def drain(self) -> None:
+        """Wait until every queued write is committed."""
+        committer = self._committer
+        if committer is not None and committer.get_loop() is asyncio.get_running_loop():
+            await asyncio.gather(committer, return_exceptions=True)
+
+
+class WriteTransaction(Transaction):
+    """Transaction on the writer connection, which it holds until it ends."""
+
+    def __init__(self, database: "SQLiteDatabase", force_rollback: bool, **kwargs) -> None:
+        super().__init__(database.writer_connection, force_rollback, **kwargs)
+        self._writer = database.writer
+        self._token: Optional[contextvars.Token] = None
+
+    async def start(self) -> "WriteTransaction":
+        # Nested transactions already hold the writer
+        if not is_writing():
+            await self._writer.lock.acquire()
+            self._token = writing.set(asyncio.current_task())
+        try:
+            return await super().start()
+        except BaseException:
+            self._release()
+            raise
+
+    async def commit(self) -> None:
+        try:
+            await super().commit()
+        finally:
+            self._release()
+
+    async def rollback(self) -> None:
+        try:
+            await super().rollback()
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        if self._token is not None:
+            writing.reset(self._token)
+            self._token = None
+            self._writer.lock.release()
+
+
+class SQLiteDatabase(RoutingDatabase):
+    """SQLite database reading from a pool of connections and writing through one."""
+
+    def __init__(self, url: str, **options) -> None:
+        super().__init__(url, **options)
+        self._backend._pool = SQLiteConnectionPool(self.url, config.SQLITE_READ_CONNECTIONS, **self.options)
+        writer_backend = SQLiteBackend(self.url, **self.options)
+        writer_backend._pool = SQLiteConnectionPool(self.url, 1, **self.options)
+        self._writer = Connection(self, writer_backend)
+        self.writer = SQLiteWriter(self.writer_connection, config.SQLITE_GROUP_COMMIT_MAX_SIZE)
+
+    def writer_connection(self) -> Connection:
+        # Under force_rollback everything has to happen in the global transaction
+        return self._global_connection or self._writer
+
+    def connection(self) -> Connection:
+        if is_writing():
+            return self.writer_connection()
+        return super().connection()
+
+    def transaction(self, *, force_rollback: bool = False, **kwargs) -> Transaction:
+        return WriteTransaction(self, force_rollback, **kwargs)
+
+    def replica(self):
+        # Reads made while writing have to see what was written
+        return None if is_writing() else super().replica()
+
+    async def connect(self) -> None:
+        if self.is_connected:
+            return
+        await super().connect()
+        self._backend._pool.open()
+        self._writer._connection._pool.open()
+        if self._global_connection is None:
+            await self._writer.__aenter__()
+
+    async def disconnect(self) -> None:
+        if not self.is_connected:
+            return
+        await self.writer.drain()
+        if self._writer._connection_counter:
+            await self._writer.__aexit__()
+        await super().disconnect()
+        await self._backend._pool.close()
+        await self._writer._connection._pool.close()
+
+    async def _write(self, method: str, query, values, *args):
+        if is_writing():
+            return await getattr(super(), method)(query, values, *args)
+        return await self.writer.write(partial(getattr(super(), method), query, values, *args))
+
+    async def fetch_all(self, query, values=None):
+        if is_write(query):
+            return await self._write("fetch_all", query, values)
+        return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query, values=None):
+        if is_write(query):
+            return await self._write("fetch_one", query, values)
+        return await super().fetch_one(query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        if is_write(query):
+            return await self._write("fetch_val", query, values, column)
+        return await super().fetch_val(query, values, column)
+
+    async def execute(self, query, values=None):
+        return await self._write("execute", query, values)
+
+    async def execute_many(self, query, values):
+        return await self._write("execute_many", query, values)
@@ -1,54 +1,133 @@
+import json
 import logging
 import httpx
+from functools import lru_cache
+from typing import Optional
 from storeapi.config import config
 from json import JSONDecodeError
 from databases import Database
+from storeapi.batching import RecipientBatcher
 from storeapi.database import post_table
+from storeapi.http_client import get_http_client
+from storeapi.metrics import outbound_call
+from storeapi.response_cache import post_changed
 
 logger = logging.getLogger(__name__)
 
 class APIResponseError(Exception):
-    pass
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
 
-async def send_email(to:str, subject:str, body:str):
-    logger.debug("Sending email", extra={"to": to, "subject": subject})
-    async with httpx.AsyncClient() as client:
-        try:
+# Every outbound call goes through the shared, pooled client from
+# storeapi.http_client unless a client is passed in explicitly.
+
+async def _post_to_mailgun(data: dict, client: Optional[httpx.AsyncClient] = None):
+    client = client or get_http_client()
+    try:
+        with outbound_call("mailgun", "messages"):
             response = await client.post(
-                f"https://api.mailgun.net/v3/{config.MAILGUN_DOMAIN}/messages",
+                f"{config.MAILGUN_API_URL}/{config.MAILGUN_DOMAIN}/messages",
                 auth=('api', config.MAILGUN_API_KEY),
-                data={
-                    "from":f"Eniola Omotee <mailgun@{config.MAILGUN_DOMAIN}>",
-                    "to":[to],
-                    "subject": subject,
-                    "text": body
-                }
+                data={"from":f"Eniola Omotee <mailgun@{config.MAILGUN_DOMAIN}>", **data}
             )
             response.raise_for_status()
+        
+        logger.debug(response.content)
+        
+        return response
+    except httpx.HTTPStatusError as err:
+        raise APIResponseError(
+            f"API request failed with status code {err.response.status_code}: {err.response.text}",
+            err.response.status_code,
+        ) from err
+
+async def send_email(to:str, subject:str, body:str, client: Optional[httpx.AsyncClient] = None):
+    logger.debug("Sending email", extra={"to": to, "subject": subject})
+    return await _post_to_mailgun({"to": [to], "subject": subject, "text": body}, client=client)
+
+# Templated emails use Mailgun's %recipient.name% placeholders, so messages
+# with the same subject and template can be sent to many recipients in one
+# call with recipient-variables (Mailgun batch sending) instead of one call each.
+
+REGISTRATION_EMAIL = (
+    "successfully signed up",
+    (
+        "Hi %recipient.email%! You have successfully signed up for the Stores REST API."
+        "Please confirm your email by clicking on the"
+        "following link: %recipient.confirmation_link%"
+    ),
+)
+IMAGE_FAILED_EMAIL = (
+    "Error occured while trying to generate your image",
+    "Hi %recipient.email%! Unfortunately there was an  error generating an image",
+)
+IMAGE_COMPLETED_EMAIL = (
+    "Image generation Completed",
+    (
+        "Hi %recipient.email%! Your image has been generated and added to your post. "
+        " Please click on the following link to view it: %recipient.post_url%"
+    ),
+)
+
+def render_template(template: str, variables: dict) -> str:
+    for name, value in variables.items():
+        template = template.replace(f"%recipient.{name}%", str(value))
+    return template
+
+async def send_batch_email(email: tuple[str, str], recipients: dict[str, dict], client: Optional[httpx.AsyncClient] = None):
+    subject, template = email
+    logger.debug(f"Sending batch email to {len(recipients)} recipients", extra={"subject": subject})
+    return await _post_to_mailgun(
+        {
+            "to": list(recipients),
+            "subject": subject,
+            "text": template,
+            "recipient-variables": json.dumps(recipients),
+        },
+        client=client
+    )
+
+# A 4xx for a batch is usually caused by one of its recipients, such as an
+# invalid address, except for these, which every smaller batch would get too
+NOT_RECIPIENT_ERRORS = {401, 403, 429}
+
+def rejected_recipients(error: Exception) -> bool:
+    """Whether Mailgun refused a batch because of a message in it."""
+    return (
+        isinstance(error, APIResponseError)
+        and error.status_code is not None
+        and 400 <= error.status_code < 500
+        and error.status_code not in NOT_RECIPIENT_ERRORS
+    )
+
+@lru_cache()
+def email_batcher() -> RecipientBatcher:
+    return RecipientBatcher(
+        send_batch_email,
+        window=config.EMAIL_BATCH_WINDOW_SECONDS,
+        max_recipients=config.EMAIL_BATCH_MAX_RECIPIENTS,
+        split_on=rejected_recipients,
+    )
+
+async def send_templated_email(to: str, email: tuple[str, str], variables: dict, client: Optional[httpx.AsyncClient] = None):
+    """Send one templated email, batched with others unless batching is off or a client is given."""
+    variables = {"email": to, **variables}
+    if client is None and config.EMAIL_BATCHING:
+        return await email_batcher().send(email, to, variables)
+    subject, template = email
+    return await send_email(to, subject, render_template(template, variables), client=client)
             
-            logger.debug(response.content)
-            
-            return response
-        except httpx.HTTPStatusError as err:
-            raise APIResponseError(
-                f"API request failed with status code {err.response.status_code}: {err.response.text}"
-            ) from err
-            
-async def send_user_registration_email(email:str, confirmation_link:str):
-    return await send_email(
-        email,
-        "successfully signed up",
-        (
-            f"Hi {email}! You have successfully signed up for the Stores REST API."
-            "Please confirm your email by clicking on the"
-            f"following link: {confirmation_link}" 
-        )
+async def send_user_registration_email(email:str, confirmation_link:str, client: Optional[httpx.AsyncClient] = None):
+    return await send_templated_email(
+        email, REGISTRATION_EMAIL, {"confirmation_link": str(confirmation_link)}, client=client
     )
 
-async def _generate_cute_creature_api(prompt:str):
+async def _generate_cute_creature_api(prompt:str, client: Optional[httpx.AsyncClient] = None):
     logger.debug("Generating cute creature")
-    async with httpx.AsyncClient() as client:
-        try: 
+    client = client or get_http_client()
+    try: 
+        with outbound_call("deepai", "cute-creature-generator"):
             response = await client.post(
                 "https://api.deepapi.org/api/cute-creature-generator",
                 data={"text":prompt},
@@ -57,13 +136,13 @@ async def _generate_cute_creature_api(prompt:str):
             )
             logger.debug(response)
             response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as err:
-            raise APIResponseError(
-                f"API request failed with status code {err.response.status_code}"
-            ) from err
-        except (JSONDecodeError,TypeError) as err:
-            raise APIResponseError("API response parsing failed") from err
+        return response.json()
+    except httpx.HTTPStatusError as err:
+        raise APIResponseError(
+            f"API request failed with status code {err.response.status_code}", err.response.status_code
+        ) from err
+    except (JSONDecodeError,TypeError) as err:
+        raise APIResponseError("API response parsing failed") from err
 
 
 async def generate_and_add_to_post(
@@ -71,34 +150,23 @@ async def generate_and_add_to_post(
     post_id:int,
     post_url: str,
     database: Database,
-    prompt: str = "A blue british shorthair cat is sitting on a couch"
+    prompt: str = "A blue british shorthair cat is sitting on a couch",
+    client: Optional[httpx.AsyncClient] = None
 ):
     try:
-        response = await _generate_cute_creature_api(prompt=prompt)
+        response = await _generate_cute_creature_api(prompt=prompt, client=client)
     except APIResponseError:
-        return await send_email(
-            email,
-            "Error occured while trying to generate your image",
-            (   f"Hi {email}! Unfortunately there was an "
-                " error generating an image")
-            
-        )
+        return await send_templated_email(email, IMAGE_FAILED_EMAIL, {}, client=client)
         
     logger.debug("Connecting to db to update post")
     query = (post_table.update()
              .where(post_table.c.id == post_id)
-             .values(image_url = response["output_url"] )
+             .values(image_url = response["output_url"], version = post_table.c.version + 1)
     )
-    logger.debug(query)
     await database.execute(query)
+    await post_changed(post_id)
     logger.debug("Database connection in background task closed ")
     
-    await send_email(
-            email,
-            "Image generation Completed",
-            (   f"Hi {email}! Your image has been generated and added to your post. "
-                f" Please click on the following link to view it: {post_url}")
-            
-        )
+    await send_templated_email(email, IMAGE_COMPLETED_EMAIL, {"post_url": str(post_url)}, client=client)
     
     return response
\ No newline at end of file
@@ -1,3 +1,4 @@
+import math
 import os
 from typing import AsyncGenerator, Generator
 import pytest
@@ -6,11 +7,13 @@ from fastapi.testclient import TestClient
 from httpx import AsyncClient
 from httpx import ASGITransport
 os.environ["ENV_STATE"] = "test"
-from storeapi.database import database, user_table #noqa: E402
+from storeapi.database import database, prepare_schema, user_table #noqa: E402
 from storeapi.main import app #noqa: E402 
 from unittest.mock import Mock, AsyncMock
 from httpx import Request,Response 
 from storeapi.tests.helpers import create_post #noqa: E402
+from storeapi.security import invalidate_user, user_cache #noqa: E402
+from storeapi.response_cache import response_cache #noqa: E402
 
 
 
@@ -19,6 +22,12 @@ def anyio_backend():
     return "asyncio"
 
 
+# The app only creates the schema when it starts, which the tests skip
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    prepare_schema()
+
+
 @pytest.fixture()
 def client() -> Generator:
     yield TestClient(app=app)
@@ -27,6 +36,18 @@ def client() -> Generator:
 async def clear_users():
     await database.execute(user_table.delete())
     
+# Cached users would outlive the rows rolled back at the end of each test
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    user_cache.clear()
+
+# Likewise for cached responses
+@pytest_asyncio.fixture(autouse=True)
+async def clear_response_cache(mocker):
+    await response_cache.clear()
+    # As in a newly started process, with no write that replicas could lag behind
+    mocker.patch.object(response_cache, "invalidated_at", -math.inf)
+    
 @pytest.fixture(autouse=True)
 async def db() -> AsyncGenerator:
     await database.connect()
@@ -54,6 +75,7 @@ async def registered_user(async_client:AsyncClient) -> dict:
 async def confirmed_user(registered_user:dict) -> dict:
     query = (user_table.update().where(user_table.c.email == registered_user["email"]).values(confirmed=True))
     await database.execute(query)
+    invalidate_user(registered_user["email"])
     return registered_user
     
 
@@ -67,12 +89,10 @@ async def logged_in_token(async_client:AsyncClient, confirmed_user:dict) -> str:
 # We can't call the mailgun endpoint accidetally, so we mock it
 @pytest.fixture(autouse=True)
 def mock_httpx_client(mocker):
-    mocked_client = mocker.patch("storeapi.tasks.httpx.AsyncClient")
-    
     mocked_async_client = Mock()
     response = Response(status_code=200, content="", request=Request("POST","//"))
     mocked_async_client.post = AsyncMock(return_value=response)
-    mocked_client.return_value.__aenter__.return_value = mocked_async_client
+    mocker.patch("storeapi.tasks.get_http_client", return_value=mocked_async_client)
     
     return mocked_async_client
 
@@ -1,7 +1,9 @@
 import pytest
 from httpx import AsyncClient
 from fastapi import status
+from databases import Database
 from storeapi import security
+from storeapi.jobs import JobWorker
 from storeapi.tests.helpers import create_comment,create_post,like_post
 
 
@@ -30,13 +32,14 @@ async def test_create_post(async_client:AsyncClient,confirmed_user:dict, logged_
 
 
 @pytest.mark.anyio
-async def test_create_post_with_prompt(async_client:AsyncClient,logged_in_token:str, mock_generate_cute_creature_api):
+async def test_create_post_with_prompt(async_client:AsyncClient,logged_in_token:str, mock_generate_cute_creature_api, db: Database):
     body = "Test Post"
     response = await async_client.post("/post?prompt=A cat", json={"body":body}, headers={"Authorization": f"Bearer {logged_in_token}"})
     
     assert response.status_code == 201
     assert {"id": 1, "body": body,"image_url":None}.items() <= response.json().items()
     
+    await JobWorker(db).drain()
     mock_generate_cute_creature_api.assert_called()
 
 
@@ -163,4 +166,282 @@ async def test_get_missing_post_with_comments(async_client: AsyncClient, created
     response = await async_client.get("/post/9999")
     
     assert response.status_code == status.HTTP_404_NOT_FOUND
-    assert response.json() == {"detail": "Post not found"}
\ No newline at end of file
+    assert response.json() == {"detail": "Post not found"}
+
+async def collect_pages(async_client: AsyncClient, sorting: str, limit: int) -> list[list[int]]:
+    pages = []
+    params = {"sorting": sorting, "limit": limit}
+    while True:
+        response = await async_client.get("/post", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        pages.append([post["id"] for post in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+        params["cursor"] = cursor
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "sorting, expected_pages",
+    [
+        ("new", [[5, 4], [3, 2], [1]]),
+        ("old", [[1, 2], [3, 4], [5]]),
+        ("most_likes", [[4, 2], [5, 3], [1]]),
+    ],
+)
+async def test_get_all_post_paginated(async_client: AsyncClient, logged_in_token: str, sorting: str, expected_pages: list):
+    for i in range(1, 6):
+        await create_post(f"Test Post {i}", async_client, logged_in_token)
+    await like_post(async_client, 2, logged_in_token)
+    await like_post(async_client, 4, logged_in_token)
+    
+    assert await collect_pages(async_client, sorting, 2) == expected_pages
+
+
+@pytest.mark.anyio
+async def test_get_all_post_last_page_has_no_cursor(async_client: AsyncClient, created_post: dict):
+    response = await async_client.get("/post", params={"limit": 1})
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_get_all_post_invalid_cursor(async_client: AsyncClient):
+    response = await async_client.get("/post", params={"cursor": "not-a-cursor"})
+    
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+@pytest.mark.anyio
+async def test_get_all_post_cursor_from_other_sorting(async_client: AsyncClient, logged_in_token: str):
+    await create_post("Test Post 1", async_client, logged_in_token)
+    await create_post("Test Post 2", async_client, logged_in_token)
+    response = await async_client.get("/post", params={"sorting": "new", "limit": 1})
+    
+    response = await async_client.get(
+        "/post", params={"sorting": "most_likes", "cursor": response.headers["X-Next-Cursor"]}
+    )
+    
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.anyio
+async def test_get_all_post_limit_too_large(async_client: AsyncClient):
+    response = await async_client.get("/post", params={"limit": 1000})
+    
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.anyio
+async def test_get_all_post_cache_invalidated_by_writes(async_client: AsyncClient, created_post: dict, logged_in_token: str):
+    await async_client.get("/post", params={"sorting": "most_likes"})
+    await like_post(async_client, created_post["id"], logged_in_token)
+    second = await create_post("Second Post", async_client, logged_in_token)
+    
+    response = await async_client.get("/post", params={"sorting": "most_likes"})
+    
+    assert [(post["id"], post["likes"]) for post in response.json()] == [(created_post["id"], 1), (second["id"], 0)]
+
+
+@pytest.mark.anyio
+async def test_get_all_post_new_keeps_older_pages_cached(async_client: AsyncClient, logged_in_token: str, mocker):
+    for body in ("Post 1", "Post 2", "Post 3"):
+        await create_post(body, async_client, logged_in_token)
+    first_page = await async_client.get("/post", params={"limit": 2})
+    cursor = first_page.headers["X-Next-Cursor"]
+    await async_client.get("/post", params={"limit": 2, "cursor": cursor})
+    
+    await create_post("Post 4", async_client, logged_in_token)
+    fetch_all = mocker.spy(Database, "fetch_all")
+    await async_client.get("/post", params={"limit": 2, "cursor": cursor})
+    fetch_all.assert_not_called()
+    
+    response = await async_client.get("/post", params={"limit": 2})
+    assert [post["body"] for post in response.json()] == ["Post 4", "Post 3"]
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_cache_invalidated_by_comment(async_client: AsyncClient, created_post: dict, logged_in_token: str):
+    await async_client.get(f"/post/{created_post['id']}")
+    comment = await create_comment("Test Comment", created_post["id"], async_client, logged_in_token)
+    
+    response = await async_client.get(f"/post/{created_post['id']}")
+    
+    assert response.json()["comments"] == [comment]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/post/{id}", "/post/{id}/comment"])
+async def test_get_post_not_modified(async_client: AsyncClient, created_post: dict, path: str, mocker):
+    url = path.format(id=created_post["id"])
+    response = await async_client.get(url)
+    etag = response.headers["ETag"]
+    
+    fetch_all = mocker.spy(Database, "fetch_all")
+    response = await async_client.get(url, headers={"If-None-Match": etag})
+    
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+    fetch_all.assert_not_called()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/post/{id}", "/post/{id}/comment"])
+async def test_get_post_etag_changes_on_writes(async_client: AsyncClient, created_post: dict, logged_in_token: str, path: str):
+    url = path.format(id=created_post["id"])
+    etags = [(await async_client.get(url)).headers["ETag"]]
+    await like_post(async_client, created_post["id"], logged_in_token)
+    etags.append((await async_client.get(url)).headers["ETag"])
+    await create_comment("Test Comment", created_post["id"], async_client, logged_in_token)
+    
+    response = await async_client.get(url, headers={"If-None-Match": etags[-1]})
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert len({*etags, response.headers["ETag"]}) == 3
+
+
+@pytest.mark.anyio
+async def test_get_posts_batch(async_client: AsyncClient, logged_in_token: str, mocker):
+    first = await create_post("Post 1", async_client, logged_in_token)
+    second = await create_post("Post 2", async_client, logged_in_token)
+    comment = await create_comment("Test Comment", second["id"], async_client, logged_in_token)
+    await like_post(async_client, first["id"], logged_in_token)
+    
+    fetch_all = mocker.spy(Database, "fetch_all")
+    response = await async_client.get("/post/batch", params={"ids": [second["id"], 99, first["id"]]})
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert [(item["post"]["id"], item["post"]["likes"], item["comments"]) for item in response.json()] == [
+        (second["id"], 0, [comment]),
+        (first["id"], 1, []),
+    ]
+    assert fetch_all.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_get_posts_batch_pages_comments(async_client: AsyncClient, logged_in_token: str):
+    first = await create_post("Post 1", async_client, logged_in_token)
+    second = await create_post("Post 2", async_client, logged_in_token)
+    comments = [await create_comment(f"Comment {i}", first["id"], async_client, logged_in_token) for i in range(3)]
+    other = await create_comment("Other", second["id"], async_client, logged_in_token)
+    
+    response = await async_client.get("/post/batch", params={"ids": [first["id"], second["id"]], "comment_limit": 2})
+    
+    first_page, second_page = response.json()
+    assert (first_page["comments"], second_page["comments"]) == (comments[:2], [other])
+    assert second_page["next_cursor"] is None
+    response = await async_client.get(f"/post/{first['id']}/comment", params={"cursor": first_page["next_cursor"]})
+    assert response.json() == comments[2:]
+
+
+@pytest.mark.anyio
+async def test_get_posts_batch_too_many_ids(async_client: AsyncClient):
+    response = await async_client.get("/post/batch", params={"ids": list(range(101))})
+    
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.anyio
+async def test_create_comments_batch(async_client: AsyncClient, created_post: dict, logged_in_token: str, confirmed_user: dict):
+    response = await async_client.post(
+        "/comment/batch",
+        json=[
+            {"body": "First", "post_id": created_post["id"]},
+            {"body": "Missing", "post_id": 99},
+            {"body": "Second", "post_id": created_post["id"]},
+        ],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert [(item["status"], item["comment"] and item["comment"]["body"]) for item in response.json()] == [
+        (201, "First"),
+        (404, None),
+        (201, "Second"),
+    ]
+    comments = (await async_client.get(f"/post/{created_post['id']}/comment")).json()
+    assert [comment["body"] for comment in comments] == ["First", "Second"]
+    assert [comment["id"] for comment in comments] == [response.json()[0]["comment"]["id"], response.json()[2]["comment"]["id"]]
+
+
+@pytest.mark.anyio
+async def test_like_posts_batch(async_client: AsyncClient, logged_in_token: str):
+    first = await create_post("Post 1", async_client, logged_in_token)
+    second = await create_post("Post 2", async_client, logged_in_token)
+    await like_post(async_client, first["id"], logged_in_token)
+    
+    response = await async_client.post(
+        "/like/batch",
+        json=[{"post_id": first["id"]}, {"post_id": second["id"]}, {"post_id": second["id"]}, {"post_id": 99}],
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+    
+    assert [item["status"] for item in response.json()] == [409, 201, 409, 404]
+    posts = (await async_client.get("/post", params={"sorting": "old"})).json()
+    assert [post["likes"] for post in posts] == [1, 1]
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_single_query(async_client: AsyncClient, created_post: dict, logged_in_token: str, mocker):
+    comments = [await create_comment(f"Comment {i}", created_post["id"], async_client, logged_in_token) for i in range(3)]
+    
+    queries = [mocker.spy(Database, method) for method in ("fetch_all", "fetch_one", "fetch_val", "execute")]
+    response = await async_client.get(f"/post/{created_post['id']}", params={"comment_limit": 2})
+    
+    assert sum(spy.call_count for spy in queries) == 1
+    assert response.json()["comments"] == comments[:2]
+    assert response.json()["post"]["id"] == created_post["id"]
+    
+    response = await async_client.get(
+        f"/post/{created_post['id']}/comment", params={"cursor": response.headers["X-Next-Cursor"]}
+    )
+    assert response.json() == comments[2:]
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_get_comments_on_post_paginated(async_client: AsyncClient, created_post: dict, logged_in_token: str):
+    for i in range(5):
+        await create_comment(f"Comment {i}", created_post["id"], async_client, logged_in_token)
+    
+    pages = []
+    params = {"limit": 2}
+    while True:
+        response = await async_client.get(f"/post/{created_post['id']}/comment", params=params)
+        pages.append([comment["body"] for comment in response.json()])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    
+    assert pages == [["Comment 0", "Comment 1"], ["Comment 2", "Comment 3"], ["Comment 4"]]
+
+
+@pytest.mark.anyio
+async def test_like_post_twice_is_idempotent(async_client: AsyncClient, created_post: dict, logged_in_token: str):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    first = await async_client.post("/like", json={"post_id": created_post["id"]}, headers=headers)
+    second = await async_client.post("/like", json={"post_id": created_post["id"]}, headers=headers)
+    
+    assert (first.status_code, second.status_code) == (201, 200)
+    assert first.json() == second.json()
+    assert (await async_client.get(f"/post/{created_post['id']}")).json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_like_missing_post(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post("/like", json={"post_id": 99}, headers={"Authorization": f"Bearer {logged_in_token}"})
+    
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.anyio
+async def test_create_comment_on_missing_post(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/comment", json={"body": "Test Comment", "post_id": 99}, headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+    
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -1,9 +1,9 @@
-import contextlib
-import os
+import asyncio
 import pathlib
-import tempfile
 import pytest
 from httpx import AsyncClient
+from storeapi.config import config
+from storeapi.routes.upload import stream_large_file
 
 @pytest.fixture()
 def sample_image(fs) -> pathlib.Path:
@@ -11,52 +11,96 @@ def sample_image(fs) -> pathlib.Path:
     fs.create_file(path)
     return path
 
+@pytest.fixture()
+def large_file(fs, mocker) -> pathlib.Path:
+    mocker.patch.object(config, "B2_PART_SIZE", 4)
+    path = (pathlib.Path(__file__).parent / "assets" / "large.bin").resolve()
+    fs.create_file(path, contents=b"0123456789")
+    return path
+
 @pytest.fixture(autouse=True)
-def mock_b2_upload_file(mocker):
+def mock_b2_upload_bytes(mocker):
     return mocker.patch(
-        "storeapi.routes.upload.b2_upload_file",
+        "storeapi.libs.b2.aio.b2_upload_bytes",
         return_value="https://fakeurl.com"
     )
-    
+
 @pytest.fixture(autouse=True)
-def aiofiles_mock_open(mocker, fs):
-    mock_open = mocker.patch("aiofiles.open")
-    
-    @contextlib.asynccontextmanager
-    async def async_file_open(fname: str, mode:str = "r"):
-        out_fs_mock = mocker.AsyncMock(name=f"async_file_open:{fname!r}/{mode!r}")
-        with open(fname,mode) as fin:
-            out_fs_mock.write.side_effect = fin.write
-            out_fs_mock.read.side_effect = fin.read
-            yield out_fs_mock
-            
-    mock_open.side_effect = async_file_open
-    return mock_open
-          
-          
+def mock_b2_large_file(mocker):
+    return {
+        "start": mocker.patch("storeapi.libs.b2.aio.b2_start_large_file", return_value="file-id"),
+        "part": mocker.patch("storeapi.libs.b2.aio.b2_upload_part", side_effect=lambda file_id, number, data: f"sha1-{number}"),
+        "finish": mocker.patch("storeapi.libs.b2.aio.b2_finish_large_file", return_value="https://fakeurl.com/large"),
+        "cancel": mocker.patch("storeapi.libs.b2.aio.b2_cancel_large_file"),
+    }
+
+
 async def call_upload_endpoint(async_client:AsyncClient, token: str, sample_image: pathlib.Path):
     return await async_client.post(
         "/upload",
         files={"file":open(sample_image, "rb")},
-        headers={"Authorization": f"Bearer {token}"}     
+        headers={"Authorization": f"Bearer {token}"}
     )
-    
+
 @pytest.mark.anyio
-async def test_upload_image(async_client:AsyncClient, logged_in_token: str, sample_image:pathlib.Path):
+async def test_upload_image(async_client:AsyncClient, logged_in_token: str, sample_image:pathlib.Path, mock_b2_large_file):
     response = await call_upload_endpoint(async_client, logged_in_token,sample_image)
-    
-    print(f"RESPONSE !!!!! {response}")
-    
+
     assert response.status_code == 201
     assert response.json()["file_url"] == "https://fakeurl.com"
+    mock_b2_large_file["start"].assert_not_called()
 
 @pytest.mark.anyio
-async def test_tempfile_removed_after_upload(async_client:AsyncClient, logged_in_token:str, sample_image: pathlib.Path, mocker):
-    named_temp_file_spy = mocker.spy(tempfile, "NamedTemporaryFile")
-    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
-    
+async def test_upload_large_file_in_parts(async_client:AsyncClient, logged_in_token: str, large_file: pathlib.Path, mock_b2_upload_bytes, mock_b2_large_file):
+    response = await call_upload_endpoint(async_client, logged_in_token, large_file)
+
     assert response.status_code == 201
-    
-    created_temp_file = named_temp_file_spy.spy_return
-    
-    assert not os.path.exists(created_temp_file.name)
\ No newline at end of file
+    assert response.json()["file_url"] == "https://fakeurl.com/large"
+    mock_b2_upload_bytes.assert_not_called()
+    parts = [call.args[1:] for call in mock_b2_large_file["part"].call_args_list]
+    assert sorted(parts) == [(1, b"0123"), (2, b"4567"), (3, b"89")]
+    mock_b2_large_file["finish"].assert_called_once_with("file-id", ["sha1-1", "sha1-2", "sha1-3"])
+
+@pytest.mark.anyio
+async def test_upload_large_file_cancelled_on_error(async_client:AsyncClient, logged_in_token: str, large_file: pathlib.Path, mock_b2_large_file):
+    mock_b2_large_file["part"].side_effect = Exception("B2 is down")
+    response = await call_upload_endpoint(async_client, logged_in_token, large_file)
+
+    assert response.status_code == 500
+    mock_b2_large_file["cancel"].assert_called_once_with("file-id")
+    mock_b2_large_file["finish"].assert_not_called()
+
+@pytest.mark.anyio
+async def test_large_file_stops_reading_after_failed_part(mocker):
+    mocker.patch.object(config, "B2_PART_SIZE", 4)
+    mocker.patch("storeapi.routes.upload.b2.upload_part", side_effect=Exception("B2 is down"))
+    file = mocker.Mock(read=mocker.AsyncMock(side_effect=[b"0123"] * 100 + [b""]))
+
+    with pytest.raises(Exception, match="B2 is down"):
+        await stream_large_file(file, "large.bin", "b2/x-auto", [b"0123", b"4567"])
+    assert file.read.call_count <= config.B2_PARTS_IN_FLIGHT
+
+@pytest.mark.anyio
+async def test_upload_file_of_one_part_size(async_client:AsyncClient, logged_in_token: str, fs, mocker, mock_b2_upload_bytes, mock_b2_large_file):
+    mocker.patch.object(config, "B2_PART_SIZE", 4)
+    path = (pathlib.Path(__file__).parent / "assets" / "part.bin").resolve()
+    fs.create_file(path, contents=b"0123")
+    response = await call_upload_endpoint(async_client, logged_in_token, path)
+
+    assert response.status_code == 201
+    assert mock_b2_upload_bytes.call_args.args[0] == b"0123"
+    mock_b2_large_file["start"].assert_not_called()
+
+@pytest.mark.anyio
+async def test_upload_timeout(async_client:AsyncClient, logged_in_token: str, sample_image: pathlib.Path, mocker):
+    mocker.patch("storeapi.routes.upload.b2.upload_bytes", side_effect=asyncio.TimeoutError)
+    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
+    assert response.status_code == 504
+
+@pytest.mark.anyio
+async def test_upload_without_file(async_client:AsyncClient, mock_b2_upload_bytes):
+    response = await async_client.post("/upload", files={"other": ("data.bin", b"0123")})
+
+    assert response.status_code == 400
+    mock_b2_upload_bytes.assert_not_called()
@@ -0,0 +1,151 @@
+import os
+import pytest
+from databases import Database
+from httpx import AsyncClient
+from storeapi.config import config
+from storeapi.upload_sessions import claim_finalize, collect_abandoned_sessions, session_dir, touch_session
+
+CONTENT = b"0123456789"
+
+
+@pytest.fixture(autouse=True)
+def upload_session_dir(tmp_path, mocker):
+    mocker.patch.object(config, "UPLOAD_SESSION_DIR", str(tmp_path))
+    mocker.patch("storeapi.routes.upload.CHUNK_SIZE", 4)
+    return tmp_path
+
+@pytest.fixture(autouse=True)
+def mock_b2_upload_bytes(mocker):
+    return mocker.patch("storeapi.libs.b2.aio.b2_upload_bytes", return_value="https://fakeurl.com")
+
+@pytest.fixture()
+async def upload_session(async_client: AsyncClient, logged_in_token: str) -> dict:
+    response = await async_client.post(
+        "/upload/session",
+        json={"file_name": "file.bin", "size": len(CONTENT)},
+        headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+    return response.json()
+
+
+async def put_chunk(async_client: AsyncClient, token: str, session_id: str, index: int, data: bytes):
+    return await async_client.put(
+        f"/upload/session/{session_id}/chunk/{index}",
+        content=data,
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+async def get_session(async_client: AsyncClient, token: str, session_id: str):
+    return await async_client.get(f"/upload/session/{session_id}", headers={"Authorization": f"Bearer {token}"})
+
+async def finalize(async_client: AsyncClient, token: str, session_id: str):
+    return await async_client.post(f"/upload/session/{session_id}/finalize", headers={"Authorization": f"Bearer {token}"})
+
+
+@pytest.mark.anyio
+async def test_create_upload_session(upload_session: dict):
+    assert {"file_name": "file.bin", "size": 10, "chunk_size": 4, "chunk_count": 3}.items() <= upload_session.items()
+
+@pytest.mark.anyio
+async def test_create_upload_session_too_large(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/upload/session",
+        json={"file_name": "file.bin", "size": config.UPLOAD_SESSION_MAX_SIZE + 1},
+        headers={"Authorization": f"Bearer {logged_in_token}"}
+    )
+    assert response.status_code == 422
+
+@pytest.mark.anyio
+async def test_upload_chunks_out_of_order_and_finalize(async_client: AsyncClient, logged_in_token: str, upload_session: dict, mock_b2_upload_bytes):
+    session_id = upload_session["id"]
+    for index in (2, 0, 0):
+        response = await put_chunk(async_client, logged_in_token, session_id, index, CONTENT[index * 4:index * 4 + 4])
+        assert response.status_code == 204
+
+    response = await get_session(async_client, logged_in_token, session_id)
+    assert response.json()["missing_chunks"] == [1]
+
+    await put_chunk(async_client, logged_in_token, session_id, 1, CONTENT[4:8])
+    response = await finalize(async_client, logged_in_token, session_id)
+
+    assert response.status_code == 201
+    assert response.json()["file_url"] == "https://fakeurl.com"
+    assert mock_b2_upload_bytes.call_args.args[:2] == (CONTENT, "file.bin")
+    assert (await get_session(async_client, logged_in_token, session_id)).status_code == 404
+
+@pytest.mark.anyio
+async def test_finalize_with_missing_chunks(async_client: AsyncClient, logged_in_token: str, upload_session: dict):
+    await put_chunk(async_client, logged_in_token, upload_session["id"], 0, CONTENT[:4])
+    response = await finalize(async_client, logged_in_token, upload_session["id"])
+
+    assert response.status_code == 409
+    assert response.json()["detail"]["missing_chunks"] == [1, 2]
+
+@pytest.mark.anyio
+async def test_upload_chunk_wrong_size(async_client: AsyncClient, logged_in_token: str, upload_session: dict):
+    response = await put_chunk(async_client, logged_in_token, upload_session["id"], 0, b"01")
+
+    assert response.status_code == 400
+    assert (await get_session(async_client, logged_in_token, upload_session["id"])).json()["missing_chunks"] == [0, 1, 2]
+
+@pytest.mark.anyio
+async def test_upload_chunk_too_large_stops_writing(async_client: AsyncClient, logged_in_token: str, upload_session: dict):
+    response = await put_chunk(async_client, logged_in_token, upload_session["id"], 0, CONTENT)
+
+    assert response.status_code == 400
+    assert os.listdir(session_dir(upload_session["id"])) == []
+
+@pytest.mark.anyio
+async def test_finalize_already_running(async_client: AsyncClient, logged_in_token: str, upload_session: dict, mock_b2_upload_bytes):
+    for index in range(3):
+        await put_chunk(async_client, logged_in_token, upload_session["id"], index, CONTENT[index * 4:index * 4 + 4])
+    assert await claim_finalize(upload_session["id"])
+
+    response = await finalize(async_client, logged_in_token, upload_session["id"])
+
+    assert response.status_code == 409
+    mock_b2_upload_bytes.assert_not_called()
+
+@pytest.mark.anyio
+async def test_failed_finalize_can_be_retried(async_client: AsyncClient, logged_in_token: str, upload_session: dict, mock_b2_upload_bytes):
+    for index in range(3):
+        await put_chunk(async_client, logged_in_token, upload_session["id"], index, CONTENT[index * 4:index * 4 + 4])
+    mock_b2_upload_bytes.side_effect = [Exception("B2 is down"), "https://fakeurl.com"]
+
+    assert (await finalize(async_client, logged_in_token, upload_session["id"])).status_code == 500
+    assert (await finalize(async_client, logged_in_token, upload_session["id"])).status_code == 201
+
+@pytest.mark.anyio
+async def test_upload_chunk_out_of_range(async_client: AsyncClient, logged_in_token: str, upload_session: dict):
+    response = await put_chunk(async_client, logged_in_token, upload_session["id"], 3, b"01")
+
+    assert response.status_code == 400
+
+@pytest.mark.anyio
+async def test_upload_session_not_found(async_client: AsyncClient, logged_in_token: str):
+    response = await get_session(async_client, logged_in_token, "missing")
+
+    assert response.status_code == 404
+
+@pytest.mark.anyio
+async def test_collect_abandoned_sessions(async_client: AsyncClient, logged_in_token: str, upload_session: dict, db: Database):
+    await put_chunk(async_client, logged_in_token, upload_session["id"], 0, CONTENT[:4])
+
+    assert await collect_abandoned_sessions(db, ttl_seconds=3600) == []
+    assert await collect_abandoned_sessions(db, ttl_seconds=-1) == [upload_session["id"]]
+    assert (await get_session(async_client, logged_in_token, upload_session["id"])).status_code == 404
+    assert not os.path.exists(session_dir(upload_session["id"]))
+
+@pytest.mark.anyio
+async def test_collect_skips_sessions_touched_meanwhile(upload_session: dict, db: Database, mocker):
+    fetch_all = db.fetch_all
+
+    async def select_then_touch(query):
+        rows = await fetch_all(query)
+        await touch_session(db, upload_session["id"])
+        return rows
+
+    mocker.patch.object(db, "fetch_all", side_effect=select_then_touch)
+
+    assert await collect_abandoned_sessions(db, ttl_seconds=0) == []
+    assert os.path.exists(session_dir(upload_session["id"]))
@@ -1,12 +1,20 @@
 import pytest
 from httpx import AsyncClient
-from fastapi import status, BackgroundTasks
-from storeapi import security, tasks
+from databases import Database
+from fastapi import status
+from storeapi import security, jobs
+from storeapi.database import job_table
+from storeapi.hashing import HashingPool
 
 
 async def register_user(async_client: AsyncClient, email: str, password: str):
     return await async_client.post("/register", json={"email":email, "password": password})
 
+async def get_confirmation_link(db: Database) -> str:
+    query = job_table.select().where(job_table.c.type == jobs.SEND_REGISTRATION_EMAIL).order_by(job_table.c.id.desc())
+    job = await db.fetch_one(query)
+    return job.payload["confirmation_link"]
+
 @pytest.mark.anyio
 async def test_register_user(async_client: AsyncClient):
     response = await register_user(async_client, "test@example.com", "password123")
@@ -15,6 +23,24 @@ async def test_register_user(async_client: AsyncClient):
     assert "User registered successfully" in response.text
     
     
+@pytest.mark.anyio
+async def test_register_user_sends_email(async_client: AsyncClient, mock_httpx_client, db: Database):
+    await register_user(async_client, "test@example.com", "password123")
+    await jobs.JobWorker(db).drain()
+    
+    mock_httpx_client.post.assert_called_once()
+    assert mock_httpx_client.post.call_args.kwargs["data"]["to"] == ["test@example.com"]
+    
+    
+@pytest.mark.anyio
+async def test_register_user_hashing_busy(async_client: AsyncClient, mocker):
+    mocker.patch("storeapi.security.hashing_pool", return_value=HashingPool(workers=1, max_pending=0))
+    response = await register_user(async_client, "test@example.com", "password123")
+    
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    
+    
 @pytest.mark.anyio
 async def test_register_user_already_exists(async_client:AsyncClient, registered_user:dict):
     response = await register_user(async_client, registered_user["email"], registered_user["password"])
@@ -33,10 +59,9 @@ async def test_register_user_already_exists(async_client:AsyncClient, registered
 #     assert "User confirmed" in response.text
 
 @pytest.mark.anyio
-async def test_confirm_user(async_client:AsyncClient, mocker):
-    spy = mocker.spy(BackgroundTasks, "add_task")
+async def test_confirm_user(async_client:AsyncClient, db: Database):
     await register_user(async_client, "test@example.net", "1234")
-    confirmation_url = str(spy.call_args[1]["confirmation_link"])
+    confirmation_url = await get_confirmation_link(db)
     print(f"Confirmation {confirmation_url}")
 
     response = await async_client.get(confirmation_url)
@@ -47,6 +72,16 @@ async def test_confirm_user(async_client:AsyncClient, mocker):
     assert "User confirmed" in response.json()["detail"]
 
     
+@pytest.mark.anyio
+async def test_confirm_user_invalidates_cached_user(async_client:AsyncClient, db: Database):
+    await register_user(async_client, "test@example.net", "1234")
+    assert not (await security.get_user("test@example.net")).confirmed
+    
+    await async_client.get(await get_confirmation_link(db))
+    
+    assert (await security.get_user("test@example.net")).confirmed
+
+    
 @pytest.mark.anyio
 async def test_confirm_user_invalid_token(async_client:AsyncClient):
     response = await async_client.get("/confirm/invalid_token")
@@ -55,12 +90,11 @@ async def test_confirm_user_invalid_token(async_client:AsyncClient):
     assert "Invalid token" in response.text
 
 @pytest.mark.anyio
-async def test_confirm_user_expired_token(async_client:AsyncClient, mocker):
+async def test_confirm_user_expired_token(async_client:AsyncClient, mocker, db: Database):
     mocker.patch("storeapi.security.confirm_token_expired_minutes", return_value=-1)
-    spy = mocker.spy(BackgroundTasks, "add_task")
     await register_user(async_client, "test@example.com", "password123")
     
-    confirmation_url = str(spy.call_args[1]["confirmation_link"])
+    confirmation_url = await get_confirmation_link(db)
     response = await async_client.get(confirmation_url)
     
     assert response.status_code == 401
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+import pytest
+from storeapi.libs.b2 import aio
+
+
+@pytest.fixture(autouse=True)
+def b2_metrics(mocker):
+    return mocker.patch.object(aio, "b2_metrics", aio.B2Metrics())
+
+
+@pytest.mark.anyio
+async def test_run_b2_off_event_loop(b2_metrics):
+    thread_name = await aio.run_b2("op", 1, lambda: threading.current_thread().name)
+    
+    assert thread_name.startswith("b2")
+    assert b2_metrics.stats()["op"]["calls"] == 1
+    assert b2_metrics.stats()["op"]["in_flight"] == 0
+
+
+@pytest.mark.anyio
+async def test_run_b2_failure(b2_metrics):
+    def fail():
+        raise ValueError("boom")
+    
+    with pytest.raises(ValueError):
+        await aio.run_b2("op", 1, fail)
+    assert b2_metrics.stats()["op"]["failures"] == 1
+
+
+@pytest.mark.anyio
+async def test_run_b2_timeout(b2_metrics):
+    release = threading.Event()
+    
+    with pytest.raises(asyncio.TimeoutError):
+        await aio.run_b2("op", 0.01, release.wait)
+    release.set()
+    assert b2_metrics.stats()["op"]["timeouts"] == 1
+    assert b2_metrics.stats()["op"]["in_flight"] == 0
+
+
+@pytest.mark.anyio
+async def test_upload_bytes(mocker):
+    b2_upload_bytes = mocker.patch("storeapi.libs.b2.aio.b2_upload_bytes", return_value="https://fakeurl.com")
+    
+    assert await aio.upload_bytes(b"data", "file.txt") == "https://fakeurl.com"
+    b2_upload_bytes.assert_called_once_with(b"data", "file.txt", "b2/x-auto")
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from storeapi.batching import RecipientBatcher
+
+
+@pytest.fixture()
+def send_batch(mocker):
+    return mocker.AsyncMock(return_value="sent")
+
+
+@pytest.mark.anyio
+async def test_messages_in_window_sent_together(send_batch):
+    batcher = RecipientBatcher(send_batch, window=0.01, max_recipients=10)
+    
+    results = await asyncio.gather(
+        batcher.send("welcome", "a@example.net", {"name": "a"}),
+        batcher.send("welcome", "b@example.net", {"name": "b"}),
+    )
+    
+    assert results == ["sent", "sent"]
+    send_batch.assert_awaited_once_with("welcome", {"a@example.net": {"name": "a"}, "b@example.net": {"name": "b"}})
+
+
+@pytest.mark.anyio
+async def test_messages_batched_by_key(send_batch):
+    batcher = RecipientBatcher(send_batch, window=0.01, max_recipients=10)
+    
+    await asyncio.gather(batcher.send("welcome", "a@example.net", {}), batcher.send("goodbye", "a@example.net", {}))
+    
+    assert send_batch.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_repeated_recipient_starts_new_batch(send_batch):
+    batcher = RecipientBatcher(send_batch, window=0.01, max_recipients=10)
+    
+    await asyncio.gather(batcher.send("welcome", "a@example.net", {"n": 1}), batcher.send("welcome", "a@example.net", {"n": 2}))
+    
+    assert [call.args[1] for call in send_batch.await_args_list] == [{"a@example.net": {"n": 1}}, {"a@example.net": {"n": 2}}]
+
+
+@pytest.mark.anyio
+async def test_full_batch_sent_before_window_closes(send_batch):
+    batcher = RecipientBatcher(send_batch, window=60, max_recipients=2)
+    
+    await asyncio.wait_for(
+        asyncio.gather(batcher.send("welcome", "a@example.net", {}), batcher.send("welcome", "b@example.net", {})),
+        timeout=1,
+    )
+    
+    send_batch.assert_awaited_once()
+
+
+@pytest.mark.anyio
+async def test_batch_failure_reported_to_every_message(send_batch):
+    send_batch.side_effect = Exception("Mailgun is down")
+    batcher = RecipientBatcher(send_batch, window=0.01, max_recipients=10)
+    
+    results = await asyncio.gather(
+        batcher.send("welcome", "a@example.net", {}),
+        batcher.send("welcome", "b@example.net", {}),
+        return_exceptions=True,
+    )
+    
+    assert all(isinstance(result, Exception) for result in results)
+
+
+@pytest.mark.anyio
+async def test_flush_sends_pending_messages(send_batch):
+    batcher = RecipientBatcher(send_batch, window=60, max_recipients=10)
+    message = asyncio.create_task(batcher.send("welcome", "a@example.net", {}))
+    await asyncio.sleep(0)
+    
+    await batcher.flush()
+    
+    assert await message == "sent"
+
+
+@pytest.mark.anyio
+async def test_rejected_batch_split_until_bad_message_alone(send_batch):
+    def reject_bad(key, recipients):
+        if "bad@example.net" in recipients:
+            raise ValueError("invalid address")
+        return "sent"
+
+    send_batch.side_effect = reject_bad
+    batcher = RecipientBatcher(send_batch, window=0.01, max_recipients=10, split_on=lambda e: isinstance(e, ValueError))
+    recipients = ["a@example.net", "bad@example.net", "c@example.net", "d@example.net"]
+
+    results = await asyncio.gather(*(batcher.send("welcome", recipient, {}) for recipient in recipients), return_exceptions=True)
+
+    assert results[0] == results[2] == results[3] == "sent"
+    assert isinstance(results[1], ValueError)
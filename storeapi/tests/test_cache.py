@@ -0,0 +1,47 @@
+from storeapi.cache import TTLCache
+
+
+def test_cache_hit_and_miss():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.stats() == {"size": 1, "maxsize": 2, "hits": 1, "misses": 1}
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_cache_entries_expire(mocker):
+    monotonic = mocker.patch("storeapi.cache.time.monotonic", return_value=100.0)
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    monotonic.return_value = 110.0
+    
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_cache_delete():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.delete("a")
+    
+    assert cache.get("a") is None
+
+
+def test_cache_disabled():
+    cache = TTLCache(maxsize=0, ttl=60)
+    cache.set("a", 1)
+    
+    assert cache.get("a") is None
@@ -0,0 +1,51 @@
+import pytest
+from databases import Database
+from httpx import AsyncClient
+from storeapi.counters import reconcile_post_counters
+from storeapi.database import post_table
+from storeapi.tests.helpers import create_comment, like_post
+
+
+async def get_counters(db: Database, post_id: int):
+    return await db.fetch_one(
+        post_table.select().with_only_columns(post_table.c.like_count, post_table.c.comment_count).where(post_table.c.id == post_id)
+    )
+
+
+@pytest.mark.anyio
+async def test_like_and_comment_update_counters(async_client: AsyncClient, created_post: dict, logged_in_token: str, db: Database):
+    await like_post(async_client, created_post["id"], logged_in_token)
+    await create_comment("Comment 1", created_post["id"], async_client, logged_in_token)
+    await create_comment("Comment 2", created_post["id"], async_client, logged_in_token)
+    
+    counters = await get_counters(db, created_post["id"])
+    
+    assert (counters.like_count, counters.comment_count) == (1, 2)
+
+
+@pytest.mark.anyio
+async def test_reconcile_post_counters(async_client: AsyncClient, created_post: dict, logged_in_token: str, db: Database):
+    await like_post(async_client, created_post["id"], logged_in_token)
+    await create_comment("Comment", created_post["id"], async_client, logged_in_token)
+    await db.execute(post_table.update().values(like_count=0, comment_count=5))
+    
+    assert await reconcile_post_counters(db) == [created_post["id"]]
+    
+    counters = await get_counters(db, created_post["id"])
+    assert (counters.like_count, counters.comment_count) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_reconcile_post_counters_nothing_drifted(created_post: dict, db: Database):
+    assert await reconcile_post_counters(db) == []
+
+
+@pytest.mark.anyio
+async def test_reconcile_post_counters_in_one_statement(created_post: dict, db: Database, mocker):
+    await db.execute(post_table.update().values(comment_count=5))
+    spy = mocker.spy(db, "fetch_all")
+    execute = mocker.spy(db, "execute")
+
+    assert await reconcile_post_counters(db) == [created_post["id"]]
+    assert spy.call_count == 1
+    execute.assert_not_called()
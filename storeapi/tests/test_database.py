@@ -0,0 +1,41 @@
+import pytest
+import sqlalchemy
+from storeapi import database as database_module
+from storeapi.database import SchemaError, check_schema, create_schema, metadata, post_table
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    yield engine
+    engine.dispose()
+
+
+def test_check_schema_reports_missing_tables(engine):
+    post_table.create(engine)
+
+    with pytest.raises(SchemaError) as e:
+        check_schema(engine)
+    assert "users" in str(e.value)
+    assert "posts" not in str(e.value).split("missing ")[1]
+
+
+def test_create_schema_adds_columns_and_indexes(engine):
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text("CREATE TABLE posts (id INTEGER PRIMARY KEY, body VARCHAR NOT NULL, user_id INTEGER NOT NULL)"))
+    with pytest.raises(SchemaError, match="posts.like_count"):
+        check_schema(engine)
+
+    create_schema(engine)
+
+    check_schema(engine)
+    assert sqlalchemy.inspect(engine).get_table_names() == sorted(metadata.tables)
+
+
+def test_check_mode_does_not_change_schema(engine, mocker):
+    mocker.patch.object(database_module, "get_engine", return_value=engine)
+    mocker.patch.object(database_module.config, "DATABASE_SCHEMA_MODE", "check")
+
+    with pytest.raises(SchemaError):
+        database_module.prepare_schema()
+    assert sqlalchemy.inspect(engine).get_table_names() == []
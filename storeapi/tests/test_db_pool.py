@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from databases import Database
+from storeapi.db_pool import Histogram, PoolTimeoutError, instrument_pool, pool_options, prewarm_pool
+
+
+@pytest.fixture()
+async def pooled(tmp_path, request):
+    database = Database(f"sqlite:///{tmp_path / 'pool.db'}")
+    metrics = instrument_pool(database, acquire_timeout=getattr(request, "param", 1))
+    await database.connect()
+    yield database, metrics
+    await database.disconnect()
+
+
+def test_histogram_is_cumulative():
+    histogram = Histogram((0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+    
+    assert histogram.cumulative() == {"0.1": 1, "1": 3, "+Inf": 4}
+    assert histogram.count == 4
+
+
+def test_pool_options_only_for_postgres():
+    assert pool_options("sqlite:///./test.db") == {}
+    assert set(pool_options("postgresql://localhost/storeapi")) == {"min_size", "max_size", "command_timeout"}
+
+
+@pytest.mark.anyio
+async def test_acquires_are_counted(pooled):
+    database, metrics = pooled
+    await database.fetch_val("SELECT 1")
+    
+    stats = metrics.stats()
+    assert (stats["in_use"], stats["waiters"]) == (0, 0)
+    assert stats["acquire_seconds"]["count"] == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("pooled", [0.01], indirect=True)
+async def test_acquire_timeout(pooled, mocker):
+    database, metrics = pooled
+    
+    async def slow_acquire(self):
+        await asyncio.sleep(5)
+    
+    mocker.patch("databases.backends.sqlite.SQLiteConnection.acquire", slow_acquire)
+    
+    with pytest.raises(PoolTimeoutError):
+        await database.fetch_val("SELECT 1")
+    assert (metrics.timeouts, metrics.waiters, metrics.in_use) == (1, 0, 0)
+
+
+@pytest.mark.anyio
+async def test_prewarm_acquires_connections(pooled):
+    database, metrics = pooled
+    await prewarm_pool(database, 3)
+    
+    assert metrics.acquire_seconds.count == 3
+    assert metrics.in_use == 0
@@ -0,0 +1,38 @@
+import pytest
+from storeapi import http_client
+from storeapi.config import config
+
+
+@pytest.fixture(autouse=True)
+async def shared_client():
+    yield
+    await http_client.close_http_client()
+
+
+@pytest.mark.anyio
+async def test_get_http_client_is_shared():
+    assert http_client.get_http_client() is http_client.get_http_client()
+
+
+@pytest.mark.anyio
+async def test_close_http_client():
+    client = http_client.get_http_client()
+    await http_client.close_http_client()
+    
+    assert client.is_closed
+    assert http_client.get_http_client() is not client
+
+
+def test_create_http_client_pool_limits(mocker):
+    mocker.patch.object(config, "HTTP_MAX_CONNECTIONS", 7)
+    client = http_client.create_http_client()
+    
+    assert client._transport._pool._max_connections == 7
+
+
+def test_create_http_client_without_h2(mocker):
+    mocker.patch.object(config, "HTTP2", True)
+    mocker.patch("storeapi.http_client.http2_available", return_value=False)
+    client = http_client.create_http_client()
+    
+    assert not client._transport._pool._http2
@@ -0,0 +1,95 @@
+import datetime
+import pytest
+from databases import Database
+from storeapi import jobs
+from storeapi.database import job_table
+
+
+@pytest.fixture()
+def handler(mocker):
+    return mocker.AsyncMock()
+
+
+@pytest.fixture()
+def job_type(handler, mocker) -> jobs.JobType:
+    job_type = jobs.JobType("test", handler, concurrency=2, visibility_timeout=60, max_attempts=2)
+    mocker.patch.dict(jobs.JOB_TYPES, {"test": job_type})
+    return job_type
+
+
+@pytest.fixture()
+def worker(db: Database, job_type: jobs.JobType) -> jobs.JobWorker:
+    return jobs.JobWorker(db, {"test": job_type})
+
+
+async def get_job(db: Database, job_id: int):
+    return await db.fetch_one(job_table.select().where(job_table.c.id == job_id))
+
+
+@pytest.mark.anyio
+async def test_enqueue_unknown_job_type(db: Database):
+    with pytest.raises(ValueError):
+        await jobs.enqueue(db, "unknown", {})
+
+
+@pytest.mark.anyio
+async def test_job_runs_and_is_removed(db: Database, worker: jobs.JobWorker, handler):
+    job_id = await jobs.enqueue(db, "test", {"value": 1})
+    await worker.drain()
+
+    handler.assert_awaited_once_with({"value": 1})
+    assert await get_job(db, job_id) is None
+
+
+@pytest.mark.anyio
+async def test_failed_job_is_retried_later(db: Database, worker: jobs.JobWorker, handler):
+    handler.side_effect = Exception("boom")
+    job_id = await jobs.enqueue(db, "test", {})
+    await worker.drain()
+
+    job = await get_job(db, job_id)
+    assert (job.status, job.attempts) == (jobs.PENDING, 1)
+    assert "boom" in job.last_error
+    assert handler.await_count == 1
+
+
+@pytest.mark.anyio
+async def test_job_fails_after_max_attempts(db: Database, worker: jobs.JobWorker, handler, mocker):
+    mocker.patch("storeapi.jobs.retry_delay", return_value=datetime.timedelta(0))
+    handler.side_effect = Exception("boom")
+    job_id = await jobs.enqueue(db, "test", {})
+    await worker.drain()
+
+    job = await get_job(db, job_id)
+    assert (job.status, job.attempts) == (jobs.FAILED, 2)
+
+
+@pytest.mark.anyio
+async def test_worker_respects_concurrency(db: Database, worker: jobs.JobWorker):
+    for _ in range(5):
+        await jobs.enqueue(db, "test", {})
+
+    started = await worker.run_once()
+
+    assert len(started) == 2
+    assert await worker.run_once() == []
+    await worker.stop()
+
+
+@pytest.mark.anyio
+async def test_job_past_visibility_timeout_is_claimed_again(db: Database, worker: jobs.JobWorker, handler):
+    job_id = await jobs.enqueue(db, "test", {})
+    await db.execute(
+        job_table.update()
+        .where(job_table.c.id == job_id)
+        .values(status=jobs.RUNNING, attempts=1, locked_until=jobs.now() - datetime.timedelta(seconds=1))
+    )
+    await worker.drain()
+
+    handler.assert_awaited_once()
+    assert await get_job(db, job_id) is None
+
+
+def test_retry_delay_backs_off_exponentially():
+    assert jobs.retry_delay(2) == 2 * jobs.retry_delay(1)
+    assert jobs.retry_delay(100) == datetime.timedelta(seconds=jobs.config.JOB_RETRY_BACKOFF_MAX_SECONDS)
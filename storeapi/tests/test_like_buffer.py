@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+import sqlalchemy
+from databases import Database
+from httpx import AsyncClient
+from storeapi import like_buffer as buffer_module
+from storeapi.database import like_table, post_table
+from storeapi.like_buffer import LikeBuffer, PostNotFoundError
+
+
+@pytest.fixture()
+def like_buffer(db: Database) -> LikeBuffer:
+    return LikeBuffer(db, interval=60, max_size=100)
+
+
+@pytest.fixture()
+def write_behind(like_buffer: LikeBuffer, mocker) -> LikeBuffer:
+    mocker.patch.object(buffer_module.config, "LIKE_WRITE_BEHIND", True)
+    mocker.patch("storeapi.like_buffer.like_buffer", return_value=like_buffer)
+    mocker.patch("storeapi.routes.post.like_buffer", return_value=like_buffer)
+    return like_buffer
+
+
+@pytest.mark.anyio
+async def test_likes_written_in_one_batch(db: Database, like_buffer: LikeBuffer, created_post: dict, confirmed_user: dict, mocker):
+    write_likes = mocker.spy(buffer_module, "write_likes")
+    first = asyncio.create_task(like_buffer.like(confirmed_user["id"], created_post["id"]))
+    second = asyncio.create_task(like_buffer.like(confirmed_user["id"], created_post["id"]))
+    await asyncio.sleep(0.01)
+    
+    assert like_buffer.buffered_likes(created_post["id"]) == 1
+    await like_buffer.flush()
+    
+    (like, created), (again, created_again) = await first, await second
+    assert like == again
+    assert (created, created_again) == (True, False)
+    assert write_likes.call_count == 1
+    assert like_buffer.buffered_likes(created_post["id"]) == 0
+    assert len(await db.fetch_all(like_table.select())) == 1
+
+
+@pytest.mark.anyio
+async def test_existing_like_is_returned(like_buffer: LikeBuffer, created_post: dict, confirmed_user: dict):
+    like = asyncio.create_task(like_buffer.like(confirmed_user["id"], created_post["id"]))
+    await asyncio.sleep(0.01)
+    await like_buffer.flush()
+    stored, created = await like
+    
+    # Found in the database, without being buffered or waiting for a flush
+    assert await like_buffer.like(confirmed_user["id"], created_post["id"]) == (stored, False)
+    assert created
+    assert like_buffer.buffered_likes(created_post["id"]) == 0
+
+
+@pytest.mark.anyio
+async def test_like_inserted_elsewhere_during_flush(db: Database, like_buffer: LikeBuffer, created_post: dict, confirmed_user: dict, mocker):
+    fetch_all = db.fetch_all
+    inserted_elsewhere = []
+
+    async def like_first(query, *args, **kwargs):
+        # Another worker or /like/batch likes the post right before the flush inserts it
+        if isinstance(query, sqlalchemy.Insert) and query.table is like_table and not inserted_elsewhere:
+            inserted_elsewhere.append(
+                await db.execute(like_table.insert().values(user_id=confirmed_user["id"], post_id=created_post["id"]))
+            )
+        return await fetch_all(query, *args, **kwargs)
+
+    mocker.patch.object(db, "fetch_all", side_effect=like_first)
+    like = asyncio.create_task(like_buffer.like(confirmed_user["id"], created_post["id"]))
+    await asyncio.sleep(0.01)
+    await like_buffer.flush()
+    
+    stored, created = await like
+    assert (stored["id"], created) == (inserted_elsewhere[0], False)
+    assert await db.fetch_val(sqlalchemy.select(post_table.c.like_count).where(post_table.c.id == created_post["id"])) == 0
+
+
+@pytest.mark.anyio
+async def test_like_on_missing_post(like_buffer: LikeBuffer, confirmed_user: dict):
+    like = asyncio.create_task(like_buffer.like(confirmed_user["id"], 99))
+    await asyncio.sleep(0.01)
+    await like_buffer.flush()
+    
+    with pytest.raises(PostNotFoundError):
+        await like
+
+
+@pytest.mark.anyio
+async def test_buffered_likes_visible_to_reads(
+    async_client: AsyncClient, write_behind: LikeBuffer, created_post: dict, logged_in_token: str
+):
+    like = asyncio.create_task(
+        async_client.post(
+            "/like", json={"post_id": created_post["id"]}, headers={"Authorization": f"Bearer {logged_in_token}"}
+        )
+    )
+    while not write_behind.buffered_likes(created_post["id"]):
+        await asyncio.sleep(0.01)
+    
+    posts = (await async_client.get("/post")).json()
+    detail = (await async_client.get(f"/post/{created_post['id']}")).json()
+    await write_behind.flush()
+    
+    assert (await like).status_code == 201
+    assert posts[0]["likes"] == 1
+    assert detail["post"]["likes"] == 1
+    assert (await async_client.get("/post")).json()[0]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_repeated_like_answers_200(
+    async_client: AsyncClient, write_behind: LikeBuffer, created_post: dict, logged_in_token: str
+):
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    like = asyncio.create_task(async_client.post("/like", json={"post_id": created_post["id"]}, headers=headers))
+    while not write_behind.buffered_likes(created_post["id"]):
+        await asyncio.sleep(0.01)
+    await write_behind.flush()
+    
+    again = await async_client.post("/like", json={"post_id": created_post["id"]}, headers=headers)
+    
+    assert (await like).status_code == 201
+    assert again.status_code == 200
+    assert again.json() == (await like).json()
+    assert (await async_client.get("/post")).json()[0]["likes"] == 1
@@ -0,0 +1,56 @@
+import logging
+import queue
+import pytest
+from storeapi.logging_conf import BoundedQueueHandler, start_queue_logging, stop_queue_logging
+
+
+def make_record(message: str) -> logging.LogRecord:
+    return logging.LogRecord("storeapi.test", logging.INFO, __file__, 1, message, None, None)
+
+
+@pytest.mark.parametrize(
+    "overflow, expected",
+    [
+        ("drop_new", ["first"]),
+        ("drop_oldest", ["second"]),
+    ],
+)
+def test_queue_handler_overflow(overflow: str, expected: list):
+    handler = BoundedQueueHandler(queue.Queue(1), overflow)
+    handler.handle(make_record("first"))
+    handler.handle(make_record("second"))
+    
+    assert [handler.queue.get_nowait().getMessage()] == expected
+    assert handler.dropped == 1
+
+
+class ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def test_start_queue_logging():
+    target = logging.getLogger("storeapi.tests.queue_logging")
+    target.propagate = False
+    handler = ListHandler()
+    tag = logging.Filter()
+    tag.filter = lambda record: setattr(record, "tag", "filtered") or True
+    handler.addFilter(tag)
+    target.addHandler(handler)
+    
+    try:
+        start_queue_logging([target.name])
+        assert [type(h) for h in target.handlers] == [BoundedQueueHandler]
+        assert target.handlers[0].filters == [tag]
+        assert handler.filters == []
+        
+        target.warning("hello")
+    finally:
+        stop_queue_logging()
+        target.handlers.clear()
+    
+    assert [(r.getMessage(), r.tag) for r in handler.records] == [("hello", "filtered")]
@@ -0,0 +1,93 @@
+import json
+import os
+import pytest
+from httpx import AsyncClient
+from storeapi import metrics
+from storeapi.response_cache import response_cache
+from storeapi.security import user_cache
+
+
+def snapshot(pid: int, *registered: metrics.Metric) -> dict:
+    return {"pid": pid, "metrics": {metric.name: metric.snapshot() for metric in registered}}
+
+
+def test_merge_adds_up_workers(mocker):
+    mocker.patch.object(metrics, "process_alive", return_value=True)
+    requests = metrics.Counter("requests_total", "Requests.", ("route",))
+    seconds = metrics.Histogram("seconds", "Seconds.", buckets=(0.1, 1))
+    requests.inc(route="/post")
+    seconds.observe(0.05)
+    other_requests = metrics.Counter("requests_total", "Requests.", ("route",))
+    other_seconds = metrics.Histogram("seconds", "Seconds.", buckets=(0.1, 1))
+    other_requests.inc(2, route="/post")
+    other_seconds.observe(5)
+
+    text = metrics.render(metrics.merge([snapshot(1, requests, seconds), snapshot(2, other_requests, other_seconds)]))
+
+    assert 'requests_total{route="/post"} 3.0' in text
+    assert 'seconds_bucket{le="0.1"} 1' in text
+    assert 'seconds_bucket{le="1.0"} 1' in text
+    assert 'seconds_bucket{le="+Inf"} 2' in text
+    assert "seconds_count 2" in text
+
+
+def test_merge_skips_gauges_of_exited_workers(mocker):
+    mocker.patch.object(metrics, "process_alive", return_value=False)
+    running = metrics.Gauge("running", "Running.")
+    finished = metrics.Counter("finished_total", "Finished.")
+    running.set(3)
+    finished.inc()
+
+    merged = metrics.merge([snapshot(-1, running, finished)])
+
+    assert "running" not in merged
+    assert merged["finished_total"]["samples"] == {(): 1}
+
+
+def test_label_values_escaped():
+    assert metrics.format_labels(["path"], ('a"b\\c\n',)) == '{path="a\\"b\\\\c\\n"}'
+
+
+def test_outbound_call_counts_errors():
+    with pytest.raises(ConnectionError):
+        with metrics.outbound_call("mailgun", "test-failure"):
+            raise ConnectionError()
+
+    assert metrics.outbound_errors.values[("mailgun", "test-failure")] == 1
+    assert metrics.outbound_seconds.values[("mailgun", "test-failure")].count == 1
+
+
+@pytest.mark.anyio
+async def test_metrics_by_route(async_client: AsyncClient):
+    await async_client.get("/post")
+    response = await async_client.get("/metrics")
+
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert 'storeapi_http_requests_total{method="GET",route="/post",status="200"}' in response.text
+    assert 'storeapi_db_query_duration_seconds_count{method="fetch_all",route="/post"}' in response.text
+    assert "storeapi_db_pool_connections" in response.text
+
+
+@pytest.mark.anyio
+async def test_metrics_include_cache_stats(async_client: AsyncClient, mocker):
+    mocker.patch.object(user_cache, "hits", 3)
+    mocker.patch.object(response_cache.backend.entries, "misses", 2)
+    response = await async_client.get("/metrics")
+
+    assert 'storeapi_cache_hits_total{cache="user"} 3.0' in response.text
+    assert 'storeapi_cache_misses_total{cache="response"} 2.0' in response.text
+    assert 'storeapi_cache_entries{cache="response"}' in response.text
+
+
+@pytest.mark.anyio
+async def test_metrics_include_other_workers(async_client: AsyncClient, tmp_path, mocker):
+    mocker.patch.object(metrics.config, "METRICS_DIR", str(tmp_path))
+    worker = metrics.Counter("storeapi_http_requests_total", "HTTP requests served.", ("method", "route", "status"))
+    worker.inc(5, method="GET", route="/other-worker", status=200)
+    (tmp_path / "metrics-1.json").write_text(json.dumps(snapshot(1, worker)))
+
+    metrics.write_snapshot()
+    response = await async_client.get("/metrics")
+
+    assert os.path.exists(metrics.snapshot_path(os.getpid()))
+    assert 'storeapi_http_requests_total{method="GET",route="/other-worker",status="200"} 5.0' in response.text
@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from storeapi.multipart_stream import StreamedFile
+
+BOUNDARY = b"boundary"
+
+
+def multipart_request(*chunks: bytes, content_type: bytes = b"multipart/form-data; boundary=" + BOUNDARY):
+    received = []
+    pending = list(chunks)
+
+    async def receive() -> dict:
+        chunk = pending.pop(0)
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+    scope = {"type": "http", "method": "POST", "headers": [(b"content-type", content_type)]}
+    return Request(scope, receive), received
+
+
+def part(name: str, body: bytes, filename: str = None) -> bytes:
+    disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+    headers = f"Content-Disposition: {disposition}\r\n"
+    if filename:
+        headers += "Content-Type: application/octet-stream\r\n"
+    return b"--" + BOUNDARY + b"\r\n" + headers.encode() + b"\r\n" + body + b"\r\n"
+
+
+@pytest.mark.anyio
+async def test_file_read_while_the_body_arrives():
+    request, received = multipart_request(
+        part("note", b"hello"), part("file", b"0123", "data.bin")[:-2], b"4567", b"89\r\n--" + BOUNDARY + b"--\r\n"
+    )
+    file = await StreamedFile(request).open()
+
+    assert (file.filename, file.content_type) == ("data.bin", "application/octet-stream")
+    assert await file.read(4) == b"0123"
+    assert len(received) == 2
+    assert await file.read() == b"456789"
+    assert await file.read(4) == b""
+
+
+@pytest.mark.anyio
+async def test_missing_file_field():
+    request, _ = multipart_request(part("note", b"hello") + b"--" + BOUNDARY + b"--\r\n")
+
+    with pytest.raises(HTTPException) as e:
+        await StreamedFile(request).open()
+    assert e.value.status_code == 400
+
+
+def test_rejects_other_bodies():
+    request, _ = multipart_request(b"{}", content_type=b"application/json")
+
+    with pytest.raises(HTTPException) as e:
+        StreamedFile(request)
+    assert e.value.status_code == 400
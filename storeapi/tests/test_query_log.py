@@ -0,0 +1,65 @@
+import logging
+import pytest
+from databases import Database
+from storeapi import query_log
+from storeapi.database import user_table
+
+
+@pytest.fixture()
+def sql_log(mocker):
+    return mocker.patch.object(query_log.logger, "log")
+
+
+@pytest.fixture()
+def sql_level():
+    level = query_log.logger.level
+    yield query_log.logger.setLevel
+    query_log.logger.setLevel(level)
+
+
+@pytest.mark.anyio
+async def test_query_not_compiled_when_not_tracing(db: Database, sql_log, sql_level, mocker):
+    sql_level(logging.INFO)
+    compile_query = mocker.spy(query_log, "compile_query")
+    
+    await db.fetch_all(user_table.select())
+    
+    compile_query.assert_not_called()
+    sql_log.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_query_logged_at_debug(db: Database, sql_log, sql_level):
+    sql_level(logging.DEBUG)
+    
+    await db.execute(user_table.insert().values(email="test@example.net", password="secret", confirmed=False))
+    
+    level, _, _, sql = sql_log.call_args.args
+    params = sql_log.call_args.kwargs["extra"]["params"]
+    assert level == logging.DEBUG
+    assert sql.startswith("INSERT INTO users")
+    assert params["email"] == "test@example.net"
+    assert params["password"] == query_log.REDACTED
+
+
+@pytest.mark.anyio
+async def test_sampled_query_logged_at_info(db: Database, sql_log, sql_level):
+    sql_level(logging.INFO)
+    token = query_log.sampled.set(True)
+    try:
+        await db.fetch_one(user_table.select().where(user_table.c.email == "test@example.net"))
+    finally:
+        query_log.sampled.reset(token)
+    
+    assert sql_log.call_args.args[0] == logging.INFO
+    assert sql_log.call_args.kwargs["extra"]["duration_ms"] >= 0
+
+
+@pytest.mark.anyio
+async def test_sampled_request_traces_queries(async_client, sql_log, sql_level, mocker):
+    sql_level(logging.INFO)
+    mocker.patch.object(query_log.config, "SQL_TRACE_SAMPLE_RATE", 1.0)
+    
+    await async_client.get("/post")
+    
+    assert sql_log.call_args.args[3].startswith("SELECT")
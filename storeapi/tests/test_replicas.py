@@ -0,0 +1,72 @@
+import itertools
+from typing import Optional
+import pytest
+import sqlalchemy
+from httpx import AsyncClient
+from storeapi.cache import TTLCache
+from storeapi.database import database, metadata, post_table
+from storeapi.query_log import QueryLoggingDatabase
+
+
+@pytest.fixture()
+async def replica(tmp_path, mocker):
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = sqlalchemy.create_engine(url)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(post_table.insert().values(id=1000, body="From replica", user_id=1))
+    replica = QueryLoggingDatabase(url)
+    await replica.connect()
+    mocker.patch.object(database, "replicas", [replica])
+    mocker.patch.object(database, "healthy", {replica: True})
+    mocker.patch.object(database, "_next_replica", itertools.cycle([replica]))
+    mocker.patch.object(database, "sticky", TTLCache(maxsize=10, ttl=60))
+    yield replica
+    await replica.disconnect()
+
+
+async def post_bodies(async_client: AsyncClient, headers: Optional[dict] = None) -> list[str]:
+    response = await async_client.get("/post", headers=headers)
+    return [post["body"] for post in response.json()]
+
+
+@pytest.mark.anyio
+async def test_reads_go_to_replica(async_client: AsyncClient, replica: QueryLoggingDatabase):
+    assert await post_bodies(async_client) == ["From replica"]
+
+
+@pytest.mark.anyio
+async def test_client_reads_own_writes_from_primary(async_client: AsyncClient, logged_in_token: str, replica: QueryLoggingDatabase):
+    await post_bodies(async_client)
+    headers = {"Authorization": f"Bearer {logged_in_token}"}
+    await async_client.post("/post", json={"body": "Test Post"}, headers=headers)
+    
+    assert await post_bodies(async_client, headers) == ["Test Post"]
+
+
+@pytest.mark.anyio
+async def test_cache_filled_from_primary_after_write(async_client: AsyncClient, logged_in_token: str, replica: QueryLoggingDatabase):
+    await async_client.post("/post", json={"body": "Test Post"}, headers={"Authorization": f"Bearer {logged_in_token}"})
+    
+    # Another client, reading while the replica may still lag behind the write
+    assert await post_bodies(async_client) == ["Test Post"]
+    assert await post_bodies(async_client) == ["Test Post"]
+
+
+@pytest.mark.anyio
+async def test_failed_replica_falls_back_to_primary(async_client: AsyncClient, replica: QueryLoggingDatabase, mocker):
+    mocker.patch.object(replica, "fetch_all", side_effect=ConnectionError("replica down"))
+    
+    assert await post_bodies(async_client) == []
+    assert database.healthy[replica] is False
+
+
+@pytest.mark.anyio
+async def test_health_check_restores_replica(replica: QueryLoggingDatabase, mocker):
+    database.healthy[replica] = False
+    await database.check_replicas()
+    assert database.healthy[replica] is True
+    
+    mocker.patch.object(replica, "fetch_val", side_effect=ConnectionError("replica down"))
+    await database.check_replicas()
+    assert database.healthy[replica] is False
@@ -0,0 +1,67 @@
+import pytest
+from storeapi import response_cache as cache
+from storeapi.response_cache import MemoryCacheBackend, ResponseCache
+
+
+@pytest.fixture()
+def response_cache() -> ResponseCache:
+    return ResponseCache(MemoryCacheBackend(maxsize=10, ttl=60))
+
+
+def loader(value, *tags):
+    calls = []
+
+    async def load():
+        calls.append(value)
+        return value, tags
+
+    load.calls = calls
+    return load
+
+
+@pytest.mark.anyio
+async def test_load_caches_value(response_cache: ResponseCache):
+    load = loader("page")
+    assert await response_cache.load("key", load) == "page"
+    assert await response_cache.load("key", load) == "page"
+    assert load.calls == ["page"]
+
+
+@pytest.mark.anyio
+async def test_invalidate_tags_drops_tagged_entries(response_cache: ResponseCache):
+    await response_cache.load("a", loader("a", "post:1"))
+    await response_cache.load("b", loader("b", "post:2"))
+    
+    await response_cache.invalidate_tags("post:1")
+    
+    assert await response_cache.backend.get("a") is None
+    assert await response_cache.backend.get("b") == "b"
+
+
+@pytest.mark.anyio
+async def test_value_loaded_during_invalidation_is_not_cached(response_cache: ResponseCache):
+    async def load():
+        await response_cache.invalidate_tags("post:1")
+        return "stale", ["post:1"]
+    
+    assert await response_cache.load("key", load) == "stale"
+    assert await response_cache.backend.get("key") is None
+
+
+@pytest.mark.anyio
+async def test_tag_index_is_pruned():
+    backend = MemoryCacheBackend(maxsize=2, ttl=60)
+    for i in range(20):
+        await backend.set(f"key{i}", i, [f"post:{i}"])
+    
+    assert len(backend.tags) <= 2 * 4
+
+
+def test_posts_page_tags():
+    posts = [{"id": 2, "likes": 3}, {"id": 1, "likes": 0}]
+    
+    assert cache.posts_page_tags("new", posts, None, "next") == {"post:1", "post:2", "posts:new:head"}
+    assert cache.posts_page_tags("old", posts, "cursor", None) == {"post:1", "post:2", "posts:old:tail"}
+    assert cache.posts_page_tags("most_likes", posts, None, "next") == {
+        "post:1", "post:2", cache.likes_tag(3), cache.likes_tag(0)
+    }
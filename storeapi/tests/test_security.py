@@ -3,6 +3,7 @@ import pytest
 from storeapi import security
 from jose import jwt
 from storeapi.config import config
+from storeapi.hashing import HashingPool
 def test_access_token_expired_minutes():
     assert security.access_token_expired_minutes() == 30
     
@@ -72,12 +73,44 @@ def test_password_hashes():
     password = "password"
     assert security.verify_password(password, security.get_password_hash(password))
 
+@pytest.mark.anyio
+async def test_password_hashes_async():
+    password = "password"
+    hashed_password = await security.get_password_hash_async(password)
+    
+    assert await security.verify_password_async(password, hashed_password)
+    assert not await security.verify_password_async("wrong password", hashed_password)
+
+@pytest.mark.anyio
+async def test_password_hashing_pool_busy(mocker):
+    mocker.patch("storeapi.security.hashing_pool", return_value=HashingPool(workers=1, max_pending=0))
+    
+    with pytest.raises(security.HTTPException) as exc_info:
+        await security.get_password_hash_async("password")
+    assert exc_info.value.status_code == 503
+
 @pytest.mark.anyio
 async def test_get_user(registered_user:dict):
     user = await security.get_user(registered_user["email"])
     
     assert user.email == registered_user["email"]
    
+@pytest.mark.anyio
+async def test_get_user_cached(registered_user:dict, mocker):
+    await security.get_user(registered_user["email"])
+    fetch_one = mocker.spy(security.database, "fetch_one")
+    
+    user = await security.get_user(registered_user["email"])
+    
+    assert user.email == registered_user["email"]
+    fetch_one.assert_not_called()
+    
+@pytest.mark.anyio
+async def test_user_not_found_not_cached():
+    await security.get_user("test@example.com")
+    
+    assert security.user_cache.get("test@example.com") is None
+   
 @pytest.mark.anyio
 async def test_user_not_found():
     user = await security.get_user("test@example.com")
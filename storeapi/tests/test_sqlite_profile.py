@@ -0,0 +1,108 @@
+import asyncio
+import sqlite3
+import pytest
+import sqlalchemy
+from storeapi.database import metadata, post_table
+from storeapi.sqlite_profile import SQLiteDatabase, is_write
+
+
+@pytest.fixture()
+async def sqlite_db(tmp_path):
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    metadata.create_all(sqlalchemy.create_engine(url))
+    sqlite_db = SQLiteDatabase(url)
+    await sqlite_db.connect()
+    yield sqlite_db
+    await sqlite_db.disconnect()
+
+
+async def insert_post(sqlite_db: SQLiteDatabase, body: str, **values) -> int:
+    return await sqlite_db.execute(post_table.insert().values(body=body, user_id=1, **values))
+
+
+def test_is_write():
+    assert not is_write(post_table.select())
+    assert not is_write("select 1")
+    assert is_write(post_table.insert())
+    assert is_write(post_table.update())
+    assert is_write("PRAGMA journal_mode = DELETE")
+
+
+@pytest.mark.anyio
+async def test_pragmas_applied_to_connections(sqlite_db: SQLiteDatabase):
+    assert await sqlite_db.fetch_val("PRAGMA journal_mode") == "wal"
+    # NORMAL
+    assert await sqlite_db.fetch_val("PRAGMA synchronous") == 1
+    assert await sqlite_db.fetch_val("PRAGMA busy_timeout") == 5000
+
+
+@pytest.mark.anyio
+async def test_reads_reuse_pooled_connections(sqlite_db: SQLiteDatabase):
+    pool = sqlite_db._backend._pool
+    await sqlite_db.fetch_all(post_table.select())
+    idle = list(pool.idle)
+    await sqlite_db.fetch_all(post_table.select())
+
+    assert pool.idle == idle
+    assert pool.get_idle_size() == 1
+
+
+@pytest.mark.anyio
+async def test_concurrent_writes_share_a_commit(sqlite_db: SQLiteDatabase):
+    ids = await asyncio.gather(*(insert_post(sqlite_db, f"Post {i}") for i in range(20)))
+
+    assert sorted(ids) == list(range(1, 21))
+    assert sqlite_db.writer.commits == 1
+    assert sqlite_db.writer.writes == 20
+    assert await sqlite_db.fetch_val(sqlalchemy.select(sqlalchemy.func.count()).select_from(post_table)) == 20
+
+
+@pytest.mark.anyio
+async def test_failed_write_leaves_its_group_committed(sqlite_db: SQLiteDatabase):
+    await insert_post(sqlite_db, "Existing", id=1)
+    results = await asyncio.gather(
+        insert_post(sqlite_db, "First"), insert_post(sqlite_db, "Duplicate", id=1), insert_post(sqlite_db, "Last"),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    rows = await sqlite_db.fetch_all(post_table.select().order_by(post_table.c.id))
+    assert [row.body for row in rows] == ["Existing", "First", "Last"]
+
+
+@pytest.mark.anyio
+async def test_transaction_holds_the_writer(sqlite_db: SQLiteDatabase):
+    with pytest.raises(RuntimeError):
+        async with sqlite_db.transaction():
+            await insert_post(sqlite_db, "Rolled back")
+            queued = asyncio.create_task(insert_post(sqlite_db, "After"))
+            await asyncio.sleep(0.01)
+            assert not queued.done()
+            raise RuntimeError("rollback")
+    await queued
+
+    rows = await sqlite_db.fetch_all(post_table.select())
+    assert [row.body for row in rows] == ["After"]
+
+
+@pytest.mark.anyio
+async def test_failed_commit_fails_every_queued_write(sqlite_db: SQLiteDatabase, mocker):
+    failing = mocker.Mock(transaction=mocker.Mock(side_effect=sqlite3.OperationalError("disk I/O error")))
+    mocker.patch.object(sqlite_db.writer, "connection", return_value=failing)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(insert_post(sqlite_db, f"Post {i}") for i in range(3)), return_exceptions=True), 5
+    )
+
+    assert all(isinstance(result, sqlite3.OperationalError) for result in results)
+
+
+@pytest.mark.anyio
+async def test_cancelled_committer_cancels_queued_writes(sqlite_db: SQLiteDatabase):
+    writes = [asyncio.create_task(insert_post(sqlite_db, f"Post {i}")) for i in range(3)]
+    await asyncio.sleep(0)
+    sqlite_db.writer._committer.cancel()
+
+    results = await asyncio.wait_for(asyncio.gather(*writes, return_exceptions=True), 5)
+
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
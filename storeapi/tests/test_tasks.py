@@ -1,8 +1,9 @@
+import json
 import httpx
 import pytest
 from databases import Database
 from storeapi.database import post_table
-from storeapi.tasks import APIResponseError, send_email, _generate_cute_creature_api, generate_and_add_to_post
+from storeapi.tasks import APIResponseError, rejected_recipients, send_email, _generate_cute_creature_api, generate_and_add_to_post, send_user_registration_email
 
 
 @pytest.mark.anyio
@@ -10,6 +11,35 @@ async def test_send_simple_email(mock_httpx_client):
     await send_email("test@example.com", "Test Subject", "Test Body")
     mock_httpx_client.post.assert_called()
     
+@pytest.mark.anyio
+async def test_send_email_with_injected_client(mock_httpx_client, mocker):
+    client = mocker.Mock()
+    client.post = mocker.AsyncMock(return_value=httpx.Response(status_code=200, request=httpx.Request("POST", "//")))
+    await send_email("test@example.com", "Test Subject", "Test Body", client=client)
+    
+    client.post.assert_called()
+    mock_httpx_client.post.assert_not_called()
+    
+@pytest.mark.anyio
+async def test_send_registration_email_batched(mock_httpx_client):
+    await send_user_registration_email("test@example.com", "http://example.net/confirm/token")
+    
+    data = mock_httpx_client.post.call_args.kwargs["data"]
+    assert data["to"] == ["test@example.com"]
+    assert "%recipient.confirmation_link%" in data["text"]
+    assert json.loads(data["recipient-variables"]) == {
+        "test@example.com": {"email": "test@example.com", "confirmation_link": "http://example.net/confirm/token"}
+    }
+    
+@pytest.mark.anyio
+async def test_send_registration_email_unbatched(mock_httpx_client, mocker):
+    mocker.patch("storeapi.tasks.config.EMAIL_BATCHING", False)
+    await send_user_registration_email("test@example.com", "http://example.net/confirm/token")
+    
+    data = mock_httpx_client.post.call_args.kwargs["data"]
+    assert "http://example.net/confirm/token" in data["text"]
+    assert "recipient-variables" not in data
+    
 @pytest.mark.anyio
 async def test_send_message_api_error(mock_httpx_client):
     mock_httpx_client.post.return_value = httpx.Response(
@@ -72,4 +102,7 @@ async def test_generate_and_add_to_post_success(
     
     updated_post = await db.fetch_one(query)
     
-    assert updated_post.image_url == json_data["output_url"]
\ No newline at end of file
+    assert updated_post.image_url == json_data["output_url"]
+@pytest.mark.parametrize("status_code, rejected", [(400, True), (429, False), (500, False)])
+def test_rejected_recipients(status_code: int, rejected: bool):
+    assert rejected_recipients(APIResponseError("failed", status_code)) is rejected
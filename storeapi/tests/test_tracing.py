@@ -0,0 +1,55 @@
+import pytest
+from storeapi import tracing
+from storeapi.tracing import TracesSampler
+
+
+def request(method: str, path: str) -> dict:
+    return {"asgi_scope": {"type": "http", "method": method, "path": path}}
+
+
+@pytest.fixture()
+def sampler() -> TracesSampler:
+    return TracesSampler(0.1, {"GET /post": 0.01, "/upload": 1.0, "POST /upload/session": 0.5})
+
+
+@pytest.mark.parametrize(
+    "method, path, rate",
+    [
+        ("GET", "/post", 0.01),
+        ("GET", "/post/1/comment", 0.01),
+        ("POST", "/post", 0.1),
+        ("GET", "/posts", 0.1),
+        ("POST", "/upload", 1.0),
+        ("POST", "/upload/session", 0.5),
+        ("PUT", "/upload/session/abc/chunk/0", 1.0),
+        ("POST", "/register", 0.1),
+    ],
+)
+def test_rate_for_route(sampler: TracesSampler, method: str, path: str, rate: float):
+    assert sampler(request(method, path)) == rate
+
+
+def test_parent_decision_is_kept(sampler: TracesSampler):
+    assert sampler({**request("GET", "/post"), "parent_sampled": True}) == 1.0
+
+
+def test_budget_scales_rate_down():
+    now = [0.0]
+    sampler = TracesSampler(1.0, {}, budget_per_second=10, clock=lambda: now[0])
+    for _ in range(100):
+        assert sampler(request("GET", "/post")) == 1.0
+    
+    now[0] = 1.0
+    assert sampler(request("GET", "/post")) == pytest.approx(0.1)
+    
+    now[0] = 2.0
+    assert sampler(request("GET", "/post")) == 1.0
+
+
+def test_sentry_disabled_without_dsn(mocker):
+    mocker.patch.object(tracing.config, "SENTRY_DSN", None)
+    init = mocker.patch("sentry_sdk.init")
+    
+    tracing.init_sentry()
+    
+    init.assert_not_called()
@@ -0,0 +1,97 @@
+import logging
+import time
+from typing import Callable, Optional
+from storeapi.config import config
+
+logger = logging.getLogger(__name__)
+
+# Sentry tracing is sampled per route instead of tracing every request.
+# SENTRY_TRACES_SAMPLE_RULES maps "METHOD /path" or "/path" to a rate and
+# matches the path and anything below it; the most specific rule wins and
+# SENTRY_TRACES_SAMPLE_RATE applies to everything else. On top of that,
+# TracesSampler keeps the number of traces per second under
+# SENTRY_TRACES_PER_SECOND by scaling every rate down when traffic rises.
+# Errors are not affected: they are all reported unless SENTRY_ERROR_SAMPLE_RATE
+# says otherwise.
+
+
+class TracesSampler:
+    def __init__(
+        self,
+        default_rate: float,
+        rules: dict[str, float],
+        budget_per_second: Optional[float] = None,
+        window_seconds: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.default_rate = default_rate
+        self.rules = sorted(
+            (self.parse_rule(rule) + (rate,) for rule, rate in rules.items()),
+            key=lambda rule: (len(rule[1]), rule[0] is not None),
+            reverse=True,
+        )
+        self.budget_per_second = budget_per_second
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.factor = 1.0
+        self._window_start = clock()
+        self._window_traces = 0.0
+
+    @staticmethod
+    def parse_rule(rule: str) -> tuple[Optional[str], str]:
+        method, _, path = rule.strip().rpartition(" ")
+        return (method.upper() or None), path.rstrip("/") or "/"
+
+    def rate_for(self, method: str, path: str) -> float:
+        for rule_method, prefix, rate in self.rules:
+            if rule_method not in (None, method):
+                continue
+            if prefix == "/" or path == prefix or path.startswith(prefix + "/"):
+                return rate
+        return self.default_rate
+
+    def apply_budget(self, rate: float) -> float:
+        """Scale rate by how far the expected traces in the last window exceeded the budget."""
+        if self.budget_per_second is None:
+            return rate
+        now = self.clock()
+        elapsed = now - self._window_start
+        if elapsed >= self.window_seconds:
+            traces_per_second = self._window_traces / elapsed
+            self.factor = min(1.0, self.budget_per_second / traces_per_second) if traces_per_second else 1.0
+            self._window_start = now
+            self._window_traces = 0.0
+        self._window_traces += rate
+        return rate * self.factor
+
+    def __call__(self, sampling_context: dict) -> float:
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+        scope = sampling_context.get("asgi_scope") or {}
+        rate = self.rate_for(scope.get("method", ""), scope.get("path", ""))
+        return self.apply_budget(rate)
+
+
+def init_sentry() -> None:
+    if not config.SENTRY_DSN:
+        logger.debug("SENTRY_DSN is not set, Sentry is disabled")
+        return
+    # Imported here, as it takes a good part of the app's import time
+    import sentry_sdk
+
+    sentry_sdk.init(
+        dsn=config.SENTRY_DSN,
+        # Add data like request headers and IP for users,
+        # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
+        send_default_pii=True,
+        sample_rate=config.SENTRY_ERROR_SAMPLE_RATE,
+        traces_sampler=TracesSampler(
+            config.SENTRY_TRACES_SAMPLE_RATE,
+            config.SENTRY_TRACES_SAMPLE_RULES,
+            config.SENTRY_TRACES_PER_SECOND,
+        ),
+        # Profiles are only taken of sampled traces
+        profile_session_sample_rate=config.SENTRY_PROFILE_SESSION_SAMPLE_RATE,
+        profile_lifecycle="trace",
+    )
@@ -0,0 +1,195 @@
+import asyncio
+import datetime
+import logging
+import math
+import os
+import shutil
+import tempfile
+import uuid
+from typing import AsyncIterable, Optional
+import aiofiles
+import aiofiles.os
+from databases import Database
+from storeapi.config import config
+from storeapi.database import upload_session_table
+
+logger = logging.getLogger(__name__)
+
+# Chunks of a resumable upload are written to
+#   <UPLOAD_SESSION_DIR>/<session id>/<chunk index>
+# Each chunk is first written to a uniquely named temporary file and then
+# renamed into place, so re-sending or sending the same chunk concurrently is
+# safe and a half-written chunk is never seen as received.
+#
+# Writing a chunk and finalizing first touch the session's updated_at, and the
+# garbage collector only deletes a session whose row it can still delete as
+# abandoned, so it never removes a session that is being written or
+# finalized. Finalizing also creates a marker file in the session directory
+# that only one finalize can create, so two finalizes never run together.
+
+FINALIZING = ".finalizing"
+
+
+class ChunkTooLarge(Exception):
+    pass
+
+
+def session_root() -> str:
+    return config.UPLOAD_SESSION_DIR or os.path.join(tempfile.gettempdir(), "storeapi-uploads")
+
+
+def session_dir(session_id: str) -> str:
+    return os.path.join(session_root(), session_id)
+
+
+def chunk_path(session_id: str, index: int) -> str:
+    return os.path.join(session_dir(session_id), f"{index:08d}")
+
+
+def now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return math.ceil(size / chunk_size)
+
+
+def expected_chunk_size(session, index: int) -> int:
+    if index == chunk_count(session.size, session.chunk_size) - 1:
+        return session.size - session.chunk_size * index
+    return session.chunk_size
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+async def create_session_dir(session_id: str) -> None:
+    await aiofiles.os.makedirs(session_dir(session_id), exist_ok=True)
+
+
+async def touch_session(database: Database, session_id: str) -> bool:
+    """Mark a session as in use, so it is not collected. False if it is already gone."""
+    query = (
+        upload_session_table.update()
+        .where(upload_session_table.c.id == session_id)
+        .values(updated_at=now())
+        .returning(upload_session_table.c.id)
+    )
+    return await database.fetch_val(query) is not None
+
+
+async def write_chunk(session_id: str, index: int, data: AsyncIterable[bytes], max_size: int) -> tuple[int, str]:
+    """Write a chunk to a temporary file, returning its size and path for commit_chunk.
+
+    Raises ChunkTooLarge as soon as more than max_size bytes arrive.
+    """
+    path = chunk_path(session_id, index)
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    written = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            async for piece in data:
+                written += len(piece)
+                if written > max_size:
+                    raise ChunkTooLarge(f"Chunk {index} must be {max_size} bytes, got more")
+                await f.write(piece)
+    except BaseException:
+        await remove_chunk(temp_path)
+        raise
+    return written, temp_path
+
+
+async def commit_chunk(temp_path: str, session_id: str, index: int) -> None:
+    await aiofiles.os.replace(temp_path, chunk_path(session_id, index))
+
+
+async def remove_chunk(path: str) -> None:
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def missing_chunks(session) -> list[int]:
+    try:
+        names = set(await aiofiles.os.listdir(session_dir(session.id)))
+    except FileNotFoundError:
+        names = set()
+    return [index for index in range(chunk_count(session.size, session.chunk_size)) if f"{index:08d}" not in names]
+
+
+class ChunkReader:
+    """Read the chunks of a session back in order as one file-like stream."""
+
+    def __init__(self, session) -> None:
+        self.paths = [chunk_path(session.id, index) for index in range(chunk_count(session.size, session.chunk_size))]
+        self.content_type = session.content_type
+        self._file = None
+
+    async def read(self, size: int = -1) -> bytes:
+        while True:
+            if self._file is None:
+                if not self.paths:
+                    return b""
+                self._file = await aiofiles.open(self.paths.pop(0), "rb")
+            data = await self._file.read(size)
+            if data:
+                return data
+            await self._file.close()
+            self._file = None
+
+    async def close(self) -> None:
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+
+
+async def claim_finalize(session_id: str) -> bool:
+    """Create the session's finalize marker, False if another finalize already did."""
+    try:
+        async with aiofiles.open(os.path.join(session_dir(session_id), FINALIZING), "x"):
+            pass
+    except (FileExistsError, FileNotFoundError):
+        return False
+    return True
+
+
+async def release_finalize(session_id: str) -> None:
+    await remove_chunk(os.path.join(session_dir(session_id), FINALIZING))
+
+
+async def delete_session(database: Database, session_id: str) -> None:
+    await asyncio.to_thread(shutil.rmtree, session_dir(session_id), True)
+    await database.execute(upload_session_table.delete().where(upload_session_table.c.id == session_id))
+
+
+async def collect_abandoned_sessions(database: Database, ttl_seconds: Optional[int] = None) -> list[str]:
+    """Delete sessions, and their chunks, that have not received a chunk within the TTL."""
+    ttl_seconds = config.UPLOAD_SESSION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    cutoff = now() - datetime.timedelta(seconds=ttl_seconds)
+    query = upload_session_table.select().where(upload_session_table.c.updated_at < cutoff)
+    abandoned = []
+    for session in await database.fetch_all(query):
+        # Only if it was not touched since, by a chunk being written or a finalize
+        claim = (
+            upload_session_table.delete()
+            .where(upload_session_table.c.id == session.id, upload_session_table.c.updated_at < cutoff)
+            .returning(upload_session_table.c.id)
+        )
+        if await database.fetch_val(claim) is None:
+            continue
+        await asyncio.to_thread(shutil.rmtree, session_dir(session.id), True)
+        abandoned.append(session.id)
+    if abandoned:
+        logger.info(f"Removed {len(abandoned)} abandoned upload sessions")
+    return abandoned
+
+
+async def collect_abandoned_sessions_forever(database: Database) -> None:
+    while True:
+        await asyncio.sleep(config.UPLOAD_SESSION_GC_INTERVAL_SECONDS)
+        try:
+            await collect_abandoned_sessions(database)
+        except Exception:
+            logger.exception("Failed to collect abandoned upload sessions")